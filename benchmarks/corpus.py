@@ -0,0 +1,71 @@
+import os
+import random
+from typing import Callable, Dict, List
+
+WORDS = ("index", "query", "server", "document", "chunk", "token", "score", "batch", "cache", "request",
+         "response", "model", "encode", "search", "metadata", "language", "path", "hash", "worker", "stream")
+
+QUERIES = [
+    "How is the index built from a repository?",
+    "Where are requests to the server batched?",
+    "What does the cache do when the index changes?",
+    "How are documents split into chunks?",
+    "Which function encodes the query tokens?",
+    "How is the response streamed to the client?",
+    "Where is the metadata hash computed?",
+    "What happens when a worker fails?",
+]
+
+def _name(rng: random.Random) -> str:
+    return "_".join(rng.sample(WORDS, 2))
+
+def _python(rng: random.Random) -> str:
+    name, arg = _name(rng), rng.choice(WORDS)
+    return (f"def {name}({arg}, k=10):\n"
+            f"    \"\"\"Return the {rng.choice(WORDS)} for a {rng.choice(WORDS)}.\"\"\"\n"
+            f"    result = [{arg} for _ in range(k)]\n"
+            f"    return result\n\n")
+
+def _javascript(rng: random.Random) -> str:
+    name, arg = _name(rng), rng.choice(WORDS)
+    return (f"function {name}({arg}) {{\n"
+            f"  // update the {rng.choice(WORDS)} {rng.choice(WORDS)}\n"
+            f"  return {arg}.map((x) => x.{rng.choice(WORDS)});\n"
+            f"}}\n\n")
+
+def _go(rng: random.Random) -> str:
+    name, arg = _name(rng).title().replace("_", ""), rng.choice(WORDS)
+    return (f"func {name}({arg} string) int {{\n"
+            f"\t// {rng.choice(WORDS)} {rng.choice(WORDS)}\n"
+            f"\treturn len({arg})\n"
+            f"}}\n\n")
+
+def _markdown(rng: random.Random) -> str:
+    return f"## {_name(rng)}\n\nThe {rng.choice(WORDS)} sends each {rng.choice(WORDS)} to the {rng.choice(WORDS)}.\n\n"
+
+GENERATORS: Dict[str, Callable[[random.Random], str]] = {
+    ".py": _python,
+    ".js": _javascript,
+    ".go": _go,
+    ".md": _markdown,
+}
+
+def generate_corpus(root_dir: str, num_files: int = 500, file_size: int = 4096, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    paths = []
+    extensions = list(GENERATORS)
+    for i in range(num_files):
+        extension = extensions[i % len(extensions)]
+        directory = os.path.join(root_dir, f"pkg_{i % 20}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{_name(rng)}_{i}{extension}")
+        content = []
+        size = 0
+        while size < file_size:
+            block = GENERATORS[extension](rng)
+            content.append(block)
+            size += len(block)
+        with open(path, "w") as f:
+            f.write("".join(content))
+        paths.append(path)
+    return paths
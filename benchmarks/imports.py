@@ -0,0 +1,83 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+# What a client, a server of one transport, the indexer and the CLI entry points import
+TARGETS = {
+    "package": "colbert_rag",
+    "proto": "colbert_rag.proto",
+    "models": "colbert_rag.models",
+    "collections": "colbert_rag.data.git_repo",
+    "grpc_server": "colbert_rag.server.grpc",
+    "fastapi_server": "colbert_rag.server.fastapi",
+    "indexer": "colbert_rag.indexer.git_repo",
+    "server_help": "scripts.server:run",
+    "create_index_help": "scripts.index:create",
+}
+HEAVY_MODULES = ["torch", "ragatouille", "colbert", "grpc", "fastapi", "uvicorn", "git", "pygments",
+                 "langchain_text_splitters"]
+
+def measure(target: str) -> Dict[str, Any]:
+    # Runs in a fresh process for each target, so nothing is already imported
+    module_name, _, function = target.partition(":")
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    if function:
+        # An entry point run with --help, which exits once the arguments are parsed
+        sys.argv = [module_name, "--help"]
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):
+            getattr(module, function)()
+    return {
+        "import_seconds": time.perf_counter() - start,
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+
+def run_benchmark(targets: List[str], repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for name in targets:
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.imports", "--child", TARGETS[name]],
+                check=True, capture_output=True, text=True).stdout
+            process_seconds = time.perf_counter() - start
+            runs.append({**json.loads(output.strip().splitlines()[-1]), "process_seconds": process_seconds})
+        results.append({
+            "target": name,
+            "module": TARGETS[name],
+            "import_ms": statistics.median(run["import_seconds"] for run in runs) * 1000,
+            "process_ms": statistics.median(run["process_seconds"] for run in runs) * 1000,
+            "heavy_modules": runs[0]["heavy_modules"],
+        })
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import time of the package, its entry points and what they load")
+    parser.add_argument("--targets", type=str, nargs="+", choices=list(TARGETS), default=list(TARGETS), help="Imports to measure")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per target, the median is reported")
+    parser.add_argument("--output", type=str, help="Write the results as JSON to this file")
+    parser.add_argument("--child", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child)))
+        return
+
+    results = run_benchmark(args.targets, args.repeat)
+    for row in results:
+        print(f"{row['target']:>17}: import {row['import_ms']:7.1f} ms, process {row['process_ms']:7.1f} ms, "
+              f"loads {', '.join(row['heavy_modules']) or 'nothing heavy'}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "imports", "repeat": args.repeat, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
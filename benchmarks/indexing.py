@@ -0,0 +1,73 @@
+import argparse
+import json
+import logging
+import resource
+import tempfile
+import time
+from typing import Any, Dict
+from benchmarks.corpus import generate_corpus
+from colbert_rag.config import COLBERTRAG_CHUNK_SIZE
+from colbert_rag.data.git_repo import get_directory_collections
+from colbert_rag.indexer.chunking import chunk_collections
+from colbert_rag.indexer.git_repo import index_collections, indexed_languages
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_benchmark(
+        model_name: str,
+        index_name: str,
+        num_files: int,
+        file_size: int,
+        chunk_size: int = COLBERTRAG_CHUNK_SIZE
+) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as corpus_dir:
+        generate_corpus(corpus_dir, num_files, file_size)
+
+        start = time.perf_counter()
+        collections = get_directory_collections(corpus_dir)
+        collect_seconds = time.perf_counter() - start
+
+        num_bytes = sum(len(doc) for docs, _, _ in collections.values() for doc in docs)
+        chunks = sum(len(c) for c in chunk_collections(collections, chunk_size, indexed_languages(collections)).values())
+
+        start = time.perf_counter()
+        path = index_collections(model_name, index_name, collections, max_document_length=chunk_size)
+        index_seconds = time.perf_counter() - start
+
+    total_seconds = collect_seconds + index_seconds
+    return {
+        "index_path": path,
+        "files": num_files,
+        "bytes": num_bytes,
+        "chunks": chunks,
+        "chunk_size": chunk_size,
+        "collect_seconds": collect_seconds,
+        "index_seconds": index_seconds,
+        "files_per_second": num_files / total_seconds,
+        "chunks_per_second": chunks / total_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Indexing throughput on a synthetic local corpus")
+    parser.add_argument("--model_name", type=str, default="colbert-ir/colbertv2.0", help="ColBERT checkpoint")
+    parser.add_argument("--index_name", type=str, default="colbertrag-benchmark", help="Name of the index to build")
+    parser.add_argument("--num_files", type=int, default=500, help="Files in the synthetic corpus")
+    parser.add_argument("--file_size", type=int, default=4096, help="Approximate characters per file")
+    parser.add_argument("--chunk_size", type=int, default=COLBERTRAG_CHUNK_SIZE, help="Chunk size for splitting")
+    parser.add_argument("--output", type=str, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level="INFO")
+
+    result = run_benchmark(args.model_name, args.index_name, args.num_files, args.file_size, args.chunk_size)
+    print(f"{result['files']} files, {result['chunks']} chunks in {result['collect_seconds'] + result['index_seconds']:.1f}s: "
+          f"{result['files_per_second']:.1f} files/s, {result['chunks_per_second']:.1f} chunks/s, "
+          f"peak RSS {result['peak_rss_mb']:.0f} MB")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "indexing", "results": [result]}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from benchmarks.corpus import QUERIES
+from colbert_rag.config import COLBERTRAG_FASTAPI_PORT, COLBERTRAG_GRPC_PORT
+from examples.client import FastAPIClient, GRPCClient
+
+def rss_mb(pid: int) -> float:
+    # Resident memory of the server process and its direct children (uvicorn workers), Linux only
+    pids = [pid] + [int(p) for p in os.listdir("/proc") if p.isdigit() and _parent(int(p)) == pid]
+    total_kb = 0
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            continue
+    return total_kb / 1024
+
+def _parent(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return int(f.read().rsplit(")", 1)[1].split()[1])
+    except (OSError, IndexError, ValueError):
+        return -1
+
+def payload_bytes(response: Any) -> int:
+    # A gRPC Response message or a FastAPI JSON body
+    return len(response) if isinstance(response, bytes) else response.ByteSize()
+
+def _ms(value: Optional[float]) -> str:
+    # None when every request of the run failed
+    return f"{value:.1f}ms" if value is not None else "n/a"
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+def run_load(client: Any, k: int, concurrency: int, num_requests: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    payloads: List[int] = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(num_requests))
+
+    def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                size = payload_bytes(client.retrieve(QUERIES[i % len(QUERIES)], k))
+            except Exception:
+                with lock:
+                    errors += 1
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                payloads.append(size)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    duration = time.perf_counter() - start
+
+    return {
+        "k": k,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "qps": len(latencies) / duration,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "payload_bytes_avg": statistics.mean(payloads) if payloads else None,
+    }
+
+def start_server(server_type: str, index: str, host: str, port: int, max_workers: int, extra_args: List[str]) -> subprocess.Popen:
+    cmd = [sys.executable, "-c", "from scripts.server import run; run()",
+           "--type", server_type, "--index", index, "--host", host, "--port", str(port),
+           "--max_workers", str(max_workers)] + extra_args
+    return subprocess.Popen(cmd)
+
+def run_benchmark(
+        index: str,
+        server_types: List[str],
+        ks: List[int],
+        max_workers_values: List[int],
+        concurrency: int,
+        num_requests: int,
+        host: str = "127.0.0.1",
+        startup_timeout: float = 600,
+        extra_args: List[str] = []
+) -> List[Dict[str, Any]]:
+    results = []
+    for server_type in server_types:
+        port = COLBERTRAG_GRPC_PORT if server_type == "grpc" else COLBERTRAG_FASTAPI_PORT
+        for max_workers in max_workers_values:
+            process = start_server(server_type, index, host, port, max_workers, extra_args)
+            client = GRPCClient(host, port) if server_type == "grpc" else FastAPIClient(host, port)
+            try:
+                client.wait_ready(startup_timeout)
+                # The searcher is loaded lazily on the first query
+                client.retrieve(QUERIES[0], 1)
+                for k in ks:
+                    row = run_load(client, k, concurrency, num_requests)
+                    row.update(server=server_type, max_workers=max_workers, server_rss_mb=rss_mb(process.pid))
+                    results.append(row)
+                    print(f"{server_type:>7} workers={max_workers:<3} k={k:<4} qps={row['qps']:8.1f} "
+                          f"p50={_ms(row['p50_ms'])} p95={_ms(row['p95_ms'])} p99={_ms(row['p99_ms'])} "
+                          f"rss={row['server_rss_mb']:.0f}MB errors={row['errors']}")
+            finally:
+                client.close()
+                process.terminate()
+                process.wait()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent load generator for the gRPC and FastAPI servers")
+    parser.add_argument("--index", type=str, default="colbertrag-benchmark", help="Index name under RAGATOUILLE_PATH")
+    parser.add_argument("--type", type=str, nargs="+", choices=["grpc", "fastapi"], default=["grpc", "fastapi"], help="Servers to benchmark")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 10, 50], help="k values to request")
+    parser.add_argument("--max_workers", type=int, nargs="+", default=[1, 10], help="Server max_workers settings")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per k value")
+    parser.add_argument("--output", type=str, help="Write the results as JSON to this file")
+    args, extra_args = parser.parse_known_args()
+
+    results = run_benchmark(args.index, args.type, args.k, args.max_workers, args.concurrency, args.requests,
+                            extra_args=extra_args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "load", "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import json
+import random
+import string
+import timeit
+from typing import Any, Dict, List
+from colbert_rag.proto import colbertrag_pb2
+from colbert_rag.server.base import BaseServer
+from colbert_rag.server.grpc import to_proto_response
+
+def synthetic_hits(k: int, content_size: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "content": "".join(random.choices(string.printable, k=content_size)),
+            "score": 30.0 - i / k,
+            "rank": i + 1,
+            "document_id": f"src/module_{i % 50}.py",
+            "passage_id": i,
+            "document_metadata": {
+                "filename": f"module_{i % 50}.py",
+                "path": f"src/module_{i % 50}.py",
+                "language": "PYTHON",
+                "md5_hash": f"{i % 50:032x}",
+                "extension": ".py",
+            },
+        }
+        for i in range(k)
+    ]
+
+def pydantic_response(hits: List[Dict[str, Any]]) -> bytes:
+    # The gRPC path before direct conversion: search hits -> pydantic Response -> protobuf Response
+    response = BaseServer.to_response(hits)
+    return colbertrag_pb2.Response(
+        documents=[
+            colbertrag_pb2.Document(page_content=doc.page_content, metadata=doc.metadata)
+            for doc in response.documents
+        ]
+    ).SerializeToString()
+
+def direct_response(hits: List[Dict[str, Any]]) -> bytes:
+    return to_proto_response(hits).SerializeToString()
+
+def run_benchmark(ks: List[int], content_size: int, repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for k in ks:
+        hits = synthetic_hits(k, content_size)
+        # Map entries may serialize in a different order, so compare the decoded messages
+        assert colbertrag_pb2.Response.FromString(pydantic_response(hits)) == \
+            colbertrag_pb2.Response.FromString(direct_response(hits))
+        row: Dict[str, Any] = {"k": k, "content_size": content_size}
+        for name, fn in [("pydantic", pydantic_response), ("direct", direct_response)]:
+            seconds = min(timeit.repeat(lambda: fn(hits), number=repeat, repeat=5)) / repeat
+            row[f"{name}_us_per_doc"] = seconds / k * 1e6
+        row["speedup"] = row["pydantic_us_per_doc"] / row["direct_us_per_doc"]
+        results.append(row)
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="gRPC response serialization cost per document")
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 50, 200, 1000], help="Result sizes to measure")
+    parser.add_argument("--content_size", type=int, default=1024, help="Characters of page content per document")
+    parser.add_argument("--repeat", type=int, default=20, help="Responses built per timing run")
+    parser.add_argument("--output", type=str, help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.k, args.content_size, args.repeat)
+    for row in results:
+        print(f"k={row['k']:>5}  pydantic {row['pydantic_us_per_doc']:8.2f} us/doc  "
+              f"direct {row['direct_us_per_doc']:8.2f} us/doc  speedup {row['speedup']:.2f}x")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "serialization", "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
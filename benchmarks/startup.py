@@ -0,0 +1,85 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+from benchmarks.corpus import QUERIES
+from colbert_rag.config import RAGATOUILLE_PATH
+
+def memory_mb() -> Dict[str, float]:
+    # Rss counts every resident page, Pss splits shared pages between the processes mapping them
+    # and Private_* are the pages no other process can share; Linux only
+    fields = {"Rss": "rss_mb", "Pss": "pss_mb", "Private_Clean": "private_mb", "Private_Dirty": "private_mb",
+              "Shared_Clean": "shared_mb", "Shared_Dirty": "shared_mb"}
+    result = {name: 0.0 for name in fields.values()}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in fields:
+                result[fields[key]] += int(value.split()[0]) / 1024
+    return result
+
+# eager is ragatouille's own RAGPretrainedModel.from_index, store the document store with the codes and residuals
+# loaded into memory, mmap the document store with memory-mapped codes and residuals
+MODES = {"eager": dict(document_store=False), "store": dict(), "mmap": dict(mmap=True)}
+
+def measure(index_path: str, mode: str) -> Dict[str, Any]:
+    # Runs in a fresh process for each mode, so nothing is already loaded
+    start = time.perf_counter()
+    from colbert_rag.server.loader import load_model
+    import_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    RAG = load_model(index_path, **MODES[mode])
+    load_seconds = time.perf_counter() - start
+    after_load = memory_mb()
+
+    start = time.perf_counter()
+    RAG.search(QUERIES[0], k=10)
+    first_query_seconds = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "import_seconds": import_seconds,
+        "load_seconds": load_seconds,
+        "first_query_seconds": first_query_seconds,
+        "startup_seconds": load_seconds + first_query_seconds,
+        **after_load,
+        "rss_after_query_mb": memory_mb()["rss_mb"],
+    }
+
+def run_benchmark(index: str, modes: List[str]) -> List[Dict[str, Any]]:
+    index_path = os.path.join(RAGATOUILLE_PATH, index)
+    results = []
+    for mode in modes:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", index_path, "--modes", mode],
+            check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Server index load time and memory for each way of loading it")
+    parser.add_argument("--index", type=str, default="colbertrag-benchmark", help="Index name under RAGATOUILLE_PATH")
+    parser.add_argument("--modes", type=str, nargs="+", choices=list(MODES), default=list(MODES), help="Loading modes to compare")
+    parser.add_argument("--output", type=str, help="Write the results as JSON to this file")
+    parser.add_argument("--child", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.modes[0])))
+        return
+
+    results = run_benchmark(args.index, args.modes)
+    for row in results:
+        print(f"{row['mode']:>5}: load {row['load_seconds']:.2f}s, first query {row['first_query_seconds']:.2f}s, "
+              f"RSS {row['rss_mb']:.0f} MB (private {row['private_mb']:.0f} MB, shared {row['shared_mb']:.0f} MB, "
+              f"PSS {row['pss_mb']:.0f} MB)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"benchmark": "startup", "index": args.index, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
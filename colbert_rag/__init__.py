@@ -1,13 +1,45 @@
-from .data.git_repo import get_collections
-from .indexer.git_repo import index_git_repo
-from .server.grpc import GRPCServer
-from .server.fastapi import FastAPIServer
-from .models import Request, Response, Document
+import importlib
+from typing import TYPE_CHECKING, Any, List
+
+if TYPE_CHECKING:
+    from .data.git_repo import get_collections, iter_collections
+    from .indexer.git_repo import index_git_repo
+    from .server.grpc import GRPCServer
+    from .server.fastapi import FastAPIServer
+    from .models import Request, Response, Document, BatchRequest, BatchResponse
+
+# Exports are imported on first use, so a client importing colbert_rag.proto or colbert_rag.models does not load
+# torch, grpc, fastapi or git, and a server only loads the transport it runs
+_EXPORTS = {
+    'get_collections': '.data.git_repo',
+    'iter_collections': '.data.git_repo',
+    'index_git_repo': '.indexer.git_repo',
+    'GRPCServer': '.server.grpc',
+    'FastAPIServer': '.server.fastapi',
+    'Request': '.models',
+    'Response': '.models',
+    'Document': '.models',
+    'BatchRequest': '.models',
+    'BatchResponse': '.models',
+}
 
 __all__ = ['get_collections',
-           'index_git_repo', 
-           'GRPCServer', 
-           'FastAPIServer', 
-           'Request', 
-           'Response', 
-           'Document']
+           'iter_collections',
+           'index_git_repo',
+           'GRPCServer',
+           'FastAPIServer',
+           'Request',
+           'Response',
+           'Document',
+           'BatchRequest',
+           'BatchResponse']
+
+def __getattr__(name: str) -> Any:
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
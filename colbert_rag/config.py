@@ -3,6 +3,14 @@ import os
 RAGATOUILLE_PATH = os.environ.get('RAGATOUILLE_PATH', '.ragatouille/colbert/indexes')
 COLBERTRAG_CHUNK_SIZE = 256
 COLBERTRAG_MAX_WORKERS = 10
+COLBERTRAG_MAX_QUEUE = 100
+COLBERTRAG_MAX_BATCH_SIZE = 0
+COLBERTRAG_BATCH_WAIT_MS = 5.0
+COLBERTRAG_CACHE_SIZE = 0
+COLBERTRAG_CACHE_TTL = None
+COLBERTRAG_QUERY_CACHE_SIZE = 0
 COLBERTRAG_GRPC_PORT = 50051
 COLBERTRAG_FASTAPI_PORT = 8000
 COLBERTRAG_HOST = '0.0.0.0'
+COLBERTRAG_SHARD_BASE_PORT = 50100
+COLBERTRAG_SHARD_START_TIMEOUT = 600.0
@@ -0,0 +1,118 @@
+import fnmatch
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Bytes from the start of a file used for the content checks, read before the rest of the file
+FILTER_SNIFF_BYTES = 16384
+
+# Skip reasons, also the values of the reason label of FILES_SKIPPED
+BINARY = "binary"
+SIZE = "size"
+GENERATED = "generated"
+VENDORED = "vendored"
+MINIFIED = "minified"
+LINE_LENGTH = "line_length"
+ENTROPY = "entropy"
+# Not a filter, files that raised while being read or detected
+ERROR = "error"
+
+# Files that are always generated, after GitHub linguist's generated.rb
+GENERATED_PATTERNS = [
+    "*.min.js", "*.min.css", "*.js.map", "*.css.map", "*-min.js",
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock", "Cargo.lock",
+    "composer.lock", "Gemfile.lock", "go.sum", "*.pb.go", "*_pb2.py", "*_pb2_grpc.py", "*.pb.cc", "*.pb.h",
+]
+# Third-party code checked into the repository, after linguist's vendor.yml
+VENDORED_PATTERNS = ["node_modules/*", "*/node_modules/*", "vendor/*", "third_party/*", "third-party/*", "bower_components/*"]
+GENERATED_MARKERS = re.compile(
+    rb"(code generated .* do not edit|@generated|generated by the protocol buffer compiler|"
+    rb"auto-?generated (?:file|by|code)|automatically generated|this file was generated|do not edit this file)",
+    re.IGNORECASE)
+# Only the first lines are searched for generated markers, so code that merely mentions them is kept
+GENERATED_MARKER_LINES = 5
+
+GitAttributes = List[Tuple[str, Dict[str, bool]]]
+
+def parse_gitattributes(text: str) -> GitAttributes:
+    # linguist-generated / linguist-vendored set (true), unset (-attr or =false) per pattern, later lines win
+    rules: GitAttributes = []
+    for line in text.splitlines():
+        parts = line.split()
+        if not parts or parts[0].startswith("#"):
+            continue
+        flags: Dict[str, bool] = {}
+        for attribute in parts[1:]:
+            name, _, value = attribute.lstrip("-!").partition("=")
+            if name in ("linguist-generated", "linguist-vendored"):
+                flags[name] = not attribute.startswith(("-", "!")) and value.lower() not in ("false", "0")
+        if flags:
+            rules.append((parts[0], flags))
+    return rules
+
+def _attribute_matches(pattern: str, path: str) -> bool:
+    # Patterns without a slash match the file name at any depth, the others the path from the root
+    if "/" not in pattern.rstrip("/"):
+        return fnmatch.fnmatchcase(os.path.basename(path), pattern) or any(
+            fnmatch.fnmatchcase(part, pattern.rstrip("/")) for part in path.split("/")[:-1])
+    pattern = pattern.lstrip("/").replace("**/", "*")
+    return fnmatch.fnmatchcase(path, pattern) or fnmatch.fnmatchcase(path, pattern.rstrip("/") + "/*")
+
+def _attributes(rules: GitAttributes, path: str) -> Dict[str, bool]:
+    flags: Dict[str, bool] = {}
+    for pattern, rule_flags in rules:
+        if _attribute_matches(pattern, path):
+            flags.update(rule_flags)
+    return flags
+
+def entropy(data: bytes) -> float:
+    # Shannon entropy in bits per byte: source code is around 4.5-5, base64 close to 6, compressed data close to 8
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+@dataclass(frozen=True)
+class FileFilter:
+    # None disables a check
+    max_file_size: Optional[int] = 1_000_000
+    max_average_line_length: Optional[int] = 200
+    max_line_length: Optional[int] = 4000
+    max_entropy: Optional[float] = None
+    skip_generated: bool = True
+    skip_vendored: bool = True
+
+    def check_path(self, document_id: str, attributes: GitAttributes) -> Optional[str]:
+        # Checked before the file is opened
+        flags = _attributes(attributes, document_id)
+        name = os.path.basename(document_id)
+        if self.skip_generated and flags.get("linguist-generated",
+                                             any(fnmatch.fnmatchcase(name, p) for p in GENERATED_PATTERNS)):
+            return GENERATED
+        if self.skip_vendored and flags.get("linguist-vendored",
+                                            any(fnmatch.fnmatchcase(document_id, p) for p in VENDORED_PATTERNS)):
+            return VENDORED
+        return None
+
+    def check_size(self, size: int) -> Optional[str]:
+        if self.max_file_size is not None and size > self.max_file_size:
+            return SIZE
+        return None
+
+    def check_content(self, head: bytes) -> Optional[str]:
+        # Checked on the first FILTER_SNIFF_BYTES only, before the rest of the file is read
+        lines = head.split(b"\n")
+        if self.skip_generated and any(GENERATED_MARKERS.search(line) for line in lines[:GENERATED_MARKER_LINES]):
+            return GENERATED
+        # The last line may be cut off by the sample, unless the sample is the whole file
+        complete = lines[:-1] if len(lines) > 1 else lines
+        if self.max_line_length is not None and max(map(len, complete), default=0) > self.max_line_length:
+            return LINE_LENGTH
+        if self.max_average_line_length is not None and len(head) / len(lines) > self.max_average_line_length:
+            return MINIFIED
+        if self.max_entropy is not None and entropy(head) > self.max_entropy:
+            return ENTROPY
+        return None
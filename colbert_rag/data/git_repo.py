@@ -1,68 +1,377 @@
+import logging
 import os
 import tempfile
-from typing import Any, List, Tuple, Dict, Set
-from git import Repo, exc
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+import time
+from typing import Any, Collection, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from git import Commit, Repo, exc
+from git.objects.blob import Blob
 import hashlib
 from collections import defaultdict
-from pygments.lexers import guess_lexer_for_filename
-from pygments.util import ClassNotFound
-from langchain_text_splitters import Language
+from colbert_rag.data.filters import BINARY, ERROR, FILTER_SNIFF_BYTES, FileFilter, GitAttributes, parse_gitattributes
+from colbert_rag.data.language import BINARY_SNIFF_BYTES, detect_language, is_binary
+from colbert_rag.metrics import BYTES_READ, FILES_SKIPPED, FILES_WALKED, LEXER_SECONDS
+
+Collections = Dict[str, Tuple[List[str], List[str], List[Dict[str, str]]]]
+ProcessedFile = Tuple[str, str, str, Dict[str, str]]
+
+class FileStats(NamedTuple):
+    bytes_read: int
+    lexer_seconds: float
+    skipped: str = ""
+    error: str = ""
+
+ProcessResult = Tuple[ProcessedFile | None, FileStats]
+# Path on disk (or the document id for files read from git objects), document id and, for git objects, the content
+SourceFile = Tuple[str, str, Optional[bytes]]
+
+class CommitDiff(NamedTuple):
+    changed: List[str]
+    deleted: List[str]
+
+def _is_local(source: str) -> bool:
+    return os.path.isdir(source)
+
+def _remote_url(source: str) -> str:
+    # username/repo-name is a GitHub repository, anything else with a scheme (or git@host:) is cloned as is
+    if "://" in source or source.startswith("git@"):
+        return source
+    return f"https://github.com/{source}.git"
+
+def _open_repo(source: str) -> Repo | None:
+    try:
+        return Repo(source)
+    except (exc.InvalidGitRepositoryError, exc.NoSuchPathError):
+        return None
+
+@contextmanager
+def _open_source(source: str, revision: Optional[str] = None) -> Iterator[Tuple[Optional[str], Optional[Commit]]]:
+    # Yields the directory to walk, or the commit to read from git objects without a checkout.
+    # Local working trees are read as they are on disk (the files git lists), bare mirrors and explicit
+    # revisions are read from the object database, and only remote sources are cloned.
+    if _is_local(source):
+        repo = _open_repo(source)
+        if repo is None:
+            if revision is not None:
+                raise Exception(f"{source} is not a git repository, cannot read revision {revision}")
+            yield source, None
+        elif revision is not None or repo.bare:
+            yield None, repo.commit(revision or "HEAD")
+        else:
+            yield source, None
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        try:
+            if revision is None:
+                Repo.clone_from(_remote_url(source), temp_dir, depth=1, single_branch=True)
+            else:
+                # Any revision may be asked for, so fetch the full history but skip the checkout
+                Repo.clone_from(_remote_url(source), temp_dir, bare=True)
+        except exc.GitCommandError as e:
+            raise Exception(f"Failed to clone repository {source}: {str(e)}")
+        if revision is None:
+            yield temp_dir, None
+        else:
+            yield None, Repo(temp_dir).commit(revision)
+
+def resolve_commit(source: str, revision: Optional[str] = None) -> Optional[str]:
+    # The commit a local git source is read at, None when files come from a working tree or a remote
+    if not _is_local(source):
+        return None
+    repo = _open_repo(source)
+    if repo is None or (revision is None and not repo.bare):
+        return None
+    return repo.commit(revision or "HEAD").hexsha
+
+def diff_commits(source: str, old: str, new: str = "HEAD") -> CommitDiff:
+    # Compares the two trees in the object database, without reading or hashing any file
+    repo = _open_repo(source)
+    if repo is None:
+        raise Exception(f"{source} is not a local git repository")
+    fields = repo.git.diff("--name-status", "--no-renames", "-z", old, new).split("\0")
+    diff = CommitDiff([], [])
+    for status, path in zip(fields[0::2], fields[1::2]):
+        (diff.deleted if status == "D" else diff.changed).append(path)
+    return diff
+
+def _walk(root_dir: str, ext_blacklist: Set[str], dir_blacklist: Set[str]) -> Iterator[Tuple[str, str]]:
+    repo = _open_repo(root_dir)
+    if repo is not None and not repo.bare:
+        # A git working tree is listed by git: tracked and untracked files, without the ignored ones
+        listed: List[str] = repo.git.ls_files("--cached", "--others", "--exclude-standard", "-z").split("\0")
+        for path in sorted(set(filter(None, listed))):
+            file_path = os.path.join(root_dir, path)
+            # Files deleted from the working tree are still listed, and submodules are listed as directories
+            if _blacklisted(path, ext_blacklist, dir_blacklist) or os.path.islink(file_path) \
+                    or not os.path.isfile(file_path):
+                continue
+            yield file_path, os.path.normpath(path)
+        return
+
+    for root, dirs, files in os.walk(root_dir, topdown=True):
+        if root == root_dir:
+            dirs[:] = [d for d in dirs if d not in dir_blacklist]
+
+        for file in files:
+            _, file_extension = os.path.splitext(file)
+            if file_extension.lower() in ext_blacklist:
+                continue
+            file_path = os.path.join(root, file)
+            # Symlinks are skipped like in git objects, their targets are indexed under their own path
+            if os.path.islink(file_path):
+                continue
+            yield file_path, os.path.relpath(file_path, root_dir)
+
+def _blacklisted(document_id: str, ext_blacklist: Set[str], dir_blacklist: Set[str]) -> bool:
+    top_level, _, rest = document_id.partition("/")
+    return bool(rest and top_level in dir_blacklist) or os.path.splitext(document_id)[1].lower() in ext_blacklist
+
+def _walk_commit(commit: Commit, ext_blacklist: Set[str], dir_blacklist: Set[str]) -> Iterator[Blob]:
+    def top_level_blacklisted(item: Any, depth: int) -> bool:
+        return item.type == "tree" and "/" not in item.path and item.name in dir_blacklist
+
+    for item in commit.tree.traverse(predicate=lambda item, depth: isinstance(item, Blob), prune=top_level_blacklisted):
+        assert isinstance(item, Blob)
+        _, file_extension = os.path.splitext(item.name)
+        # Symlinks are stored as blobs holding the link target
+        if item.mode == Blob.link_mode or file_extension.lower() in ext_blacklist:
+            continue
+        yield item
+
+def _commit_paths(commit: Commit, paths: Collection[str]) -> Iterator[Blob]:
+    for path in sorted(paths):
+        try:
+            item = commit.tree / path
+        except KeyError:
+            continue
+        if item.type == "blob" and item.mode != Blob.link_mode:
+            yield item
+
+def _gitattributes(root_dir: Optional[str], commit: Optional[Commit]) -> GitAttributes:
+    # Only the top-level .gitattributes is read
+    try:
+        if commit is not None:
+            return parse_gitattributes((commit.tree / ".gitattributes").data_stream.read().decode("utf-8", errors="replace"))
+        if root_dir is not None:
+            with open(os.path.join(root_dir, ".gitattributes"), encoding="utf-8", errors="replace") as f:
+                return parse_gitattributes(f.read())
+    except (KeyError, OSError):
+        pass
+    return []
+
+def _skip(file_filter: Optional[FileFilter], attributes: GitAttributes, document_id: str, size: int) -> bool:
+    # Path and size checks, made from the tree entry or a stat before the file is read
+    if file_filter is None:
+        return False
+    reason = file_filter.check_path(document_id, attributes) or file_filter.check_size(size)
+    if reason:
+        logging.debug(f"Skipping {document_id}: {reason}")
+        FILES_SKIPPED.inc(reason=reason)
+    return bool(reason)
+
+def _source_files(
+        root_dir: Optional[str],
+        commit: Optional[Commit],
+        ext_blacklist: Set[str],
+        dir_blacklist: Set[str],
+        paths: Optional[Collection[str]] = None,
+        file_filter: Optional[FileFilter] = None,
+        exclude: Collection[str] = ()
+) -> Iterator[SourceFile]:
+    # With paths, only those document ids are read (e.g. the files changed between two commits).
+    # Excluded document ids are not read at all (e.g. the files a resumed build already collected).
+    if paths is not None:
+        paths = [path for path in paths if not _blacklisted(path, ext_blacklist, dir_blacklist)]
+    attributes = _gitattributes(root_dir, commit) if file_filter is not None else []
+    if commit is not None:
+        if paths is None:
+            blobs: Iterator[Blob] = _walk_commit(commit, ext_blacklist, dir_blacklist)
+        else:
+            blobs = _commit_paths(commit, paths)
+        for blob in blobs:
+            document_id = str(blob.path)
+            if document_id not in exclude and not _skip(file_filter, attributes, document_id, blob.size):
+                yield document_id, document_id, blob.data_stream.read()
+    elif root_dir is not None:
+        if paths is None:
+            files = _walk(root_dir, ext_blacklist, dir_blacklist)
+        else:
+            files = ((os.path.join(root_dir, path), path) for path in sorted(paths)
+                     if os.path.isfile(os.path.join(root_dir, path)))
+        for file_path, document_id in files:
+            if document_id in exclude:
+                continue
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                # Left to _process_file, which quarantines files that cannot be read
+                size = 0
+            if not _skip(file_filter, attributes, document_id.replace(os.sep, "/"), size):
+                yield file_path, document_id, None
+
+def _process_file(
+        file_path: str,
+        document_id: str,
+        sample_ratio: float,
+        sample_min: int,
+        sample_max: int,
+        skip_binary: bool = True,
+        data: Optional[bytes] = None,
+        file_filter: Optional[FileFilter] = None
+) -> ProcessResult:
+    file = os.path.basename(file_path)
+    _, file_extension = os.path.splitext(file)
+    sniff_bytes = FILTER_SNIFF_BYTES if file_filter is not None else BINARY_SNIFF_BYTES
+
+    def check(head: bytes) -> str | None:
+        # Binary and content checks only look at the start of the file, the rest is read if they pass
+        if skip_binary and is_binary(head[:BINARY_SNIFF_BYTES]):
+            return BINARY
+        return file_filter.check_content(head) if file_filter is not None else None
+
+    try:
+        if data is not None:
+            head = data[:sniff_bytes]
+            if skipped := check(head):
+                return None, FileStats(len(head), 0.0, skipped)
+            content = data
+        else:
+            with open(file_path, 'rb') as f:
+                head = f.read(sniff_bytes)
+                if skipped := check(head):
+                    return None, FileStats(len(head), 0.0, skipped)
+                content = head + f.read()
+        document = content.decode('utf-8', errors='replace')
+
+        def read_sample() -> str:
+            sample_size = max(min(int(len(document) * sample_ratio / 100), sample_max), sample_min)
+            return document[:sample_size]
+
+        start = time.perf_counter()
+        language = detect_language(file_path, read_sample)
+        lexer_seconds = time.perf_counter() - start
+
+    except Exception as e:
+        # One unreadable file does not abort the collection, it is quarantined and reported by _collect
+        return None, FileStats(0, 0.0, ERROR, f"{type(e).__name__}: {e}")
+
+    document_metadata = {
+        "filename": file,
+        "path": document_id,
+        "language": language,
+        "md5_hash": hashlib.md5(content).hexdigest(),
+        "extension": file_extension,
+    }
+    return (language, document, document_id, document_metadata), FileStats(len(content), lexer_seconds)
+
+def _collect(processed: List[Tuple[str, ProcessResult]], quarantine: Optional[Dict[str, str]] = None) -> Collections:
+    # Metrics are recorded here, in the calling process, since files may be processed in a pool.
+    # Files that raised are logged and added to quarantine (document id to error).
+    collections: Collections = defaultdict(lambda: ([], [], []))
+    for document_id, (item, stats) in processed:
+        BYTES_READ.inc(stats.bytes_read)
+        LEXER_SECONDS.inc(stats.lexer_seconds)
+        if item is None:
+            FILES_SKIPPED.inc(reason=stats.skipped)
+            if stats.skipped == ERROR:
+                logging.warning(f"Quarantined {document_id}: {stats.error}")
+                if quarantine is not None:
+                    quarantine[document_id] = stats.error
+            if stats.skipped == BINARY:
+                FILES_WALKED.inc(language="BINARY")
+            continue
+        language, document, _, document_metadata = item
+        FILES_WALKED.inc(language=language)
+        documents, document_ids, document_metadatas = collections[language]
+        documents.append(document)
+        document_ids.append(document_id)
+        document_metadatas.append(document_metadata)
+    return dict(collections)
 
 def get_collections(
-        repo_name: str, 
-        ext_blacklist: Set[str] = set(), 
+        repo_name: str,
+        ext_blacklist: Set[str] = set(),
         dir_blacklist: Set[str] = set(),
         sample_ratio: float = 10,
         sample_min: int = 512,
-        sample_max: int = 2048
-) -> Dict[str, Tuple[List[str], List[Dict[str, str]], List[str]]]:
-    with tempfile.TemporaryDirectory() as temp_dir:
-        repo_url = f"https://github.com/{repo_name}.git"
-        try:
-            repo = Repo.clone_from(repo_url, temp_dir, depth=1, single_branch=True)
-        except exc.GitCommandError as e:
-            raise Exception(f"Failed to clone repository {repo_name}: {str(e)}")
-
-        collections: Dict[str, Tuple[List[str], List[Dict[str, str]], List[str]]] = defaultdict(lambda: ([], [], []))
-
-        for root, dirs, files in os.walk(temp_dir, topdown=True):
-            if root == temp_dir:
-                dirs[:] = [d for d in dirs if d not in dir_blacklist]
-                
-            for file in files:
-                file_path = os.path.join(root, file)
-                document_id = os.path.relpath(file_path, temp_dir)
-                _, file_extension = os.path.splitext(file)
-                if file_extension.lower() in ext_blacklist:
-                    continue
-
-                try:
-                    with open(file_path, 'rb') as f:
-                        content = f.read()
-                    document = content.decode('utf-8', errors='replace') 
-
-                    sample_size = max(min(int(len(document) * sample_ratio / 100), sample_max), sample_min)
-                    sample = document[:sample_size]
-                    lexer = guess_lexer_for_filename(file_path, sample)
-                    language = next((lang.name for lang in Language if lang.value in lexer.aliases), 'UNSUPPORTED')
-
-                except ClassNotFound:
-                    language = "UNKNOWN"
-
-                except Exception as e:
-                    raise Exception(f"Error processing file {file_path}: {str(e)}")
-                
-                document_metadata = {
-                    "filename": file,
-                    "path": document_id,
-                    "language": language,
-                    "md5_hash": hashlib.md5(content).hexdigest(),
-                    "extension": file_extension,
-                }
-
-                data = (document, document_id, document_metadata)
-                for i, item in enumerate(data):
-                    collections[language][i].append(item)
-
-        return dict(collections)
+        sample_max: int = 2048,
+        skip_binary: bool = True,
+        revision: Optional[str] = None,
+        paths: Optional[Collection[str]] = None,
+        file_filter: Optional[FileFilter] = None,
+        quarantine: Optional[Dict[str, str]] = None
+) -> Collections:
+    # repo_name is a GitHub username/repo-name, a clone URL, a local working tree or a bare mirror.
+    # file_filter leaves out oversized, generated, vendored and minified files, None (the default) keeps them all.
+    with _open_source(repo_name, revision) as (root_dir, commit):
+        return _collect([
+            (document_id, _process_file(
+                file_path, document_id, sample_ratio, sample_min, sample_max, skip_binary, data, file_filter))
+            for file_path, document_id, data
+            in _source_files(root_dir, commit, ext_blacklist, dir_blacklist, paths, file_filter)
+        ], quarantine)
+
+def get_directory_collections(
+        root_dir: str,
+        ext_blacklist: Set[str] = set(),
+        dir_blacklist: Set[str] = set(),
+        sample_ratio: float = 10,
+        sample_min: int = 512,
+        sample_max: int = 2048,
+        skip_binary: bool = True,
+        file_filter: Optional[FileFilter] = None
+) -> Collections:
+    return _collect([
+        (document_id, _process_file(
+            file_path, document_id, sample_ratio, sample_min, sample_max, skip_binary, data, file_filter))
+        for file_path, document_id, data
+        in _source_files(root_dir, None, ext_blacklist, dir_blacklist, file_filter=file_filter)
+    ])
+
+def iter_collections(
+        repo_name: str,
+        ext_blacklist: Set[str] = set(),
+        dir_blacklist: Set[str] = set(),
+        sample_ratio: float = 10,
+        sample_min: int = 512,
+        sample_max: int = 2048,
+        skip_binary: bool = True,
+        batch_size: int = 256,
+        max_workers: int | None = None,
+        max_pending: int | None = None,
+        revision: Optional[str] = None,
+        paths: Optional[Collection[str]] = None,
+        file_filter: Optional[FileFilter] = None,
+        quarantine: Optional[Dict[str, str]] = None,
+        exclude: Collection[str] = ()
+) -> Iterator[Collections]:
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or max_workers * 4
+    with _open_source(repo_name, revision) as (root_dir, commit), ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending: Dict[Future[Any], str] = {}
+        batch: List[Tuple[str, ProcessResult]] = []
+
+        def drain() -> Iterator[Collections]:
+            nonlocal pending, batch
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch.append((pending.pop(future), future.result()))
+                if len(batch) >= batch_size:
+                    yield _collect(batch, quarantine)
+                    batch = []
+
+        # Git objects are read here and sent to the workers with the task, files on disk are read by the workers
+        for file_path, document_id, data in _source_files(
+                root_dir, commit, ext_blacklist, dir_blacklist, paths, file_filter, exclude):
+            if len(pending) >= max_pending:
+                yield from drain()
+            pending[executor.submit(
+                _process_file, file_path, document_id, sample_ratio, sample_min, sample_max, skip_binary, data,
+                file_filter)] = document_id
 
+        while pending:
+            yield from drain()
+        if batch:
+            yield _collect(batch, quarantine)
@@ -0,0 +1,73 @@
+import fnmatch
+import os
+import re
+from functools import lru_cache
+from typing import Callable, Dict, NamedTuple, Set
+from pygments.lexers import get_all_lexers, guess_lexer_for_filename
+from pygments.util import ClassNotFound
+from langchain_text_splitters import Language
+
+AMBIGUOUS = "AMBIGUOUS"
+BINARY_SNIFF_BYTES = 8000
+
+class LanguageTable(NamedTuple):
+    extensions: Dict[str, str]
+    filenames: Dict[str, str]
+    patterns: re.Pattern
+
+def _lexer_language(aliases: tuple) -> str:
+    return next((lang.name for lang in Language if lang.value in aliases), 'UNSUPPORTED')
+
+def _register(table: Dict[str, Set[str]], key: str, language: str) -> None:
+    table.setdefault(key, set()).add(language)
+
+@lru_cache(maxsize=None)
+def language_table() -> LanguageTable:
+    extensions: Dict[str, Set[str]] = {}
+    filenames: Dict[str, Set[str]] = {}
+    patterns = []
+    for _, aliases, lexer_filenames, _ in get_all_lexers(plugins=False):
+        language = _lexer_language(aliases)
+        for pattern in lexer_filenames:
+            if re.fullmatch(r'\*\.[^*?\[\]]+', pattern):
+                _register(extensions, pattern[1:], language)
+            elif not any(c in pattern for c in '*?['):
+                _register(filenames, pattern, language)
+            else:
+                patterns.append(fnmatch.translate(pattern))
+
+    def resolve(table: Dict[str, Set[str]]) -> Dict[str, str]:
+        return {key: languages.pop() if len(languages) == 1 else AMBIGUOUS for key, languages in table.items()}
+
+    return LanguageTable(
+        extensions=resolve(extensions),
+        filenames=resolve(filenames),
+        patterns=re.compile('|'.join(patterns) or r'(?!)'))
+
+_guessed: Dict[str, str] = {}
+
+def _guess(file_path: str, sample: str) -> str:
+    try:
+        return _lexer_language(guess_lexer_for_filename(file_path, sample).aliases)
+    except ClassNotFound:
+        return "UNKNOWN"
+
+def detect_language(file_path: str, read_sample: Callable[[], str]) -> str:
+    table = language_table()
+    filename = os.path.basename(file_path)
+    _, extension = os.path.splitext(filename)
+
+    if table.patterns.match(filename):
+        key = filename
+    else:
+        language = table.filenames.get(filename) or table.extensions.get(extension, AMBIGUOUS)
+        if language != AMBIGUOUS:
+            return language
+        key = extension or filename
+
+    if key not in _guessed:
+        _guessed[key] = _guess(file_path, read_sample())
+    return _guessed[key]
+
+def is_binary(head: bytes) -> bool:
+    return b'\0' in head
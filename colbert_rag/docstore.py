@@ -0,0 +1,253 @@
+import fcntl
+import json
+import logging
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager, suppress
+from functools import cached_property
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, overload
+
+# Memory-mapped copy of ragatouille's collection.json, pid_docid_map.json and docid_metadata_map.json,
+# so a server can open an index in constant time and processes share the pages through the page cache.
+# Passages are one blob, metadata is one record per document made of codes into a table of interned
+# values, and strings are only decoded for the hits that are returned.
+STORE_DIRNAME = "colbertrag_store"
+STORE_VERSION = 2
+# Metadata values that are not strings are kept per document as JSON under this column
+EXTRA_COLUMN = ""
+SOURCE_FILES = ("collection.json", "pid_docid_map.json", "docid_metadata_map.json")
+# Held exclusively while the store is written and shared while it is opened, so workers starting together on a
+# stale store build it once and never open a half-written one
+LOCK_FILENAME = "colbertrag_store.lock"
+
+def _map(path: str) -> memoryview:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+def write_strings(prefix: str, strings: Iterable[str]) -> int:
+    # <prefix>.bin holds the UTF-8 strings back to back, <prefix>.idx their int64 start offsets plus the end.
+    # Files are replaced atomically; processes that still map the old ones keep reading them.
+    offsets = array("q", [0])
+    tmp = f".{os.getpid()}.tmp"
+    with open(f"{prefix}.bin{tmp}", "wb") as f:
+        for value in strings:
+            data = value.encode()
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    with open(f"{prefix}.idx{tmp}", "wb") as f:
+        offsets.tofile(f)
+    os.replace(f"{prefix}.bin{tmp}", f"{prefix}.bin")
+    os.replace(f"{prefix}.idx{tmp}", f"{prefix}.idx")
+    return len(offsets) - 1
+
+class StringTable(Sequence[str]):
+    def __init__(self, prefix: str):
+        self._data = _map(f"{prefix}.bin")
+        self._offsets = _map(f"{prefix}.idx").cast("q")
+
+    def __len__(self) -> int:
+        return max(len(self._offsets) - 1, 0)
+
+    @overload
+    def __getitem__(self, i: int) -> str: ...
+    @overload
+    def __getitem__(self, i: slice) -> List[str]: ...
+    def __getitem__(self, i: Any) -> Any:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self._data[self._offsets[i]:self._offsets[i + 1]]).decode()
+
+class PidDocidMap(Mapping[int, str]):
+    def __init__(self, document_ids: StringTable, pid_documents: memoryview):
+        self.document_ids = document_ids
+        self.pid_documents = pid_documents
+
+    def __getitem__(self, pid: int) -> str:
+        if not 0 <= pid < len(self.pid_documents):
+            raise KeyError(pid)
+        return self.document_ids[self.pid_documents[pid]]
+
+    def __len__(self) -> int:
+        return len(self.pid_documents)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self.pid_documents)))
+
+class DocidMetadataMap(Mapping[str, Dict[str, Any]]):
+    # Document ids are stored sorted, so a lookup is a binary search over the mapped table. Each metadata key
+    # is a column of int32 codes into the shared value table, -1 where a document does not have the key.
+    def __init__(self, document_ids: StringTable, value_table: StringTable, columns: Dict[str, memoryview]):
+        self.document_ids = document_ids
+        self.value_table = value_table
+        self.columns = columns
+
+    def position(self, document_id: str) -> int:
+        i = bisect_left(self.document_ids, document_id)
+        if i == len(self.document_ids) or self.document_ids[i] != document_id:
+            raise KeyError(document_id)
+        return i
+
+    def record(self, position: int) -> Dict[str, Any]:
+        metadata: Dict[str, Any] = {}
+        for key, codes in self.columns.items():
+            code = codes[position]
+            if code < 0:
+                continue
+            if key == EXTRA_COLUMN:
+                metadata.update(json.loads(self.value_table[code]))
+            else:
+                metadata[key] = self.value_table[code]
+        return metadata
+
+    def column(self, key: str) -> Optional[memoryview]:
+        return self.columns.get(key)
+
+    def _has_record(self, position: int) -> bool:
+        return any(codes[position] >= 0 for codes in self.columns.values())
+
+    def __getitem__(self, document_id: str) -> Dict[str, Any]:
+        position = self.position(document_id)
+        if not self._has_record(position):
+            raise KeyError(document_id)
+        return self.record(position)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __iter__(self) -> Iterator[str]:
+        return (doc_id for i, doc_id in enumerate(self.document_ids) if self._has_record(i))
+
+class DocumentStore:
+    def __init__(self, index_path: str):
+        store_path = os.path.join(index_path, STORE_DIRNAME)
+        with open(os.path.join(store_path, "store.json")) as f:
+            info = json.load(f)
+        self.passages = StringTable(os.path.join(store_path, "passages"))
+        self.document_ids = StringTable(os.path.join(store_path, "document_ids"))
+        self.pid_documents = _map(os.path.join(store_path, "pid_documents.bin")).cast("i")
+        self.pid_docid_map = PidDocidMap(self.document_ids, self.pid_documents)
+        self.docid_metadata_map: Optional[DocidMetadataMap] = None
+        if info["metadata"]:
+            columns = {key: _map(os.path.join(store_path, f"metadata_{i}.bin")).cast("i")
+                       for i, key in enumerate(info["columns"])}
+            values = StringTable(os.path.join(store_path, "metadata_values"))
+            self.docid_metadata_map = DocidMetadataMap(self.document_ids, values, columns)
+
+    @cached_property
+    def docid_pid_map(self) -> Dict[str, List[int]]:
+        # Only needed for document id filters and deletes, so built on first use rather than at startup
+        docid_pids: Dict[str, List[int]] = defaultdict(list)
+        for pid, position in enumerate(self.pid_documents):
+            docid_pids[self.document_ids[position]].append(pid)
+        return docid_pids
+
+def _source_signature(index_path: str) -> Dict[str, Optional[List[int]]]:
+    signature: Dict[str, Optional[List[int]]] = {}
+    for name in SOURCE_FILES:
+        path = os.path.join(index_path, name)
+        stat = os.stat(path) if os.path.exists(path) else None
+        signature[name] = [stat.st_size, stat.st_mtime_ns] if stat else None
+    return signature
+
+def store_is_current(index_path: str) -> bool:
+    try:
+        with open(os.path.join(index_path, STORE_DIRNAME, "store.json")) as f:
+            info: Dict[str, Any] = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return info.get("version") == STORE_VERSION and info.get("sources") == _source_signature(index_path)
+
+def _intern_metadata(document_ids: List[str], docid_metadata_map: Dict[str, Any]) -> Tuple[List[str], Dict[str, array]]:
+    # Every distinct value is stored once, e.g. a language or extension shared by thousands of files
+    values: Dict[str, int] = {}
+    columns: Dict[str, array] = {}
+
+    def intern(value: str) -> int:
+        return values.setdefault(value, len(values))
+
+    for position, doc_id in enumerate(document_ids):
+        metadata = docid_metadata_map.get(doc_id)
+        if not metadata:
+            continue
+        extra = {key: value for key, value in metadata.items() if not isinstance(value, str)}
+        record = {key: value for key, value in metadata.items() if isinstance(value, str)}
+        if extra:
+            record[EXTRA_COLUMN] = json.dumps(extra, sort_keys=True)
+        for key, value in record.items():
+            if key not in columns:
+                columns[key] = array("i", [-1]) * len(document_ids)
+            columns[key][position] = intern(value)
+    return list(values), columns
+
+def _write_array(path: str, values: array) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        values.tofile(f)
+    os.replace(tmp, path)
+
+@contextmanager
+def _store_lock(index_path: str, operation: int) -> Iterator[None]:
+    with open(os.path.join(index_path, LOCK_FILENAME), "a") as f:
+        fcntl.flock(f.fileno(), operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def build_document_store(index_path: str) -> None:
+    with _store_lock(index_path, fcntl.LOCK_EX):
+        _build_document_store(index_path)
+
+def _build_document_store(index_path: str) -> None:
+    with open(os.path.join(index_path, "collection.json")) as f:
+        collection: List[str] = json.load(f)
+    with open(os.path.join(index_path, "pid_docid_map.json")) as f:
+        pid_docid_map = {int(pid): doc_id for pid, doc_id in json.load(f).items()}
+    metadata_path = os.path.join(index_path, "docid_metadata_map.json")
+    docid_metadata_map: Dict[str, Any] = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            docid_metadata_map = json.load(f)
+
+    document_ids = sorted(set(pid_docid_map.values()) | set(docid_metadata_map))
+    positions = {doc_id: i for i, doc_id in enumerate(document_ids)}
+    pid_documents = array("i", (positions[pid_docid_map[pid]] for pid in range(len(collection))))
+
+    store_path = os.path.join(index_path, STORE_DIRNAME)
+    os.makedirs(store_path, exist_ok=True)
+    info_path = os.path.join(store_path, "store.json")
+    with suppress(FileNotFoundError):
+        os.remove(info_path)
+    write_strings(os.path.join(store_path, "passages"), collection)
+    write_strings(os.path.join(store_path, "document_ids"), document_ids)
+    _write_array(os.path.join(store_path, "pid_documents.bin"), pid_documents)
+    values, columns = _intern_metadata(document_ids, docid_metadata_map)
+    write_strings(os.path.join(store_path, "metadata_values"), values)
+    for i, codes in enumerate(columns.values()):
+        _write_array(os.path.join(store_path, f"metadata_{i}.bin"), codes)
+    # Written last, so an interrupted build is never mistaken for a current one
+    tmp = f"{info_path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": STORE_VERSION, "sources": _source_signature(index_path),
+                   "metadata": bool(columns), "columns": list(columns)}, f)
+    os.replace(tmp, info_path)
+    logging.info(f"Wrote document store for {len(collection)} passages and {len(document_ids)} documents "
+                 f"({len(values)} distinct metadata values) to {store_path}")
+
+def open_document_store(index_path: str) -> DocumentStore:
+    if not store_is_current(index_path):
+        with _store_lock(index_path, fcntl.LOCK_EX):
+            # Another process may have built it while this one waited for the lock
+            if not store_is_current(index_path):
+                _build_document_store(index_path)
+    with _store_lock(index_path, fcntl.LOCK_SH):
+        return DocumentStore(index_path)
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List
+
+# Where the content left out of an index by deduplication lives, kept next to the index. documents maps an
+# indexed file to the files with the same content; passages maps the key of an indexed passage to the file it
+# was indexed from, followed by the other files that contain it (or a near-duplicate of it).
+DUPLICATES_FILENAME = "colbertrag_duplicates.json"
+
+def passage_key(content: str) -> str:
+    # Whitespace is not significant, so re-indented or re-wrapped copies share a key
+    return hashlib.sha1(" ".join(content.split()).encode()).hexdigest()
+
+def duplicates_path(index_path: str) -> str:
+    return os.path.join(index_path, DUPLICATES_FILENAME)
+
+@dataclass
+class Duplicates:
+    documents: Dict[str, List[str]] = field(default_factory=dict)
+    passages: Dict[str, List[str]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, index_path: str) -> "Duplicates":
+        path = duplicates_path(index_path)
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return cls(data["documents"], data["passages"])
+
+    def save(self, index_path: str) -> None:
+        path = duplicates_path(index_path)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"version": 1, "documents": self.documents, "passages": self.passages}, f, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def add_document(self, survivor: str, copies: Iterable[str]) -> None:
+        # A survivor that was itself a copy, or a former survivor that became a copy, brings its copies along
+        merged = self.documents.pop(survivor, []) + [
+            location for copy in copies for location in [copy] + self.documents.pop(copy, [])]
+        self.documents[survivor] = list(dict.fromkeys(location for location in merged if location != survivor))
+
+    def add_passage(self, key: str, survivor: str, copies: Iterable[str]) -> None:
+        merged = self.passages.pop(key, []) + list(copies)
+        self.passages[key] = [survivor] + list(dict.fromkeys(location for location in merged if location != survivor))
+
+    def empty(self) -> bool:
+        return not self.documents and not self.passages
+
+    def copies(self) -> List[str]:
+        # Files that are only indexed through the copy of another file
+        return [document_id for copies in self.documents.values() for document_id in copies]
+
+    def locations(self, document_id: str, content: str) -> List[str]:
+        # Every other file a passage of document_id can be found in
+        locations = list(self.documents.get(document_id, ()))
+        if self.passages:
+            entry = self.passages.get(passage_key(content))
+            if entry and entry[0] == document_id:
+                for other in entry[1:]:
+                    locations.append(other)
+                    locations.extend(self.documents.get(other, ()))
+        return list(dict.fromkeys(location for location in locations if location != document_id))
+
+    def orphans(self, removed: Iterable[str]) -> List[str]:
+        # Files whose content is only indexed through a copy in one of the removed files
+        removed = set(removed)
+        orphans = {copy for survivor, copies in self.documents.items() if survivor in removed for copy in copies}
+        orphans.update(copy for entry in self.passages.values() if entry[0] in removed for copy in entry[1:])
+        return sorted(orphans - removed)
+
+    def remove(self, removed: Iterable[str], reindexed: Iterable[str] = ()) -> None:
+        # Forgets the removed files and the copies that were only indexed through them. Reindexed files are
+        # only dropped as copies: they come back with the same content and are deduplicated again.
+        removed = set(removed)
+        dropped = removed | set(reindexed)
+        self.documents = {survivor: [copy for copy in copies if copy not in dropped]
+                          for survivor, copies in self.documents.items() if survivor not in removed}
+        self.passages = {key: [entry[0]] + [copy for copy in entry[1:] if copy not in dropped]
+                         for key, entry in self.passages.items() if entry[0] not in removed}
+        self.documents = {survivor: copies for survivor, copies in self.documents.items() if copies}
+        self.passages = {key: entry for key, entry in self.passages.items() if len(entry) > 1}
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import shutil
+from typing import Any, Dict, Iterator, List, Set
+from colbert_rag.data.git_repo import Collections
+from colbert_rag.indexer.chunking import Chunk
+
+CHECKPOINT_DIRNAME = "colbertrag_checkpoint"
+# Files that could not be read in the last build, kept next to the index after the checkpoint is gone
+QUARANTINE_FILENAME = "colbertrag_quarantine.json"
+
+def _read_lines(path: str) -> Iterator[Dict[str, Any]]:
+    # The last line may have been cut off by the interruption, it is read again on resume
+    if not os.path.exists(path):
+        return
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"Ignoring a truncated record in {path}")
+
+def _drop_torn_line(path: str) -> None:
+    # Cuts the file back to its last complete line, so the next record is not appended to a cut off one.
+    # Chunks need not be, a language that was not finished is split again into an emptied file.
+    if not os.path.exists(path):
+        return
+    with open(path, 'r+b') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(position - 65536, 0)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+
+def _write_json(path: str, data: Any) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def save_quarantine(index_path: str, quarantine: Dict[str, str]) -> None:
+    os.makedirs(index_path, exist_ok=True)
+    _write_json(os.path.join(index_path, QUARANTINE_FILENAME), quarantine)
+
+# Progress of one build, kept in colbertrag_checkpoint next to the index until the build completes. Collected files
+# are appended per batch, chunks per language, and every stage writes its output before it is marked done, so a
+# build started again with the same arguments continues after the last batch, language or stage it finished.
+class IndexCheckpoint:
+    def __init__(self, index_path: str, arguments: Dict[str, Any]):
+        self.index_path = index_path
+        self.path = os.path.join(index_path, CHECKPOINT_DIRNAME)
+        self.arguments = arguments
+        self.state: Dict[str, Any] = {"arguments": arguments, "stages": {}, "chunked": []}
+        state_path = os.path.join(self.path, "state.json")
+        if os.path.exists(state_path):
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+            if state.get("arguments") == arguments:
+                self.state = state
+                logging.info(f"Resuming the build of {index_path} after {', '.join(state['stages']) or 'no stage'}.")
+            else:
+                logging.info(f"Discarding the checkpoint in {self.path}, it was made with different arguments.")
+                shutil.rmtree(self.path)
+        os.makedirs(os.path.join(self.path, "chunks"), exist_ok=True)
+        # Before anything is read, so the files collected and the files read again agree
+        _drop_torn_line(self._collections_path)
+        self._save_state()
+
+    def _save_state(self) -> None:
+        _write_json(os.path.join(self.path, "state.json"), self.state)
+
+    def done(self, stage: str) -> bool:
+        done: bool = self.state["stages"].get(stage, False)
+        return done
+
+    def mark(self, stage: str) -> None:
+        self.state["stages"][stage] = True
+        self._save_state()
+
+    @property
+    def _collections_path(self) -> str:
+        return os.path.join(self.path, "collections.jsonl")
+
+    def append_collections(self, collections: Collections, quarantine: Dict[str, str]) -> None:
+        with open(self._collections_path, 'a') as f:
+            for lang, (documents, document_ids, metadatas) in collections.items():
+                for document, document_id, metadata in zip(documents, document_ids, metadatas):
+                    f.write(json.dumps({"language": lang, "id": document_id, "metadata": metadata,
+                                        "document": document}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _write_json(os.path.join(self.path, "quarantine.json"), quarantine)
+
+    def load_collections(self) -> Collections:
+        collections: Collections = {}
+        for record in _read_lines(self._collections_path):
+            documents, document_ids, metadatas = collections.setdefault(record["language"], ([], [], []))
+            documents.append(record["document"])
+            document_ids.append(record["id"])
+            metadatas.append(record["metadata"])
+        return collections
+
+    def load_quarantine(self) -> Dict[str, str]:
+        path = os.path.join(self.path, "quarantine.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            quarantine: Dict[str, str] = json.load(f)
+        return quarantine
+
+    def collected(self) -> Set[str]:
+        # Files that do not have to be read again: already collected, or quarantined
+        return {record["id"] for record in _read_lines(self._collections_path)} | set(self.load_quarantine())
+
+    def _chunks_path(self, lang: str) -> str:
+        return os.path.join(self.path, "chunks", f"{lang}.jsonl")
+
+    def chunked(self, lang: str) -> bool:
+        return lang in self.state["chunked"]
+
+    def load_chunks(self, lang: str) -> List[Chunk]:
+        return list(_read_lines(self._chunks_path(lang)))
+
+    def start_chunks(self, lang: str) -> None:
+        # A language that was not finished is split again from the start
+        open(self._chunks_path(lang), 'w').close()
+
+    def append_chunks(self, lang: str, chunks: List[Chunk]) -> None:
+        with open(self._chunks_path(lang), 'a') as f:
+            f.writelines(json.dumps(chunk) + "\n" for chunk in chunks)
+
+    def mark_chunked(self, lang: str) -> None:
+        with open(self._chunks_path(lang), 'a') as f:
+            os.fsync(f.fileno())
+        self.state["chunked"].append(lang)
+        self._save_state()
+
+    def clear(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,96 @@
+import os
+from collections import defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
+from colbert_rag.data.git_repo import Collections
+from colbert_rag.metrics import CHUNKS
+
+Chunk = Dict[str, str]
+
+@lru_cache(maxsize=None)
+def get_splitter(lang: str, chunk_size: int) -> RecursiveCharacterTextSplitter:
+    # Building a splitter compiles the separator regexes for the language, so keep one per language and size
+    if lang not in Language.__members__:
+        # Generic paragraph/line/word splitter for UNSUPPORTED and UNKNOWN text files
+        return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+    return RecursiveCharacterTextSplitter.from_language(
+        language=Language[lang],
+        chunk_size=chunk_size,
+        chunk_overlap=0
+    )
+
+def chunk_documents(lang: str, chunk_size: int, documents: List[str], document_ids: List[str]) -> List[Chunk]:
+    text_splitter = get_splitter(lang, chunk_size)
+    return [{"document_id": doc_id, "content": chunk}
+        for doc_id, text in zip(document_ids, documents)
+        for chunk in text_splitter.split_text(text)
+    ]
+
+def iter_chunks(
+        collection_batches: Iterable[Collections],
+        chunk_size: int,
+        languages: Optional[Iterable[str]] = None,
+        batch_size: int = 64,
+        max_workers: int | None = None,
+        max_pending: int | None = None
+) -> Iterator[Tuple[str, List[Chunk]]]:
+    # Splits batches of batch_size files on a process pool and yields (language, chunks) in submission
+    # order, with at most max_pending batches in flight. max_workers=0 splits in this process.
+    selected = set(languages) if languages is not None else None
+
+    def tasks() -> Iterator[Tuple[str, List[str], List[str]]]:
+        for collections in collection_batches:
+            for lang, (documents, document_ids, _) in collections.items():
+                if selected is not None and lang not in selected:
+                    continue
+                for start in range(0, len(documents), batch_size):
+                    yield lang, documents[start:start + batch_size], document_ids[start:start + batch_size]
+
+    if max_workers == 0:
+        for lang, documents, document_ids in tasks():
+            chunks = chunk_documents(lang, chunk_size, documents, document_ids)
+            CHUNKS.inc(len(chunks), language=lang)
+            yield lang, chunks
+        return
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or max_workers * 4
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending: Deque[Tuple[str, Future[List[Chunk]]]] = deque()
+
+        def drain() -> Tuple[str, List[Chunk]]:
+            lang, future = pending.popleft()
+            chunks = future.result()
+            CHUNKS.inc(len(chunks), language=lang)
+            return lang, chunks
+
+        for lang, documents, document_ids in tasks():
+            if len(pending) >= max_pending:
+                yield drain()
+            pending.append((lang, executor.submit(chunk_documents, lang, chunk_size, documents, document_ids)))
+
+        while pending:
+            yield drain()
+
+def chunk_collections(
+        collections: Collections,
+        chunk_size: int,
+        languages: Optional[Iterable[str]] = None,
+        max_workers: int | None = None
+) -> Dict[str, List[Chunk]]:
+    chunks: Dict[str, List[Chunk]] = defaultdict(list)
+    for lang, batch in iter_chunks([collections], chunk_size, languages, max_workers=max_workers):
+        chunks[lang].extend(batch)
+    return dict(chunks)
+
+def precomputed_splitter(chunks: List[Chunk]) -> Callable[..., List[Chunk]]:
+    # A document_splitter_fn for ragatouille that hands back chunks produced by the chunking stage
+    by_document: Dict[str, List[Chunk]] = defaultdict(list)
+    for chunk in chunks:
+        by_document[chunk["document_id"]].append(chunk)
+
+    def splitter(documents: List[str], document_ids: List[str], chunk_size: int = 0) -> List[Chunk]:
+        return [chunk for doc_id in document_ids for chunk in by_document[doc_id]]
+    return splitter
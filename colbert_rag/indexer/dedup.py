@@ -0,0 +1,120 @@
+import random
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Tuple
+from colbert_rag.data.git_repo import Collections
+from colbert_rag.duplicates import Duplicates, passage_key
+from colbert_rag.indexer.chunking import Chunk
+from colbert_rag.metrics import DUPLICATES
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+@dataclass(frozen=True)
+class Dedup:
+    # files and passages collapse exact copies. With passages, near_threshold is the estimated Jaccard similarity
+    # of the word shingles above which two passages are collapsed as well, off (None) by default.
+    files: bool = True
+    passages: bool = True
+    near_threshold: Optional[float] = None
+    shingle_size: int = 5
+    num_permutations: int = 64
+
+def _survivor_order(document_id: str) -> Tuple[int, str]:
+    # The shallowest copy is kept, the original is usually closer to the root than vendored or forked copies
+    return document_id.count("/"), document_id
+
+def dedup_files(collections: Collections, languages: List[str], duplicates: Duplicates,
+                indexed: Mapping[str, str] = {}) -> Collections:
+    # Keeps one file per md5_hash, the one already in the index (indexed maps md5 hashes to indexed files)
+    # or else the shallowest, and records the others as its copies
+    groups: Dict[str, List[str]] = defaultdict(list)
+    for lang in languages:
+        for document_id, metadata in zip(collections[lang][1], collections[lang][2]):
+            groups[metadata["md5_hash"]].append(document_id)
+
+    dropped = set()
+    for md5_hash, document_ids in groups.items():
+        survivor = indexed.get(md5_hash) or min(document_ids, key=_survivor_order)
+        copies = [document_id for document_id in document_ids if document_id != survivor]
+        if copies:
+            duplicates.add_document(survivor, copies)
+            dropped.update(copies)
+            DUPLICATES.inc(len(copies), kind="file")
+
+    deduplicated: Collections = {}
+    for lang in languages:
+        keep = [i for i, document_id in enumerate(collections[lang][1]) if document_id not in dropped]
+        deduplicated[lang] = tuple([values[i] for i in keep] for values in collections[lang])  # type: ignore
+    return deduplicated
+
+class MinHashLSH:
+    # MinHash signatures over word shingles, bucketed by bands of the signature so that only passages
+    # sharing a band are compared. The band layout is the one whose (1/bands)^(1/rows) is closest to threshold.
+    def __init__(self, threshold: float, num_permutations: int = 64, shingle_size: int = 5):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        rng = random.Random(num_permutations)
+        self.permutations = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                             for _ in range(num_permutations)]
+        self.bands, self.rows = min(
+            ((bands, num_permutations // bands) for bands in range(1, num_permutations + 1)
+             if num_permutations % bands == 0),
+            key=lambda layout: abs((1 / layout[0]) ** (1 / layout[1]) - threshold))
+        self.buckets: List[Dict[Tuple[int, ...], List[int]]] = [defaultdict(list) for _ in range(self.bands)]
+        self.signatures: List[Tuple[int, ...]] = []
+
+    def signature(self, content: str) -> Tuple[int, ...]:
+        words = content.split()
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {hash(tuple(words[i:i + size])) & _MAX_HASH for i in range(max(len(words) - size + 1, 1))}
+        return tuple(min((a * shingle + b) % _MERSENNE_PRIME for shingle in shingles) & _MAX_HASH
+                     for a, b in self.permutations)
+
+    def similarity(self, first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        return sum(x == y for x, y in zip(first, second)) / len(first)
+
+    def insert(self, content: str) -> Optional[int]:
+        # Returns the position of an earlier passage that content is a near-duplicate of, or adds it
+        signature = self.signature(content)
+        bands = [signature[band * self.rows:(band + 1) * self.rows] for band in range(self.bands)]
+        for band, values in enumerate(bands):
+            for candidate in self.buckets[band].get(values, ()):
+                if self.similarity(signature, self.signatures[candidate]) >= self.threshold:
+                    return candidate
+        position = len(self.signatures)
+        self.signatures.append(signature)
+        for band, values in enumerate(bands):
+            self.buckets[band][values].append(position)
+        return None
+
+def dedup_chunks(chunks: List[Chunk], duplicates: Duplicates, dedup: Dedup,
+                 indexed: Mapping[str, str] = {}) -> List[Chunk]:
+    # Keeps the first copy of each passage in survivor order, unless it is already in the index (indexed maps
+    # passage keys to indexed files), and records the files of the others. Repeats within a file are dropped.
+    order = sorted(range(len(chunks)), key=lambda i: _survivor_order(chunks[i]["document_id"]))
+    survivors: Dict[str, str] = dict(indexed)
+    copies: Dict[str, List[str]] = defaultdict(list)
+    near = MinHashLSH(dedup.near_threshold, dedup.num_permutations, dedup.shingle_size) \
+        if dedup.near_threshold is not None else None
+    near_keys: List[str] = []
+    keep = set()
+    for i in order:
+        document_id, content = chunks[i]["document_id"], chunks[i]["content"]
+        key, kind = passage_key(content), "passage"
+        if key not in survivors and near is not None:
+            candidate = near.insert(content)
+            if candidate is None:
+                near_keys.append(key)
+            else:
+                key, kind = near_keys[candidate], "near"
+        if key not in survivors:
+            survivors[key] = document_id
+            keep.add(i)
+        elif survivors[key] != document_id:
+            copies[key].append(document_id)
+            DUPLICATES.inc(kind=kind)
+
+    for key, documents in copies.items():
+        duplicates.add_passage(key, survivors[key], documents)
+    return [chunk for i, chunk in enumerate(chunks) if i in keep]
@@ -1,9 +1,350 @@
 import logging
-from typing import Any,Set
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 from ragatouille import RAGPretrainedModel
-from colbert_rag.config import COLBERTRAG_CHUNK_SIZE
-from colbert_rag.data.git_repo import get_collections
-from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
+from colbert_rag.config import COLBERTRAG_CHUNK_SIZE, RAGATOUILLE_PATH
+from colbert_rag.data.filters import FileFilter
+from colbert_rag.data.git_repo import Collections, diff_commits, get_collections, iter_collections, resolve_commit
+from colbert_rag.docstore import build_document_store, open_document_store
+from colbert_rag.duplicates import Duplicates, passage_key
+from colbert_rag.indexer.checkpoint import IndexCheckpoint, save_quarantine
+from colbert_rag.indexer.chunking import Chunk, chunk_collections, chunk_documents, iter_chunks, precomputed_splitter
+from colbert_rag.indexer.dedup import Dedup, dedup_chunks, dedup_files
+from colbert_rag.indexer.manifest import (
+    build_manifest, diff_manifest, load_manifest, load_manifest_commit, save_manifest, update_manifest
+)
+from colbert_rag.metrics import CHUNKS, INDEX_STAGE_SECONDS, write_index_metrics
+from colbert_rag.shards import save_shards, shard_name, shard_of, split_collections
+
+SKIPPED_LANGUAGES = ['UNSUPPORTED', 'UNKNOWN']
+
+def language_splitter(lang: str, max_document_length: int) -> Callable[..., List[Chunk]]:
+    def splitter(documents: List[str], document_ids: List[str], chunk_size: int = max_document_length) -> List[Chunk]:
+        chunks = chunk_documents(lang, chunk_size, documents, document_ids)
+        CHUNKS.inc(len(chunks), language=lang)
+        return chunks
+    return splitter
+
+def indexed_languages(collections: Collections, index_unsupported: bool = False) -> List[str]:
+    # UNSUPPORTED and UNKNOWN text files get a generic splitter when index_unsupported is set
+    return [lang for lang in collections if index_unsupported or lang not in SKIPPED_LANGUAGES]
+
+def _select(collections: Collections, lang: str, document_ids: Set[str]) -> Tuple[List[str], List[str], List[Dict[str, str]]]:
+    documents, ids, metadatas = collections[lang]
+    keep = [i for i, doc_id in enumerate(ids) if doc_id in document_ids]
+    return [documents[i] for i in keep], [ids[i] for i in keep], [metadatas[i] for i in keep]
+
+def _chunk(
+        collections: Collections,
+        languages: List[str],
+        max_document_length: int,
+        chunk_workers: int | None,
+        checkpoint: Optional[IndexCheckpoint] = None
+) -> Dict[str, List[Chunk]]:
+    # With a checkpoint, chunks are saved as they are produced and languages split before an interruption are loaded
+    if checkpoint is None:
+        return chunk_collections(collections, max_document_length, languages, chunk_workers)
+    chunks = {lang: checkpoint.load_chunks(lang) for lang in languages if checkpoint.chunked(lang)}
+    if chunks:
+        logging.info(f"Loaded the chunks of {', '.join(chunks)} from the checkpoint.")
+    pending = [lang for lang in languages if lang not in chunks]
+    current = None
+    # Batches come in submission order, so each language is finished when the next one starts
+    for lang, batch in iter_chunks([collections], max_document_length, pending, max_workers=chunk_workers) if pending else ():
+        if lang != current:
+            if current is not None:
+                checkpoint.mark_chunked(current)
+            checkpoint.start_chunks(lang)
+            current = lang
+        checkpoint.append_chunks(lang, batch)
+        chunks.setdefault(lang, []).extend(batch)
+    if current is not None:
+        checkpoint.mark_chunked(current)
+    return chunks
+
+def _prepare(
+        collections: Collections,
+        languages: List[str],
+        max_document_length: int,
+        split_documents: bool,
+        chunk_workers: int | None,
+        dedup: Optional[Dedup] = None,
+        duplicates: Optional[Duplicates] = None,
+        indexed_files: Dict[str, str] = {},
+        indexed_passages: Dict[str, str] = {},
+        checkpoint: Optional[IndexCheckpoint] = None
+) -> Tuple[List[str], List[str], List[Dict[str, str]], Callable[..., List[Chunk]] | None]:
+    # Merge all languages into one collection, split each with its own language splitter up front,
+    # and hand ragatouille the finished chunks so the whole collection is encoded in a single pass.
+    # Copies of files and passages are left out and recorded in duplicates.
+    duplicates = duplicates if duplicates is not None else Duplicates()
+    if dedup is not None and dedup.files:
+        with INDEX_STAGE_SECONDS.time(stage="dedup"):
+            collections = dedup_files(collections, languages, duplicates, indexed_files)
+    documents: List[str] = []
+    document_ids: List[str] = []
+    document_metadatas: List[Dict[str, str]] = []
+    for lang in languages:
+        docs, ids, metadatas = collections[lang]
+        logging.info(f"Preparing {len(docs)} {lang} files ...")
+        documents.extend(docs)
+        document_ids.extend(ids)
+        document_metadatas.extend(metadatas)
+
+    if not split_documents:
+        return documents, document_ids, document_metadatas, None
+    with INDEX_STAGE_SECONDS.time(stage="chunk"):
+        chunks = _chunk(collections, languages, max_document_length, chunk_workers, checkpoint)
+    chunk_list = [chunk for lang in languages for chunk in chunks.get(lang, [])]
+    if dedup is not None and dedup.passages:
+        with INDEX_STAGE_SECONDS.time(stage="dedup"):
+            chunk_list = dedup_chunks(chunk_list, duplicates, dedup, indexed_passages)
+    return documents, document_ids, document_metadatas, precomputed_splitter(chunk_list)
+
+def _update_git_repo_index(
+        index_path: str,
+        index_name: str,
+        collections: Collections,
+        previous_manifest: Dict[str, str],
+        max_document_length: int,
+        split_documents: bool,
+        use_faiss: bool,
+        chunk_workers: int | None = None,
+        index_unsupported: bool = False,
+        commit: Optional[str] = None,
+        replaced: Optional[List[str]] = None,
+        dedup: Optional[Dedup] = None
+) -> str:
+    languages = indexed_languages(collections, index_unsupported)
+    # With replaced, collections only holds the files changed between the indexed commit and this one
+    if replaced is not None:
+        current_manifest = update_manifest(previous_manifest, collections, languages, replaced)
+    else:
+        current_manifest = build_manifest(collections, languages)
+    diff = diff_manifest(previous_manifest, current_manifest)
+    logging.info(f"Incremental update: {len(diff.added)} added, {len(diff.changed)} changed, "
+                 f"{len(diff.deleted)} deleted, {len(diff.unchanged)} unchanged files skipped.")
+    for document_id in diff.unchanged:
+        logging.debug(f"Skipping unchanged file {document_id}")
+
+    # Unchanged files whose content was only indexed through a copy in a changed or deleted file are indexed again
+    duplicates = Duplicates.load(index_path)
+    orphans = [document_id for document_id in duplicates.orphans(diff.to_remove) if document_id in current_manifest]
+    if orphans:
+        logging.info(f"Indexing {len(orphans)} unchanged files again whose indexed copy was removed.")
+    to_remove = diff.to_remove + orphans
+    to_index = set(diff.to_index) | set(orphans)
+    duplicates.remove(diff.to_remove, reindexed=orphans)
+
+    if not to_index and not to_remove:
+        save_manifest(index_path, current_manifest, commit)
+        return index_path
+
+    # New copies of content that stays in the index are collapsed into the indexed copy
+    copies = set(duplicates.copies())
+    indexed_files = {md5_hash: document_id for document_id, md5_hash in current_manifest.items()
+                     if document_id not in to_index and document_id not in copies}
+    indexed_passages: Dict[str, str] = {}
+    if dedup is not None and dedup.passages:
+        # Read from the memory-mapped document store, the model is only loaded once chunking is done
+        store = open_document_store(index_path)
+        removed = set(to_remove)
+        for pid in range(len(store.passages)):
+            document_id = store.pid_docid_map[pid]
+            if document_id not in removed:
+                indexed_passages.setdefault(passage_key(store.passages[pid]), document_id)
+
+    # Chunked before the model is loaded, the chunk workers are forked and forking after torch has started
+    # its threads can deadlock
+    selected = {lang: _select(collections, lang, to_index) for lang in languages}
+    selected = {lang: selection for lang, selection in selected.items() if selection[0]}
+    if selected:
+        new_collection, new_document_ids, new_document_metadatas, splitter = _prepare(
+            selected, list(selected), max_document_length, split_documents, chunk_workers,
+            dedup, duplicates, indexed_files, indexed_passages)
+
+    RAG = RAGPretrainedModel.from_index(index_path)
+    if to_remove:
+        logging.info(f"Removing {len(to_remove)} files from index {index_name} ...")
+        with INDEX_STAGE_SECONDS.time(stage="delete"):
+            RAG.delete_from_index(document_ids=to_remove, index_name=index_name)
+
+    if selected:
+        logging.info(f"Adding {len(new_collection)} files ...")
+        with INDEX_STAGE_SECONDS.time(stage="encode"):
+            RAG.add_to_index(
+                index_name=index_name,
+                new_collection=new_collection,
+                new_document_ids=new_document_ids,
+                new_document_metadatas=new_document_metadatas,
+                document_splitter_fn=splitter,
+                split_documents=split_documents,
+                use_faiss=use_faiss
+            )
+
+    save_manifest(index_path, current_manifest, commit)
+    duplicates.save(index_path)
+    build_document_store(index_path)
+    return index_path
+
+def index_collections(
+        model_name: str,
+        index_name: str,
+        collections: Collections,
+        max_document_length: int = COLBERTRAG_CHUNK_SIZE,
+        split_documents: bool = True,
+        use_faiss: bool = False,
+        incremental: bool = False,
+        chunk_workers: int | None = None,
+        index_unsupported: bool = False,
+        commit: Optional[str] = None,
+        replaced: Optional[List[str]] = None,
+        dedup: Optional[Dedup] = None,
+        checkpoint: Optional[IndexCheckpoint] = None
+) -> Any:
+    # checkpoint, when given, is cleared once the index is complete
+    index_path = os.path.join(RAGATOUILLE_PATH, index_name)
+    if incremental:
+        previous_manifest = load_manifest(index_path)
+        if previous_manifest is not None:
+            path = _update_git_repo_index(
+                index_path, index_name, collections, previous_manifest,
+                max_document_length, split_documents, use_faiss, chunk_workers, index_unsupported, commit, replaced,
+                dedup)
+            if checkpoint is not None:
+                checkpoint.clear()
+            return path
+        logging.info(f"No manifest found at {index_path}, building the full index.")
+
+    languages = indexed_languages(collections, index_unsupported)
+    duplicates = Duplicates()
+    collection, document_ids, document_metadatas, splitter = _prepare(
+        collections, languages, max_document_length, split_documents, chunk_workers, dedup, duplicates,
+        checkpoint=checkpoint)
+
+    # colbert saves the encoded passages in chunks; an interrupted encode reuses the saved ones, which only holds
+    # because the chunks above were loaded in the same order from the checkpoint
+    overwrite: bool | str = True
+    if checkpoint is not None:
+        if checkpoint.done("encode"):
+            logging.info("Resuming encoding from the saved index chunks.")
+            overwrite = "resume"
+        checkpoint.mark("encode")
+
+    logging.info(f"Indexing {len(collection)} files in {len(languages)} languages ...")
+    RAG = RAGPretrainedModel.from_pretrained(model_name)
+    with INDEX_STAGE_SECONDS.time(stage="encode"):
+        path = RAG.index(
+            collection=collection,
+            index_name=index_name,
+            document_ids=document_ids,
+            document_metadatas=document_metadatas,
+            overwrite_index=overwrite,
+            max_document_length=max_document_length,
+            split_documents=split_documents,
+            document_splitter_fn=splitter,
+            use_faiss=use_faiss
+        )
+
+    # Copies are listed in the manifest too, so the next incremental build does not add them back
+    save_manifest(path, build_manifest(collections, languages), commit)
+    duplicates.save(path)
+    # Servers started with --mmap map passages and metadata from this store instead of parsing the JSON files
+    build_document_store(path)
+    if checkpoint is not None:
+        checkpoint.clear()
+    return path
+
+def _index_shard(model_name: str, index_name: str, collections: Collections, options: Dict[str, Any],
+                 checkpoint_arguments: Optional[Dict[str, Any]]) -> str:
+    # Runs in a shard worker process
+    checkpoint = IndexCheckpoint(os.path.join(RAGATOUILLE_PATH, index_name), checkpoint_arguments) \
+        if checkpoint_arguments is not None else None
+    path: str = index_collections(model_name, index_name, collections, checkpoint=checkpoint, **options)
+    # The chunk and encode metrics of a shard are only known to its worker
+    write_index_metrics(path)
+    return path
+
+def index_sharded_collections(
+        model_name: str,
+        index_name: str,
+        collections: Collections,
+        num_shards: int,
+        shard_workers: Optional[int] = None,
+        checkpoint: Optional[IndexCheckpoint] = None,
+        replaced: Optional[List[str]] = None,
+        **options: Any
+) -> str:
+    # Splits the collection by path hash and builds every shard as its own index named <index_name>-shard<i>,
+    # in parallel worker processes. index_name becomes a directory listing the shards, which servers fan out to.
+    index_path = os.path.join(RAGATOUILLE_PATH, index_name)
+    names = [shard_name(index_name, shard) for shard in range(num_shards)]
+    shard_collections = split_collections(collections, num_shards)
+    incremental = options.get("incremental", False)
+    # A shard without files has no index to build or update
+    shards = [shard for shard in range(num_shards)
+              if shard_collections[shard] or (incremental and load_manifest(os.path.join(RAGATOUILLE_PATH, names[shard])))]
+    pending = [shard for shard in shards if checkpoint is None or not checkpoint.done(names[shard])]
+    logging.info(f"Indexing {len(pending)} of {num_shards} shards of {index_name} ...")
+
+    error: Optional[BaseException] = None
+    # Spawned rather than forked, each worker loads its own encoder
+    with ProcessPoolExecutor(max_workers=shard_workers or len(pending) or 1,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {executor.submit(
+            _index_shard, model_name, names[shard], shard_collections[shard],
+            {**options, "replaced": [path for path in replaced if shard_of(path, num_shards) == shard]
+             if replaced is not None else None},
+            {**checkpoint.arguments, "shard": shard} if checkpoint is not None else None): shard for shard in pending}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                # The other shards still finish, and only the failed ones are built again on resume
+                logging.error(f"Indexing shard {names[shard]} failed: {e}")
+                error = error or e
+                continue
+            logging.info(f"Shard {names[shard]} indexed.")
+            if checkpoint is not None:
+                checkpoint.mark(names[shard])
+    if error is not None:
+        raise error
+
+    # The manifest of the whole collection records the commit for the next incremental build
+    manifest: Dict[str, str] = {}
+    for shard in shards:
+        manifest.update(load_manifest(os.path.join(RAGATOUILLE_PATH, names[shard])) or {})
+    save_manifest(index_path, manifest, options.get("commit"))
+    save_shards(index_path, [names[shard] for shard in shards])
+    if checkpoint is not None:
+        checkpoint.clear()
+    return index_path
+
+def _collect_resumable(
+        checkpoint: IndexCheckpoint,
+        repo_name: str,
+        ext_blacklist: Set[str],
+        dir_blacklist: Set[str],
+        revision: Optional[str],
+        paths: Optional[List[str]],
+        file_filter: Optional[FileFilter],
+        quarantine: Dict[str, str]
+) -> Collections:
+    # Each batch of files is saved as it is collected; a resumed build skips the files it already has
+    quarantine.update(checkpoint.load_quarantine())
+    if not checkpoint.done("collect"):
+        collected = checkpoint.collected()
+        if collected:
+            logging.info(f"Skipping {len(collected)} files collected before the interruption.")
+        for batch in iter_collections(repo_name, ext_blacklist, dir_blacklist, revision=revision, paths=paths,
+                                      file_filter=file_filter, quarantine=quarantine, exclude=collected):
+            checkpoint.append_collections(batch, quarantine)
+        checkpoint.append_collections({}, quarantine)
+        checkpoint.mark("collect")
+    return checkpoint.load_collections()
 
 def index_git_repo(
         model_name: str,
@@ -14,59 +355,78 @@ def index_git_repo(
         max_document_length: int = COLBERTRAG_CHUNK_SIZE,
         split_documents: bool = True,
         use_faiss: bool = False,
-        logging_level: str = "INFO"
+        logging_level: str = "INFO",
+        incremental: bool = False,
+        chunk_workers: int | None = None,
+        index_unsupported: bool = False,
+        revision: Optional[str] = None,
+        file_filter: Optional[FileFilter] = None,
+        dedup: Optional[Dedup] = None,
+        checkpoint: bool = False,
+        num_shards: int = 1,
+        shard_workers: Optional[int] = None
 ) -> Any:
+    # repo_name is a GitHub username/repo-name, a clone URL, a local working tree or a bare mirror.
+    # Local repositories read at a revision (and bare mirrors) record the commit in the manifest, so the
+    # next incremental build only reads the files changed between the two commits.
+    # With checkpoint (off by default, it writes every document twice), a build that was interrupted continues
+    # where it stopped when it is run again with the same arguments. Files that cannot be read are logged and listed in colbertrag_quarantine.json.
+    # With num_shards > 1 the index is split into shards built in shard_workers processes.
     logging.basicConfig(level=logging_level)
+    index_path = os.path.join(RAGATOUILLE_PATH, index_name)
+    quarantine: Dict[str, str] = {}
+    build_checkpoint: Optional[IndexCheckpoint] = None
     try:
-        collections = get_collections(repo_name, ext_blacklist, dir_blacklist)
-        logging.info(f"Git repo {repo_name} cloned.")
+        commit = resolve_commit(repo_name, revision)
+        previous_commit = load_manifest_commit(os.path.join(RAGATOUILLE_PATH, index_name)) if incremental else None
+        paths, replaced = None, None
+        if commit is not None and previous_commit is not None:
+            try:
+                paths, deleted = diff_commits(repo_name, previous_commit, commit)
+                replaced = paths + deleted
+                # Unchanged copies of the replaced files are read too, in case they have to be indexed again
+                shard_paths = [index_path] if num_shards == 1 else [
+                    os.path.join(RAGATOUILLE_PATH, shard_name(index_name, shard)) for shard in range(num_shards)]
+                paths = paths + [path for shard_path in shard_paths for path in Duplicates.load(shard_path).orphans(replaced)]
+                logging.info(f"Reading {len(paths)} files changed since {previous_commit[:12]}, {len(deleted)} deleted.")
+            except Exception as e:
+                # e.g. the indexed commit is no longer in the mirror, fall back to comparing file hashes
+                logging.warning(f"Could not diff against the indexed commit {previous_commit[:12]}: {e}")
+        if checkpoint:
+            build_checkpoint = IndexCheckpoint(index_path, {
+                "model_name": model_name, "repo_name": repo_name, "commit": commit or revision,
+                "previous_commit": previous_commit if paths is not None else None, "incremental": incremental,
+                "ext_blacklist": sorted(ext_blacklist), "dir_blacklist": sorted(dir_blacklist),
+                "max_document_length": max_document_length, "split_documents": split_documents,
+                "index_unsupported": index_unsupported, "file_filter": repr(file_filter), "dedup": repr(dedup),
+                "num_shards": num_shards})
+        with INDEX_STAGE_SECONDS.time(stage="collect"):
+            if build_checkpoint is not None:
+                collections = _collect_resumable(
+                    build_checkpoint, repo_name, ext_blacklist, dir_blacklist, commit or revision, paths, file_filter,
+                    quarantine)
+            else:
+                collections = get_collections(
+                    repo_name, ext_blacklist, dir_blacklist, revision=commit or revision, paths=paths,
+                    file_filter=file_filter, quarantine=quarantine)
+        logging.info(f"Git repo {repo_name} read{f' at {commit[:12]}' if commit else ''}.")
+        save_quarantine(index_path, quarantine)
+        if quarantine:
+            logging.warning(f"{len(quarantine)} files could not be read, see {index_path}/colbertrag_quarantine.json")
     except Exception as e:
-        logging.error(f"An error occurred while cloning the repository: {e}")
+        logging.error(f"An error occurred while reading the repository: {e}")
         return ""
 
-    # Determine the main language, collection with the most documents
-    main_lang = max(collections, key=lambda x: len(collections[x][0]))
-    collection, document_ids, document_metadatas = collections.get(main_lang, ([], [], []))
-
-    logging.info(f"Indexing {len(collection)} {main_lang} files ...")
-    RAG = RAGPretrainedModel.from_pretrained(model_name)
-    path = RAG.index(
-        collection=collection,
-        index_name=index_name,
-        document_ids=document_ids,
-        document_metadatas=document_metadatas,
-        max_document_length=max_document_length,
-        split_documents=split_documents,
-        document_splitter_fn=lambda documents, document_ids, chunk_size=max_document_length: [{"document_id": doc_id, "content": chunk}
-            for doc_id, text in zip(document_ids, documents)
-            for chunk in RecursiveCharacterTextSplitter.from_language(
-                language=Language[main_lang],
-                chunk_size=chunk_size, 
-                chunk_overlap=0
-            ).split_text(text)
-        ],
-        use_faiss=use_faiss
-    )
-
-    for lang, (new_collection, new_document_ids, new_document_metadatas) in collections.items():
-        if lang in [main_lang, 'UNSUPPORTED', 'UNKNOWN']:
-            continue
-        logging.info(f"Adding {len(new_collection)} {lang} files ...")
-        RAG.add_to_index(
-            index_name=index_name,
-            new_collection=new_collection,
-            new_document_ids=new_document_ids,
-            new_document_metadatas=new_document_metadatas,
-            document_splitter_fn=lambda documents, document_ids, chunk_size=max_document_length: [{"document_id": doc_id, "content": chunk}
-                for doc_id, text in zip(document_ids, documents)
-                for chunk in RecursiveCharacterTextSplitter.from_language(
-                    language=Language[lang],
-                    chunk_size=chunk_size, 
-                    chunk_overlap=0
-                ).split_text(text)
-            ],
-            split_documents=split_documents,
-            use_faiss=use_faiss
-        )
-
+    if num_shards > 1:
+        path = index_sharded_collections(
+            model_name, index_name, collections, num_shards, shard_workers, build_checkpoint, replaced,
+            max_document_length=max_document_length, split_documents=split_documents, use_faiss=use_faiss,
+            incremental=incremental, chunk_workers=chunk_workers, index_unsupported=index_unsupported,
+            commit=commit, dedup=dedup)
+    else:
+        path = index_collections(
+            model_name, index_name, collections,
+            max_document_length, split_documents, use_faiss, incremental, chunk_workers, index_unsupported,
+            commit, replaced, dedup, build_checkpoint)
+    logging.info(f"Wrote indexing metrics to {write_index_metrics(path)}")
     return path
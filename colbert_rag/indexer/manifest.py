@@ -0,0 +1,81 @@
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from colbert_rag.data.git_repo import Collections
+
+MANIFEST_FILENAME = "colbertrag_manifest.json"
+
+@dataclass
+class ManifestDiff:
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+    @property
+    def to_index(self) -> List[str]:
+        return self.added + self.changed
+
+    @property
+    def to_remove(self) -> List[str]:
+        return self.changed + self.deleted
+
+def manifest_path(index_path: str) -> str:
+    return os.path.join(index_path, MANIFEST_FILENAME)
+
+def load_manifest(index_path: str) -> Dict[str, str] | None:
+    path = manifest_path(index_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        documents: Dict[str, str] = json.load(f)["documents"]
+    return documents
+
+def load_manifest_commit(index_path: str) -> str | None:
+    # The commit the index was built from, when it was read from git objects
+    path = manifest_path(index_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        commit: Optional[str] = json.load(f).get("commit")
+    return commit
+
+def save_manifest(index_path: str, documents: Dict[str, str], commit: Optional[str] = None) -> None:
+    os.makedirs(index_path, exist_ok=True)
+    path = manifest_path(index_path)
+    tmp_path = f"{path}.tmp"
+    manifest: Dict[str, object] = {"version": 1, "documents": documents}
+    if commit is not None:
+        manifest["commit"] = commit
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def build_manifest(collections: Collections, languages: List[str]) -> Dict[str, str]:
+    return {
+        document_id: metadata["md5_hash"]
+        for lang in languages
+        for document_id, metadata in zip(collections[lang][1], collections[lang][2])
+    }
+
+def update_manifest(previous: Dict[str, str], collections: Collections, languages: List[str],
+                    replaced: List[str]) -> Dict[str, str]:
+    # collections holds what is left of the replaced (changed or deleted) files after reading and filtering
+    # them again, every other file is unchanged since the previous build
+    replaced_ids = set(replaced)
+    current = {document_id: md5_hash for document_id, md5_hash in previous.items() if document_id not in replaced_ids}
+    current.update(build_manifest(collections, languages))
+    return current
+
+def diff_manifest(previous: Dict[str, str], current: Dict[str, str]) -> ManifestDiff:
+    diff = ManifestDiff()
+    for document_id, md5_hash in current.items():
+        if document_id not in previous:
+            diff.added.append(document_id)
+        elif previous[document_id] != md5_hash:
+            diff.changed.append(document_id)
+        else:
+            diff.unchanged.append(document_id)
+    diff.deleted = [document_id for document_id in previous if document_id not in current]
+    return diff
@@ -0,0 +1,228 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+TRACE_HEADER = "x-colbertrag-trace"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# The indexer exits once the build is done, so it writes its metrics next to the index instead of serving them
+INDEX_METRICS_FILENAME = "colbertrag_index_metrics.prom"
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(labelnames: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        ...
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set_function(self, fn: Callable[[], float], **labels: str) -> None:
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            functions = list(self._functions.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {fn()}" for key, fn in functions]
+
+class Histogram(_Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, counts in self._counts.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {self._sums[key]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self, names: Optional[Sequence[str]] = None) -> str:
+        metrics = self._metrics.values() if names is None else [self._metrics[name] for name in names]
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+REGISTRY = Registry()
+
+# Serving
+REQUESTS = Counter("colbertrag_requests_total", "Retrieval requests handled", ["server", "method"])
+REQUEST_ERRORS = Counter("colbertrag_request_errors_total", "Retrieval requests that raised", ["server", "method"])
+REQUEST_SECONDS = Histogram("colbertrag_request_seconds", "End to end retrieval request latency", ["server", "method"])
+STAGE_SECONDS = Histogram("colbertrag_stage_seconds", "Time spent in each retrieval stage", ["stage"])
+SERVER_STATE = Gauge("colbertrag_server_state", "Cache and batching state of the server", ["name"])
+BATCH_WAIT_SECONDS = Histogram("colbertrag_batch_wait_seconds", "Time requests wait in the micro-batching queue")
+
+# Indexing
+FILES_WALKED = Counter("colbertrag_index_files_total", "Files read from the repository", ["language"])
+FILES_SKIPPED = Counter("colbertrag_index_files_skipped_total", "Files left out of the index by the ingestion filters or read errors", ["reason"])
+BYTES_READ = Counter("colbertrag_index_bytes_read_total", "Bytes read from repository files")
+LEXER_SECONDS = Counter("colbertrag_index_lexer_seconds_total", "Time spent detecting file languages")
+CHUNKS = Counter("colbertrag_index_chunks_total", "Chunks produced by the document splitters", ["language"])
+DUPLICATES = Counter("colbertrag_index_duplicates_total", "Files and passages collapsed into an indexed copy", ["kind"])
+INDEX_STAGE_SECONDS = Histogram("colbertrag_index_stage_seconds", "Time spent in each indexing stage", ["stage"],
+                                buckets=(0.1, 1.0, 10.0, 60.0, 300.0, 900.0, 3600.0, 14400.0))
+
+INDEXING_METRICS = (FILES_WALKED, FILES_SKIPPED, BYTES_READ, LEXER_SECONDS, CHUNKS, DUPLICATES, INDEX_STAGE_SECONDS)
+
+for _metric in (REQUESTS, REQUEST_ERRORS, REQUEST_SECONDS, STAGE_SECONDS, SERVER_STATE,
+                BATCH_WAIT_SECONDS) + INDEXING_METRICS:
+    REGISTRY.register(_metric)
+
+def write_index_metrics(index_path: str) -> str:
+    # In the text format, for node_exporter's textfile collector or any scraper that reads files. The counters
+    # are those of this process, so they add up the builds it has run.
+    path = os.path.join(index_path, INDEX_METRICS_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(REGISTRY.render([metric.name for metric in INDEXING_METRICS]))
+    os.replace(tmp_path, path)
+    return path
+
+_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("colbertrag_trace", default=None)
+
+@contextmanager
+def trace(enabled: bool = True) -> Iterator[List[Tuple[str, float]]]:
+    stages: List[Tuple[str, float]] = []
+    token = _trace.set(stages if enabled else None)
+    try:
+        yield stages
+    finally:
+        _trace.reset(token)
+
+def format_trace(stages: List[Tuple[str, float]]) -> str:
+    return json.dumps([{"stage": name, "ms": round(seconds * 1000, 3)} for name, seconds in stages])
+
+def trace_requested(value: Optional[str]) -> bool:
+    return value is not None and value.lower() not in ("", "0", "false")
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        stages = _trace.get()
+        if stages is not None:
+            stages.append((name, elapsed))
+
+@contextmanager
+def observe_request(server: str, method: str) -> Iterator[None]:
+    REQUESTS.inc(server=server, method=method)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        REQUEST_ERRORS.inc(server=server, method=method)
+        raise
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, server=server, method=method)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+def start_metrics_server(host: str, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="colbertrag-metrics", daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
@@ -1,13 +1,34 @@
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+class Filter(BaseModel):
+    languages: List[str] = []
+    paths: List[str] = []
+    extensions: List[str] = []
 
 class Request(BaseModel):
     query: str
     k: int
+    index: str = ""
+    filter: Optional[Filter] = None
 
 class Document(BaseModel):
     page_content: str
     metadata: Dict[str, str]
+    score: Optional[float] = None
 
 class Response(BaseModel):
     documents: List[Document]
+
+class BatchRequest(BaseModel):
+    requests: List[Request]
+
+class BatchResponse(BaseModel):
+    responses: List[Response]
+
+class ReloadRequest(BaseModel):
+    index: str = ""
+    wait: bool = True
+
+class ReloadResponse(BaseModel):
+    version: int
@@ -14,7 +14,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10\x63olbertrag.proto\x12\ncolbertrag\"#\n\x07Request\x12\r\n\x05query\x18\x01 \x01(\t\x12\t\n\x01k\x18\x02 \x01(\x05\"\x87\x01\n\x08\x44ocument\x12\x14\n\x0cpage_content\x18\x01 \x01(\t\x12\x34\n\x08metadata\x18\x02 \x03(\x0b\x32\".colbertrag.Document.MetadataEntry\x1a/\n\rMetadataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"3\n\x08Response\x12\'\n\tdocuments\x18\x01 \x03(\x0b\x32\x14.colbertrag.Document2C\n\nColbertRAG\x12\x35\n\x08Retrieve\x12\x13.colbertrag.Request\x1a\x14.colbertrag.Responseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10\x63olbertrag.proto\x12\ncolbertrag\"V\n\x07Request\x12\r\n\x05query\x18\x01 \x01(\t\x12\t\n\x01k\x18\x02 \x01(\x05\x12\r\n\x05index\x18\x03 \x01(\t\x12\"\n\x06\x66ilter\x18\x04 \x01(\x0b\x32\x12.colbertrag.Filter\">\n\x06\x46ilter\x12\x11\n\tlanguages\x18\x01 \x03(\t\x12\r\n\x05paths\x18\x02 \x03(\t\x12\x12\n\nextensions\x18\x03 \x03(\t\"\x96\x01\n\x08\x44ocument\x12\x14\n\x0cpage_content\x18\x01 \x01(\t\x12\x34\n\x08metadata\x18\x02 \x03(\x0b\x32\".colbertrag.Document.MetadataEntry\x12\r\n\x05score\x18\x03 \x01(\x02\x1a/\n\rMetadataEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"3\n\x08Response\x12\'\n\tdocuments\x18\x01 \x03(\x0b\x32\x14.colbertrag.Document\"5\n\x0c\x42\x61tchRequest\x12%\n\x08requests\x18\x01 \x03(\x0b\x32\x13.colbertrag.Request\"8\n\rBatchResponse\x12\'\n\tresponses\x18\x01 \x03(\x0b\x32\x14.colbertrag.Response\",\n\rReloadRequest\x12\r\n\x05index\x18\x01 \x01(\t\x12\x0c\n\x04wait\x18\x02 \x01(\x08\"!\n\x0eReloadResponse\x12\x0f\n\x07version\x18\x01 \x01(\x03\x32\x89\x02\n\nColbertRAG\x12\x35\n\x08Retrieve\x12\x13.colbertrag.Request\x1a\x14.colbertrag.Response\x12\x44\n\rRetrieveBatch\x12\x18.colbertrag.BatchRequest\x1a\x19.colbertrag.BatchResponse\x12=\n\x0eRetrieveStream\x12\x13.colbertrag.Request\x1a\x14.colbertrag.Document0\x01\x12?\n\x06Reload\x12\x19.colbertrag.ReloadRequest\x1a\x1a.colbertrag.ReloadResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -24,13 +24,23 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_DOCUMENT_METADATAENTRY']._loaded_options = None
   _globals['_DOCUMENT_METADATAENTRY']._serialized_options = b'8\001'
   _globals['_REQUEST']._serialized_start=32
-  _globals['_REQUEST']._serialized_end=67
-  _globals['_DOCUMENT']._serialized_start=70
-  _globals['_DOCUMENT']._serialized_end=205
-  _globals['_DOCUMENT_METADATAENTRY']._serialized_start=158
-  _globals['_DOCUMENT_METADATAENTRY']._serialized_end=205
-  _globals['_RESPONSE']._serialized_start=207
-  _globals['_RESPONSE']._serialized_end=258
-  _globals['_COLBERTRAG']._serialized_start=260
-  _globals['_COLBERTRAG']._serialized_end=327
+  _globals['_REQUEST']._serialized_end=118
+  _globals['_FILTER']._serialized_start=120
+  _globals['_FILTER']._serialized_end=182
+  _globals['_DOCUMENT']._serialized_start=185
+  _globals['_DOCUMENT']._serialized_end=335
+  _globals['_DOCUMENT_METADATAENTRY']._serialized_start=288
+  _globals['_DOCUMENT_METADATAENTRY']._serialized_end=335
+  _globals['_RESPONSE']._serialized_start=337
+  _globals['_RESPONSE']._serialized_end=388
+  _globals['_BATCHREQUEST']._serialized_start=390
+  _globals['_BATCHREQUEST']._serialized_end=443
+  _globals['_BATCHRESPONSE']._serialized_start=445
+  _globals['_BATCHRESPONSE']._serialized_end=501
+  _globals['_RELOADREQUEST']._serialized_start=503
+  _globals['_RELOADREQUEST']._serialized_end=547
+  _globals['_RELOADRESPONSE']._serialized_start=549
+  _globals['_RELOADRESPONSE']._serialized_end=582
+  _globals['_COLBERTRAG']._serialized_start=585
+  _globals['_COLBERTRAG']._serialized_end=850
 # @@protoc_insertion_point(module_scope)
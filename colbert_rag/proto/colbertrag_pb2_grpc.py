@@ -44,6 +44,21 @@ class ColbertRAGStub(object):
                 request_serializer=colbertrag__pb2.Request.SerializeToString,
                 response_deserializer=colbertrag__pb2.Response.FromString,
                 _registered_method=True)
+        self.RetrieveBatch = channel.unary_unary(
+                '/colbertrag.ColbertRAG/RetrieveBatch',
+                request_serializer=colbertrag__pb2.BatchRequest.SerializeToString,
+                response_deserializer=colbertrag__pb2.BatchResponse.FromString,
+                _registered_method=True)
+        self.RetrieveStream = channel.unary_stream(
+                '/colbertrag.ColbertRAG/RetrieveStream',
+                request_serializer=colbertrag__pb2.Request.SerializeToString,
+                response_deserializer=colbertrag__pb2.Document.FromString,
+                _registered_method=True)
+        self.Reload = channel.unary_unary(
+                '/colbertrag.ColbertRAG/Reload',
+                request_serializer=colbertrag__pb2.ReloadRequest.SerializeToString,
+                response_deserializer=colbertrag__pb2.ReloadResponse.FromString,
+                _registered_method=True)
 
 
 class ColbertRAGServicer(object):
@@ -55,6 +70,24 @@ class ColbertRAGServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def RetrieveBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def RetrieveStream(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Reload(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ColbertRAGServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -63,6 +96,21 @@ def add_ColbertRAGServicer_to_server(servicer, server):
                     request_deserializer=colbertrag__pb2.Request.FromString,
                     response_serializer=colbertrag__pb2.Response.SerializeToString,
             ),
+            'RetrieveBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.RetrieveBatch,
+                    request_deserializer=colbertrag__pb2.BatchRequest.FromString,
+                    response_serializer=colbertrag__pb2.BatchResponse.SerializeToString,
+            ),
+            'RetrieveStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.RetrieveStream,
+                    request_deserializer=colbertrag__pb2.Request.FromString,
+                    response_serializer=colbertrag__pb2.Document.SerializeToString,
+            ),
+            'Reload': grpc.unary_unary_rpc_method_handler(
+                    servicer.Reload,
+                    request_deserializer=colbertrag__pb2.ReloadRequest.FromString,
+                    response_serializer=colbertrag__pb2.ReloadResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'colbertrag.ColbertRAG', rpc_method_handlers)
@@ -100,3 +148,84 @@ class ColbertRAG(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def RetrieveBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/colbertrag.ColbertRAG/RetrieveBatch',
+            colbertrag__pb2.BatchRequest.SerializeToString,
+            colbertrag__pb2.BatchResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def RetrieveStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/colbertrag.ColbertRAG/RetrieveStream',
+            colbertrag__pb2.Request.SerializeToString,
+            colbertrag__pb2.Document.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Reload(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/colbertrag.ColbertRAG/Reload',
+            colbertrag__pb2.ReloadRequest.SerializeToString,
+            colbertrag__pb2.ReloadResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -1,15 +1,268 @@
-from typing import Protocol, runtime_checkable
-from colbert_rag.models import Request, Response
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Protocol, Tuple, runtime_checkable
+from colbert_rag.config import (
+    COLBERTRAG_BATCH_WAIT_MS, COLBERTRAG_CACHE_SIZE, COLBERTRAG_CACHE_TTL, COLBERTRAG_QUERY_CACHE_SIZE
+)
+from colbert_rag.metrics import SERVER_STATE, stage
+from colbert_rag.duplicates import Duplicates
+from colbert_rag.models import BatchRequest, BatchResponse, Document, Filter, Request, Response
+from colbert_rag.server.batching import MicroBatcher
+from colbert_rag.server.cache import LRUCache, normalize_query
+from colbert_rag.server.embedding import QueryEmbeddingSearch, SearchResults
+from colbert_rag.server.filters import MetadataFilter
+from colbert_rag.server.indexes import IndexNotFoundError, IndexPool
 from ragatouille import RAGPretrainedModel
 
+if TYPE_CHECKING:
+    from colbert_rag.server.reload import IndexReloader
+    from colbert_rag.server.shards import ShardedSearch
+
 @runtime_checkable
 class ServerProtocol(Protocol):
     def retrieve(self, request: Request) -> Response:
         ...
 
+    def retrieve_batch(self, request: BatchRequest) -> BatchResponse:
+        ...
+
+    def retrieve_stream(self, request: Request) -> Iterator[Document]:
+        ...
+
     def serve(self, host: str, port: int) -> None:
         ...
 
+class ModelState:
+    # The model and its query search are swapped together, and requests count themselves in and out of
+    # the state they started on so an old model can be drained before it is released
+    def __init__(self, model: Optional[RAGPretrainedModel], query_search: Optional[QueryEmbeddingSearch]):
+        self.model = model
+        self.query_search = query_search
+        self.inflight = 0
+        self._idle = threading.Condition()
+        self._filtered_search: Optional[QueryEmbeddingSearch] = None
+        self._has_duplicates: Optional[bool] = None
+
+    def has_duplicates(self) -> bool:
+        # Indexes built with deduplication list the copies they left out, read once per model
+        with self._idle:
+            if self._has_duplicates is None:
+                index_path = getattr(self.model.model, "index_path", None) if self.model is not None else None
+                self._has_duplicates = index_path is not None and not Duplicates.load(str(index_path)).empty()
+            return self._has_duplicates
+
+    def filtered_search(self) -> QueryEmbeddingSearch:
+        # Filtered searches and indexes with duplicates go through QueryEmbeddingSearch, which can restrict the
+        # searched passages and adds the locations of deduplicated copies; without a query cache it gets one
+        # that keeps no embeddings
+        with self._idle:
+            if self.query_search is not None:
+                return self.query_search
+            if self._filtered_search is None:
+                assert self.model is not None
+                self._filtered_search = QueryEmbeddingSearch(self.model, 0)
+            return self._filtered_search
+
+    @contextmanager
+    def use(self) -> Iterator["ModelState"]:
+        with self._idle:
+            self.inflight += 1
+        try:
+            yield self
+        finally:
+            with self._idle:
+                self.inflight -= 1
+                if self.inflight == 0:
+                    self._idle.notify_all()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        with self._idle:
+            return self._idle.wait_for(lambda: self.inflight == 0, timeout)
+
 class BaseServer:
-    def __init__(self, model: RAGPretrainedModel):
-        self.model = model
\ No newline at end of file
+    def __init__(self,
+                 model: Optional[RAGPretrainedModel],
+                 max_batch_size: int = 0,
+                 batch_wait_ms: float = COLBERTRAG_BATCH_WAIT_MS,
+                 cache_size: int = COLBERTRAG_CACHE_SIZE,
+                 cache_ttl: Optional[float] = COLBERTRAG_CACHE_TTL,
+                 query_cache_size: int = COLBERTRAG_QUERY_CACHE_SIZE,
+                 indexes: Optional[IndexPool] = None,
+                 shards: Optional["ShardedSearch"] = None):
+        # Requests without an index go to model, or to every shard of a sharded index when shards is set;
+        # requests naming one (or all requests when model is None) go to indexes
+        self.indexes = indexes
+        self.shards = shards
+        self.index_version = 0
+        self.query_cache_size = query_cache_size
+        self.state = ModelState(model, self._query_search(model))
+        # Set to an IndexReloader to reload new index versions; only with its admin flag are reload
+        # requests accepted from the admin RPC and route
+        self.reloader: Optional["IndexReloader"] = None
+        # With max_batch_size > 1, concurrent single queries are collected and searched together
+        self.batcher = MicroBatcher(
+            self.search_batch, max_batch_size, batch_wait_ms, (IndexNotFoundError,)) if max_batch_size > 1 else None
+        self.cache: Optional[LRUCache[SearchResults]] = LRUCache(cache_size, cache_ttl) if cache_size > 0 else None
+        self._register_state_metrics()
+
+    def _query_search(self, model: Optional[RAGPretrainedModel]) -> Optional[QueryEmbeddingSearch]:
+        if model is None or self.query_cache_size <= 0:
+            return None
+        return QueryEmbeddingSearch(model, self.query_cache_size)
+
+    @property
+    def model(self) -> Optional[RAGPretrainedModel]:
+        return self.state.model
+
+    @property
+    def query_search(self) -> Optional[QueryEmbeddingSearch]:
+        return self.state.query_search
+
+    def _register_state_metrics(self) -> None:
+        SERVER_STATE.set_function(lambda: self.index_version, name="index_version")
+        if self.shards is not None:
+            shards = self.shards
+            SERVER_STATE.set_function(lambda: len(shards.shards), name="shards")
+        if self.indexes is not None:
+            indexes = self.indexes
+            SERVER_STATE.set_function(lambda: len(indexes.loaded()), name="indexes_loaded")
+            SERVER_STATE.set_function(lambda: indexes.used_mb, name="indexes_memory_mb")
+        if self.cache is not None:
+            cache = self.cache
+            SERVER_STATE.set_function(lambda: len(cache), name="cache_size")
+            SERVER_STATE.set_function(lambda: cache.hits, name="cache_hits")
+            SERVER_STATE.set_function(lambda: cache.misses, name="cache_misses")
+        if self.batcher is not None:
+            batcher = self.batcher
+            SERVER_STATE.set_function(lambda: batcher.queue_depth, name="batch_queue_depth")
+            SERVER_STATE.set_function(lambda: batcher.metrics.snapshot()["batch_size_avg"], name="batch_size_avg")
+            SERVER_STATE.set_function(lambda: batcher.metrics.snapshot()["wait_seconds_avg"], name="batch_wait_seconds_avg")
+            SERVER_STATE.set_function(lambda: batcher.metrics.snapshot()["wait_seconds_max"], name="batch_wait_seconds_max")
+
+    def update_model(self, model: RAGPretrainedModel) -> ModelState:
+        # A single reference assignment, so every request sees either the old or the new model and query search
+        previous = self.state
+        self.state = ModelState(model, self._query_search(model))
+        self.invalidate_cache()
+        return previous
+
+    def invalidate_cache(self) -> None:
+        self.index_version += 1
+        if self.cache is not None:
+            self.cache.clear()
+
+    @staticmethod
+    def to_filter(request_filter: Optional[Filter]) -> Optional[MetadataFilter]:
+        if request_filter is None:
+            return None
+        return MetadataFilter.create(request_filter.languages, request_filter.paths, request_filter.extensions)
+
+    def _cache_key(self, query: str, k: int, index: str = "",
+                   metadata_filter: Optional[MetadataFilter] = None) -> Tuple[str, int, str, Optional[MetadataFilter], int]:
+        return normalize_query(query), k, index, metadata_filter, self.index_version
+
+    def search(self, query: str, k: int, index: str = "", metadata_filter: Optional[MetadataFilter] = None) -> SearchResults:
+        if self.cache is not None:
+            with stage("cache"):
+                key = self._cache_key(query, k, index, metadata_filter)
+                cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        if self.batcher is not None:
+            # The batch is searched on the batcher thread, so the trace only sees the total wait
+            with stage("batch"):
+                results = self.batcher.search(query, k, index, metadata_filter)
+        else:
+            with stage("search"):
+                results = self.model_search([query], k, index, metadata_filter)[0]
+
+        if self.cache is not None:
+            self.cache.put(key, results)
+        return results
+
+    def model_search(self, queries: List[str], k: int, index: str = "",
+                     metadata_filter: Optional[MetadataFilter] = None) -> List[SearchResults]:
+        if self.shards is not None and not index:
+            return self.shards.search(queries, k, metadata_filter)
+        if index or self.model is None:
+            if self.indexes is None:
+                raise IndexNotFoundError(index)
+            return self.indexes.get(index).search(queries, k, metadata_filter)
+        with self.state.use() as state:
+            assert state.model is not None
+            if metadata_filter is not None or state.has_duplicates():
+                return state.filtered_search().search(queries, k, metadata_filter)
+            if state.query_search is not None:
+                return state.query_search.search(queries, k)
+            if len(queries) == 1:
+                return [state.model.search(query=queries[0], k=k)]
+            results: List[SearchResults] = state.model.search(query=queries, k=k)
+            return results
+
+    def search_batch(self, queries: List[str], ks: List[int], indexes: Optional[List[str]] = None,
+                     metadata_filters: Optional[List[Optional[MetadataFilter]]] = None) -> List[SearchResults]:
+        # Queries for the same index and filter sharing the same k are encoded and searched together in one model call
+        indexes = indexes or [""] * len(queries)
+        metadata_filters = metadata_filters or [None] * len(queries)
+        by_k: Dict[Tuple[str, int, Optional[MetadataFilter]], List[int]] = defaultdict(list)
+        for i, (index, k, metadata_filter) in enumerate(zip(indexes, ks, metadata_filters)):
+            by_k[index, k, metadata_filter].append(i)
+
+        results: List[SearchResults] = [[] for _ in queries]
+        for (index, k, metadata_filter), positions in by_k.items():
+            hits = self.model_search([queries[i] for i in positions], k, index, metadata_filter)
+            for i, query_hits in zip(positions, hits):
+                results[i] = query_hits
+        return results
+
+    def search_many(self, queries: List[str], ks: List[int], indexes: Optional[List[str]] = None,
+                    metadata_filters: Optional[List[Optional[MetadataFilter]]] = None) -> List[SearchResults]:
+        indexes = indexes or [""] * len(queries)
+        metadata_filters = metadata_filters or [None] * len(queries)
+        if self.cache is None:
+            return self.search_batch(queries, ks, indexes, metadata_filters)
+
+        keys = [self._cache_key(*args) for args in zip(queries, ks, indexes, metadata_filters)]
+        results: List[Optional[SearchResults]] = [self.cache.get(key) for key in keys]
+        misses = [i for i, cached in enumerate(results) if cached is None]
+        if misses:
+            found = self.search_batch([queries[i] for i in misses], [ks[i] for i in misses],
+                                      [indexes[i] for i in misses], [metadata_filters[i] for i in misses])
+            for i, hits in zip(misses, found):
+                results[i] = hits
+                self.cache.put(keys[i], hits)
+        return [hits or [] for hits in results]
+
+    @staticmethod
+    def to_document(doc: Dict[str, Any]) -> Document:
+        return Document(
+            page_content=doc["content"],
+            metadata=doc.get("document_metadata", {}),
+            score=doc.get("score")
+        )
+
+    @classmethod
+    def to_response(cls, results: SearchResults) -> Response:
+        with stage("convert"):
+            return Response(documents=[cls.to_document(doc) for doc in results])
+
+    def retrieve(self, request: Request) -> Response:
+        k = max(request.k, 1)
+        return self.to_response(self.search(request.query, k, request.index, self.to_filter(request.filter)))
+
+    def retrieve_stream(self, request: Request) -> Iterator[Document]:
+        k = max(request.k, 1)
+        for doc in self.search(request.query, k, request.index, self.to_filter(request.filter)):
+            yield self.to_document(doc)
+
+    def retrieve_batch(self, request: BatchRequest) -> BatchResponse:
+        if not request.requests:
+            return BatchResponse(responses=[])
+        results = self.search_many(
+            [r.query for r in request.requests],
+            [max(r.k, 1) for r in request.requests],
+            [r.index for r in request.requests],
+            [self.to_filter(r.filter) for r in request.requests])
+        return BatchResponse(responses=[self.to_response(hits) for hits in results])
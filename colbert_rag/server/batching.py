@@ -0,0 +1,129 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+from colbert_rag.metrics import BATCH_WAIT_SECONDS
+from colbert_rag.server.filters import MetadataFilter
+
+SearchBatchFn = Callable[[List[str], List[int], List[str], List[Optional[MetadataFilter]]], List[List[Dict[str, Any]]]]
+ResultFuture = Future[List[Dict[str, Any]]]
+
+class _Pending(NamedTuple):
+    query: str
+    k: int
+    index_name: str
+    metadata_filter: Optional[MetadataFilter]
+    future: ResultFuture
+    enqueued: float
+
+@dataclass
+class BatchingMetrics:
+    requests: int = 0
+    batches: int = 0
+    batch_size_sum: int = 0
+    batch_size_max: int = 0
+    wait_seconds_sum: float = 0.0
+    wait_seconds_max: float = 0.0
+    queue_depth: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, batch_size: int, waits: List[float], queue_depth: int) -> None:
+        with self._lock:
+            self.requests += batch_size
+            self.batches += 1
+            self.batch_size_sum += batch_size
+            self.batch_size_max = max(self.batch_size_max, batch_size)
+            self.wait_seconds_sum += sum(waits)
+            self.wait_seconds_max = max(self.wait_seconds_max, *waits)
+            self.queue_depth = queue_depth
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "batches": self.batches,
+                "batch_size_avg": self.batch_size_sum / self.batches if self.batches else 0.0,
+                "batch_size_max": self.batch_size_max,
+                "wait_seconds_avg": self.wait_seconds_sum / self.requests if self.requests else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+                "queue_depth": self.queue_depth,
+            }
+
+class MicroBatcher:
+    def __init__(self, search_batch: SearchBatchFn, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 client_errors: Tuple[Type[Exception], ...] = ()):
+        self.search_batch = search_batch
+        # Errors caused by the request (e.g. an unknown index) are returned to it without logging an error
+        self.client_errors = client_errors
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.metrics = BatchingMetrics()
+        self._queue: queue.Queue[_Pending | None] = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="colbertrag-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, query: str, k: int, index: str = "", metadata_filter: Optional[MetadataFilter] = None) -> ResultFuture:
+        future: ResultFuture = Future()
+        self._queue.put(_Pending(query, k, index, metadata_filter, future, time.monotonic()))
+        return future
+
+    def search(self, query: str, k: int, index: str = "",
+               metadata_filter: Optional[MetadataFilter] = None) -> List[Dict[str, Any]]:
+        return self.submit(query, k, index, metadata_filter).result()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first.enqueued + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._dispatch(batch)
+            if stop:
+                return
+
+    def _dispatch(self, batch: List[_Pending]) -> None:
+        now = time.monotonic()
+        waits = [now - p.enqueued for p in batch]
+        self.metrics.record(len(batch), waits, self._queue.qsize())
+        for wait in waits:
+            BATCH_WAIT_SECONDS.observe(wait)
+        # Each index, k and filter is searched on its own, so a failing group only fails its own requests
+        groups: Dict[Tuple[str, int, Optional[MetadataFilter]], List[_Pending]] = defaultdict(list)
+        for p in batch:
+            groups[p.index_name, p.k, p.metadata_filter].append(p)
+        for group in groups.values():
+            try:
+                results = self.search_batch([p.query for p in group], [p.k for p in group],
+                                            [p.index_name for p in group], [p.metadata_filter for p in group])
+            except Exception as e:
+                if not isinstance(e, self.client_errors):
+                    logging.error(f"Batched search of {len(group)} queries failed: {e}")
+                for p in group:
+                    p.future.set_exception(e)
+                continue
+            for p, result in zip(group, results):
+                p.future.set_result(result)
@@ -0,0 +1,146 @@
+import dataclasses
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+from ragatouille import RAGPretrainedModel
+from colbert_rag.duplicates import Duplicates
+from colbert_rag.metrics import stage
+from colbert_rag.server.cache import LRUCache, normalize_query
+from colbert_rag.server.filters import FILTER_CACHE_SIZE, FilterIndex, MetadataFilter
+
+SearchResults = List[Dict[str, Any]]
+
+# Searches a ragatouille PLAID index like RAGPretrainedModel.search, but keeps encoded queries in an
+# LRU cache so a repeated query, whatever its k, goes straight to candidate generation and scoring
+class QueryEmbeddingSearch:
+    def __init__(self, model: RAGPretrainedModel, cache_size: int, encode_lock: Optional[threading.Lock] = None):
+        self.colbert = model.model
+        self.cache: LRUCache[Any] = LRUCache(cache_size)
+        # The searcher's query_maxlen is shared mutable state, and so is the encoder when several indexes
+        # share one checkpoint
+        self._encode_lock = encode_lock or threading.Lock()
+        self.filters = FilterIndex(self.colbert)
+        self._masks: LRUCache[Any] = LRUCache(FILTER_CACHE_SIZE)
+        self._duplicates: Optional[Duplicates] = None
+
+    @property
+    def searcher(self) -> Any:
+        index = self.colbert.model_index
+        if index.searcher is None:
+            index._load_searcher(self.colbert.checkpoint, self.colbert.collection, self.colbert.index_name)
+        return index.searcher
+
+    @property
+    def duplicates(self) -> Duplicates:
+        # Locations of the copies deduplication left out of the index, read on the first search
+        if self._duplicates is None:
+            index_path = getattr(self.colbert, "index_path", None)
+            self._duplicates = Duplicates.load(str(index_path)) if index_path is not None else Duplicates()
+        return self._duplicates
+
+    @staticmethod
+    def _query_maxlen(query: str) -> int:
+        return int(len(query.split(" ")) * 1.35)
+
+    def encode(self, queries: List[str]) -> List[Any]:
+        keys = [normalize_query(query) for query in queries]
+        embeddings: List[Optional[Any]] = [self.cache.get(key) for key in keys]
+
+        # Query embeddings are padded to query_maxlen, so only queries with the same maxlen are encoded together
+        misses: Dict[int, List[int]] = defaultdict(list)
+        for i, Q in enumerate(embeddings):
+            if Q is None:
+                misses[self._query_maxlen(keys[i])].append(i)
+
+        for maxlen, positions in misses.items():
+            with self._encode_lock:
+                self.colbert.model_index._upgrade_searcher_maxlen(maxlen, self.colbert.base_model_max_tokens)
+                Q = self.searcher.encode([keys[i] for i in positions])
+            for offset, i in enumerate(positions):
+                embeddings[i] = Q[offset:offset + 1]
+                self.cache.put(keys[i], embeddings[i])
+        return embeddings
+
+    def _filter_fn(self, metadata_filter: MetadataFilter, pids: List[int]) -> Callable[[Any], Any]:
+        # Drops the candidates outside the filter before they are decompressed and scored
+        import torch
+        mask = self._masks.get(metadata_filter)
+        if mask is None:
+            mask = torch.zeros(len(self.searcher.collection), dtype=torch.bool)
+            mask[torch.tensor(pids, dtype=torch.long)] = True
+            self._masks.put(metadata_filter, mask)
+        return lambda candidates: candidates[mask.to(candidates.device)[candidates.long()]]
+
+    def _dense_search(self, Q: Any, k: int, metadata_filter: Optional[MetadataFilter] = None,
+                      pids: Optional[List[int]] = None) -> tuple:
+        searcher = self.searcher
+        base_ncells = searcher.config.ncells
+        base_ndocs = searcher.config.ndocs
+        ncells = min((k // 32 + 2), base_ncells) if k > (32 * base_ncells) else base_ncells
+        ndocs = max(k * 4, base_ndocs)
+
+        options: Dict[str, Any] = {}
+        if metadata_filter is not None and pids is not None:
+            # A filter selecting at most ndocs passages is handed to the ranker as the candidates, so none of
+            # them is missed; colbert still runs candidate generation for the centroid scores it prunes with.
+            # Larger filters keep the generated candidates and only score those inside the filter.
+            if len(pids) <= ndocs:
+                options["pids"] = pids
+            else:
+                options["filter_fn"] = self._filter_fn(metadata_filter, pids)
+
+        if ncells == base_ncells and ndocs == base_ndocs:
+            ranked: tuple = searcher.dense_search(Q, k, **options)
+            return ranked
+
+        # Same k-dependent settings ragatouille applies around each search, in a copy of the config for this
+        # search only, since concurrent searches share the searcher's
+        config = dataclasses.replace(searcher.config, ncells=ncells, ndocs=ndocs)
+        result_pids, scores = searcher.ranker.rank(config, Q, **options)
+        result_pids, scores = result_pids[:k], scores[:k]
+        return result_pids, list(range(1, len(result_pids) + 1)), scores
+
+    def _to_results(self, pids: List[int], ranks: List[int], scores: List[float]) -> SearchResults:
+        colbert = self.colbert
+        duplicates = self.duplicates
+        results = []
+        for pid, rank, score in zip(pids, ranks, scores):
+            document_id = colbert.pid_docid_map[pid]
+            content = colbert.collection[pid]
+            result = {
+                "content": content,
+                "score": score,
+                "rank": rank,
+                "document_id": document_id,
+                "passage_id": pid,
+            }
+            if colbert.docid_metadata_map is not None and document_id in colbert.docid_metadata_map:
+                result["document_metadata"] = colbert.docid_metadata_map[document_id]
+            locations = duplicates.locations(document_id, content)
+            if locations:
+                # Every other file with the same content, one path per line
+                result["document_metadata"] = {**result.get("document_metadata", {}), "duplicates": "\n".join(locations)}
+            results.append(result)
+        return results
+
+    def search(self, queries: List[str], k: int, metadata_filter: Optional[MetadataFilter] = None,
+               embeddings: Optional[List[Any]] = None) -> List[SearchResults]:
+        # embeddings are the queries already encoded, by another index with the same encoder
+        k = min(k, len(self.searcher.collection))
+        allowed = None
+        if metadata_filter is not None:
+            with stage("filter"):
+                allowed = self.filters.pids(metadata_filter)
+            if not allowed:
+                return [[] for _ in queries]
+            k = min(k, len(allowed))
+        if embeddings is None:
+            with stage("encode"):
+                embeddings = self.encode(queries)
+        results = []
+        for Q in embeddings:
+            with stage("candidate_search"):
+                pids, ranks, scores = self._dense_search(Q, k, metadata_filter, allowed)
+            with stage("materialize"):
+                results.append(self._to_results(pids, ranks, scores))
+        return results
@@ -1,28 +1,168 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import contextvars
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, TypeVar
+from fastapi import FastAPI, Header, HTTPException
+from fastapi import Response as HTTPResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.datastructures import MutableHeaders
 import uvicorn
+from ragatouille import RAGPretrainedModel
+from colbert_rag.config import COLBERTRAG_MAX_QUEUE, COLBERTRAG_MAX_WORKERS
+from colbert_rag.metrics import CONTENT_TYPE, REGISTRY, TRACE_HEADER, format_trace, observe_request, trace, trace_requested
 from colbert_rag.server.base import BaseServer
-from colbert_rag.models import Request, Response, Document
+from colbert_rag.server.indexes import IndexNotFoundError, IndexPool
+from colbert_rag.server.loader import load_model
+from colbert_rag.server.reload import IndexReloader
+from colbert_rag.models import BatchRequest, BatchResponse, ReloadRequest, ReloadResponse, Request, Response
+
+T = TypeVar("T")
 
 class FastAPIServer(BaseServer):
-    def retrieve(self, request: Request) -> Response:
-        k = max(request.k, 1)
-        documents = [
-            Document(
-                page_content=doc["content"],
-                metadata=doc.get("document_metadata", {})
-            )
-            for doc in self.model.search(query=request.query, k=k)
-        ]
-        return Response(documents=documents)
+    def __init__(self,
+                 model: Optional[RAGPretrainedModel],
+                 max_workers: int = COLBERTRAG_MAX_WORKERS,
+                 max_queue: int = COLBERTRAG_MAX_QUEUE,
+                 **kwargs: Any):
+        super().__init__(model, **kwargs)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
 
-    def serve(self, host: str, port: int) -> None:
-        app = FastAPI()
+    def create_app(self) -> FastAPI:
+        # Searches run off the event loop, at most max_workers at a time with max_queue more waiting
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="colbertrag-search")
+        inflight = 0
+
+        @asynccontextmanager
+        async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+            yield
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        app = FastAPI(lifespan=lifespan)
+
+        async def run(fn: Callable[..., T], *args: Any) -> T:
+            nonlocal inflight
+            if inflight >= self.max_workers + self.max_queue:
+                raise HTTPException(status_code=503, detail="Server is overloaded, retry later", headers={"Retry-After": "1"})
+            inflight += 1
+            try:
+                # Run in a copy of the request context so stage timings reach the request's trace
+                context = contextvars.copy_context()
+                return await asyncio.get_running_loop().run_in_executor(executor, context.run, fn, *args)
+            except HTTPException:
+                raise
+            except IndexNotFoundError as e:
+                raise HTTPException(status_code=404, detail=f"Index {e.args[0]!r} not found")
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+            finally:
+                inflight -= 1
+
+        async def run_traced(method: str, trace_header: Optional[str], headers: MutableHeaders | Dict[str, str],
+                             fn: Callable[..., T], *args: Any) -> T:
+            # Send "X-ColbertRAG-Trace: 1" to get the stage timings back in the same response header
+            enabled = trace_requested(trace_header)
+            with observe_request("fastapi", method), trace(enabled) as stages:
+                result = await run(fn, *args)
+            if enabled:
+                headers[TRACE_HEADER] = format_trace(stages)
+            return result
+
+        @app.get("/health")
+        async def health() -> Dict[str, Any]:
+            return {"status": "ok", "inflight": inflight}
+
+        @app.get("/indexes")
+        async def indexes() -> Dict[str, Any]:
+            if self.indexes is None:
+                return {"available": [], "loaded": []}
+            return {"available": self.indexes.available(), "loaded": self.indexes.loaded(),
+                    "memory_mb": self.indexes.used_mb}
+
+        @app.get("/metrics")
+        async def metrics() -> PlainTextResponse:
+            return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
 
         @app.post("/retrieve", response_model=Response)
-        async def retrieve(request: Request) -> Response:
+        async def retrieve(request: Request, response: HTTPResponse,
+                           x_colbertrag_trace: Optional[str] = Header(None)) -> Response:
+            return await run_traced("retrieve", x_colbertrag_trace, response.headers, self.retrieve, request)
+
+        @app.post("/retrieve_stream")
+        async def retrieve_stream(request: Request,
+                                  x_colbertrag_trace: Optional[str] = Header(None)) -> StreamingResponse:
+            # Search off the event loop, then send one JSON document per line in rank order
+            headers: Dict[str, str] = {}
+            hits = await run_traced("retrieve_stream", x_colbertrag_trace, headers,
+                                    self.search, request.query, max(request.k, 1), request.index,
+                                    self.to_filter(request.filter))
+            return StreamingResponse(
+                (self.to_document(doc).model_dump_json() + "\n" for doc in hits),
+                media_type="application/x-ndjson", headers=headers)
+
+        @app.post("/retrieve_batch", response_model=BatchResponse)
+        async def retrieve_batch(request: BatchRequest, response: HTTPResponse,
+                                 x_colbertrag_trace: Optional[str] = Header(None)) -> BatchResponse:
+            return await run_traced("retrieve_batch", x_colbertrag_trace, response.headers, self.retrieve_batch, request)
+
+        @app.post("/admin/reload", response_model=ReloadResponse)
+        async def reload(request: ReloadRequest) -> ReloadResponse:
+            # Awaited on the event loop, the new index loads on the reloader's thread without taking a search worker
+            if self.reloader is None or not self.reloader.admin:
+                raise HTTPException(status_code=404, detail="Reload requests are not accepted by this server")
+            future = self.reloader.reload(request.index)
+            if not request.wait:
+                return ReloadResponse(version=self.index_version)
             try:
-                return self.retrieve(request)
+                return ReloadResponse(version=await asyncio.wrap_future(future))
+            except IndexNotFoundError as e:
+                raise HTTPException(status_code=404, detail=f"Index {e.args[0]!r} not found")
             except Exception as e:
                 raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-        uvicorn.run(app, host=host, port=port)
\ No newline at end of file
+        return app
+
+    def serve(self, host: str, port: int) -> None:
+        uvicorn.run(self.create_app(), host=host, port=port)
+
+    @staticmethod
+    def serve_index(index_path: Optional[str], host: str, port: int, workers: int = 1, mmap: bool = True,
+                    index_pool: Optional[Dict[str, Any]] = None, reload: Optional[Dict[str, Any]] = None,
+                    shards: Optional[List[str]] = None, **kwargs: Any) -> None:
+        # Each uvicorn worker loads the index itself through create_app; with mmap the workers
+        # share the index codes and residuals through the page cache instead of private copies.
+        # With index_pool (IndexPool arguments) each worker serves the indexes from its own pool.
+        # With reload ({"watch": seconds, "admin": bool}) each worker reloads its own copy of the index.
+        # With shards (shard server addresses) each worker fans out to the same shard servers.
+        os.environ["COLBERTRAG_INDEX_PATH"] = index_path or ""
+        os.environ["COLBERTRAG_INDEX_MMAP"] = "1" if mmap else ""
+        os.environ["COLBERTRAG_INDEX_POOL"] = json.dumps(index_pool)
+        os.environ["COLBERTRAG_RELOAD"] = json.dumps(reload)
+        os.environ["COLBERTRAG_SHARDS"] = json.dumps(shards)
+        os.environ["COLBERTRAG_SERVER_OPTIONS"] = json.dumps(kwargs)
+        uvicorn.run("colbert_rag.server.fastapi:create_app", factory=True, host=host, port=port, workers=workers)
+
+def create_app() -> FastAPI:
+    options = json.loads(os.environ.get("COLBERTRAG_SERVER_OPTIONS", "{}"))
+    index_pool = json.loads(os.environ.get("COLBERTRAG_INDEX_POOL", "null"))
+    reload = json.loads(os.environ.get("COLBERTRAG_RELOAD", "null"))
+    shards = json.loads(os.environ.get("COLBERTRAG_SHARDS", "null"))
+    index_path: Optional[str] = None
+    mmap = bool(os.environ.get("COLBERTRAG_INDEX_MMAP"))
+    if shards is not None:
+        # Only a sharded index needs the gRPC client
+        from colbert_rag.server.shards import RemoteShard, ShardedSearch
+        server = FastAPIServer(None, shards=ShardedSearch([RemoteShard(address) for address in shards]), **options)
+    elif index_pool is not None:
+        server = FastAPIServer(None, indexes=IndexPool(**index_pool), **options)
+    else:
+        index_path = os.environ["COLBERTRAG_INDEX_PATH"]
+        server = FastAPIServer(load_model(index_path, mmap=mmap), **options)
+    if reload is not None:
+        server.reloader = IndexReloader(server, index_path, mmap, admin=reload.get("admin", False))
+        if reload.get("watch"):
+            server.reloader.watch(reload["watch"])
+    return server.create_app()
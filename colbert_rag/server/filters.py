@@ -0,0 +1,113 @@
+import fnmatch
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from colbert_rag.server.cache import LRUCache
+
+# Number of filters whose passage ids are kept
+FILTER_CACHE_SIZE = 256
+
+class MetadataFilter(NamedTuple):
+    # Values within a field are alternatives, fields are combined; an empty field does not filter
+    languages: tuple = ()
+    paths: tuple = ()
+    extensions: tuple = ()
+
+    @classmethod
+    def create(cls, languages: Iterable[str] = (), paths: Iterable[str] = (),
+               extensions: Iterable[str] = ()) -> Optional["MetadataFilter"]:
+        normalized = cls(
+            tuple(sorted({language.upper() for language in languages if language})),
+            tuple(sorted({path for path in paths if path})),
+            tuple(sorted({_extension(extension) for extension in extensions if extension})))
+        return normalized if any(normalized) else None
+
+def _extension(extension: str) -> str:
+    extension = extension.lower()
+    return extension if extension.startswith(".") else f".{extension}"
+
+def _path_matches(pattern: str, path: str) -> bool:
+    # A pattern ending in / is a directory prefix, anything else a glob over the whole path
+    if pattern.endswith("/"):
+        return path.startswith(pattern)
+    return fnmatch.fnmatchcase(path, pattern)
+
+class FilterIndex:
+    # Inverted index from language and extension to documents, and from documents to passage ids, built
+    # from the index's metadata on the first filtered search. Path globs are matched against the document
+    # paths (one per file, not per passage), and the passage ids of each filter are cached.
+    def __init__(self, colbert: Any):
+        self.colbert = colbert
+        self.cache: LRUCache[List[int]] = LRUCache(FILTER_CACHE_SIZE)
+        self._lock = threading.Lock()
+        self._built = False
+        self._paths: List[str] = []
+        self._document_pids: List[List[int]] = []
+        self._by_language: Dict[str, List[int]] = defaultdict(list)
+        self._by_extension: Dict[str, List[int]] = defaultdict(list)
+
+    def _build_from_store(self, store: Any) -> None:
+        # Groups documents by the interned language and extension codes, decoding each distinct value once
+        metadata_map = store.docid_metadata_map
+        self._document_pids = [[] for _ in range(len(store.document_ids))]
+        for pid, position in enumerate(store.pid_documents):
+            self._document_pids[position].append(pid)
+        path_codes = metadata_map.column("path") if metadata_map is not None else None
+        self._paths = [metadata_map.value_table[code] if path_codes is not None and (code := path_codes[i]) >= 0
+                       else store.document_ids[i] for i in range(len(store.document_ids))]
+
+        for key, index in (("language", self._by_language), ("extension", self._by_extension)):
+            codes = metadata_map.column(key) if metadata_map is not None else None
+            by_code: Dict[int, List[int]] = defaultdict(list)
+            for position in range(len(self._paths)):
+                code = codes[position] if codes is not None else -1
+                if code >= 0:
+                    by_code[code].append(position)
+                elif key == "extension":
+                    index[_extension(os.path.splitext(self._paths[position])[1])].append(position)
+            for code, positions in by_code.items():
+                value = metadata_map.value_table[code]
+                index[value.upper() if key == "language" else _extension(value)].extend(positions)
+        self._built = True
+
+    def _build(self) -> None:
+        colbert = self.colbert
+        store = getattr(colbert, "store", None)
+        if store is not None:
+            return self._build_from_store(store)
+        metadata_map = colbert.docid_metadata_map or {}
+        for document_id, pids in colbert.docid_pid_map.items():
+            metadata = metadata_map.get(document_id) or {}
+            path = metadata.get("path", document_id)
+            position = len(self._paths)
+            self._paths.append(path)
+            self._document_pids.append(list(pids))
+            if "language" in metadata:
+                self._by_language[metadata["language"].upper()].append(position)
+            self._by_extension[_extension(metadata.get("extension") or os.path.splitext(path)[1])].append(position)
+        self._built = True
+
+    def _documents(self, metadata_filter: MetadataFilter) -> Iterable[int]:
+        selected: Optional[set] = None
+        for field, index in ((metadata_filter.languages, self._by_language),
+                             (metadata_filter.extensions, self._by_extension)):
+            if field:
+                documents = {position for value in field for position in index.get(value, ())}
+                selected = documents if selected is None else selected & documents
+        candidates = selected if selected is not None else range(len(self._paths))
+        if metadata_filter.paths:
+            return [position for position in candidates
+                    if any(_path_matches(pattern, self._paths[position]) for pattern in metadata_filter.paths)]
+        return candidates
+
+    def pids(self, metadata_filter: MetadataFilter) -> List[int]:
+        cached = self.cache.get(metadata_filter)
+        if cached is not None:
+            return cached
+        with self._lock:
+            if not self._built:
+                self._build()
+        pids = sorted(pid for position in self._documents(metadata_filter) for pid in self._document_pids[position])
+        self.cache.put(metadata_filter, pids)
+        return pids
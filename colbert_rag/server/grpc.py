@@ -1,44 +1,141 @@
 import grpc
 
 from concurrent import futures
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional
+from colbert_rag.metrics import TRACE_HEADER, format_trace, observe_request, stage, start_metrics_server, trace, trace_requested
 from colbert_rag.server.base import BaseServer
-from colbert_rag.models import Request, Response, Document
+from colbert_rag.server.filters import MetadataFilter
+from colbert_rag.server.indexes import IndexNotFoundError
 from colbert_rag.proto import colbertrag_pb2, colbertrag_pb2_grpc
 
+def to_proto_response(results: List[Dict[str, Any]],
+                      response: colbertrag_pb2.Response | None = None) -> colbertrag_pb2.Response:
+    # Build the protobuf directly from the search hits, without an intermediate pydantic Response
+    response = response if response is not None else colbertrag_pb2.Response()
+    for doc in results:
+        response.documents.add(page_content=doc["content"], metadata=doc.get("document_metadata", {}),
+                                score=doc.get("score", 0.0))
+    return response
+
+def to_proto_document(doc: Dict[str, Any]) -> colbertrag_pb2.Document:
+    return colbertrag_pb2.Document(page_content=doc["content"], metadata=doc.get("document_metadata", {}),
+                                   score=doc.get("score", 0.0))
+
+def _timed(name: str, fn: Optional[Callable[[Any], Any]]) -> Optional[Callable[[Any], Any]]:
+    if fn is None:
+        return None
+
+    def timed(value: Any) -> Any:
+        with stage(name):
+            return fn(value)
+    return timed
+
+class _TimedRegistration:
+    # Stands in for the grpc.Server in add_ColbertRAGServicer_to_server and registers the generated
+    # handlers with timed protobuf decoding and serialization
+    def __init__(self, server: grpc.Server):
+        self.server = server
+
+    def add_generic_rpc_handlers(self, handlers: Any) -> None:
+        pass
+
+    def add_registered_method_handlers(self, service: str, handlers: Mapping[str, grpc.RpcMethodHandler]) -> None:
+        timed = {
+            method: handler._replace(
+                request_deserializer=_timed("decode", handler.request_deserializer),
+                response_serializer=_timed("serialize", handler.response_serializer))
+            for method, handler in handlers.items()
+        }
+        self.server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(service, timed),))
+        self.server.add_registered_method_handlers(service, timed)
+
+@contextmanager
+def _instrument(method: str, context: grpc.ServicerContext) -> Iterator[None]:
+    # Send "x-colbertrag-trace: 1" metadata to get the stage timings back in the trailing metadata
+    enabled = trace_requested(dict(context.invocation_metadata()).get(TRACE_HEADER))
+    with observe_request("grpc", method), trace(enabled) as stages:
+        try:
+            yield
+        except IndexNotFoundError as e:
+            context.abort(grpc.StatusCode.NOT_FOUND, f"Index {e.args[0]!r} not found")
+    if enabled:
+        context.set_trailing_metadata(((TRACE_HEADER, format_trace(stages)),))
+
 class ColbertRAGServicer(colbertrag_pb2_grpc.ColbertRAGServicer):
-    def __init__(self, server):
+    def __init__(self, server: "GRPCServer"):
         self.server = server
 
-    def Retrieve(self, 
-                 request: colbertrag_pb2.Request, 
+    def Retrieve(self,
+                 request: colbertrag_pb2.Request,
                  context: grpc.ServicerContext) -> colbertrag_pb2.Response:
-        response = self.server.retrieve(Request(query=request.query, k=request.k))
-        return colbertrag_pb2.Response(
-            documents=[
-                colbertrag_pb2.Document(
-                    page_content=doc.page_content,
-                    metadata=doc.metadata
-                )
-                for doc in response.documents
-            ]
-        )
+        with _instrument("Retrieve", context):
+            return self.server.retrieve_proto(request)
 
+    def RetrieveStream(self,
+                       request: colbertrag_pb2.Request,
+                       context: grpc.ServicerContext) -> Iterator[colbertrag_pb2.Document]:
+        with _instrument("RetrieveStream", context):
+            documents = self.server.retrieve_stream_proto(request)
+        yield from documents
+
+    def RetrieveBatch(self,
+                      request: colbertrag_pb2.BatchRequest,
+                      context: grpc.ServicerContext) -> colbertrag_pb2.BatchResponse:
+        with _instrument("RetrieveBatch", context):
+            return self.server.retrieve_batch_proto(request)
+
+    def Reload(self,
+               request: colbertrag_pb2.ReloadRequest,
+               context: grpc.ServicerContext) -> colbertrag_pb2.ReloadResponse:
+        if self.server.reloader is None or not self.server.reloader.admin:
+            context.abort(grpc.StatusCode.FAILED_PRECONDITION, "Reload requests are not accepted by this server")
+        with _instrument("Reload", context):
+            return self.server.reload_proto(request)
+
+
+def to_metadata_filter(request: colbertrag_pb2.Request) -> Optional[MetadataFilter]:
+    if not request.HasField("filter"):
+        return None
+    return MetadataFilter.create(request.filter.languages, request.filter.paths, request.filter.extensions)
 
 class GRPCServer(BaseServer):
-    def retrieve(self, request: Request) -> Response:
-        k = max(request.k, 1)
-        documents = [
-            Document(
-                page_content=doc["content"],
-                metadata=doc.get("document_metadata", {})
-            )
-            for doc in self.model.search(query=request.query, k=k)
-        ]
-        return Response(documents=documents)
-
-    def serve(self, host: str, port: int, max_workers: int = 10) -> None:
+    def retrieve_proto(self, request: colbertrag_pb2.Request) -> colbertrag_pb2.Response:
+        results = self.search(request.query, max(request.k, 1), request.index, to_metadata_filter(request))
+        with stage("convert"):
+            return to_proto_response(results)
+
+    def retrieve_stream_proto(self, request: colbertrag_pb2.Request) -> Iterator[colbertrag_pb2.Document]:
+        # Search eagerly so the search is timed with the request, then convert as documents are sent
+        results = self.search(request.query, max(request.k, 1), request.index, to_metadata_filter(request))
+        return (to_proto_document(doc) for doc in results)
+
+    def retrieve_batch_proto(self, request: colbertrag_pb2.BatchRequest) -> colbertrag_pb2.BatchResponse:
+        response = colbertrag_pb2.BatchResponse()
+        if not request.requests:
+            return response
+        results = self.search_many(
+            [r.query for r in request.requests],
+            [max(r.k, 1) for r in request.requests],
+            [r.index for r in request.requests],
+            [to_metadata_filter(r) for r in request.requests])
+        with stage("convert"):
+            for hits in results:
+                to_proto_response(hits, response.responses.add())
+        return response
+
+    def reload_proto(self, request: colbertrag_pb2.ReloadRequest) -> colbertrag_pb2.ReloadResponse:
+        # The new index loads on the reloader's thread while this server keeps answering from the current one
+        assert self.reloader is not None
+        future = self.reloader.reload(request.index)
+        version = future.result() if request.wait else self.index_version
+        return colbertrag_pb2.ReloadResponse(version=version)
+
+    def serve(self, host: str, port: int, max_workers: int = 10, metrics_port: Optional[int] = None) -> None:
+        if metrics_port is not None:
+            start_metrics_server(host, metrics_port)
         server = grpc.server(futures.ThreadPoolExecutor(max_workers=max_workers))
-        colbertrag_pb2_grpc.add_ColbertRAGServicer_to_server(ColbertRAGServicer(self), server)
+        colbertrag_pb2_grpc.add_ColbertRAGServicer_to_server(ColbertRAGServicer(self), _TimedRegistration(server))
         server.add_insecure_port(f'{host}:{port}')
         server.start()
         server.wait_for_termination()
@@ -0,0 +1,136 @@
+import gc
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+from colbert_rag.config import COLBERTRAG_QUERY_CACHE_SIZE
+from colbert_rag.server.embedding import QueryEmbeddingSearch
+from colbert_rag.server.loader import SharedCheckpoints, load_model
+
+class IndexNotFoundError(KeyError):
+    pass
+
+class _LoadedIndex(NamedTuple):
+    search: QueryEmbeddingSearch
+    size_mb: float
+
+def index_size_mb(index_path: str) -> float:
+    # Size on disk of the index files, used as the estimate of what the index takes in memory
+    total = 0
+    for root, _, files in os.walk(index_path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+# Serves every index under index_root from one process. Indexes are loaded on first use with a single
+# encoder per checkpoint, and the least recently used ones are dropped to stay under memory_budget_mb.
+class IndexPool:
+    def __init__(self,
+                 index_root: str,
+                 memory_budget_mb: Optional[float] = None,
+                 query_cache_size: int = COLBERTRAG_QUERY_CACHE_SIZE,
+                 mmap: bool = False,
+                 default_index: str = ""):
+        self.index_root = index_root
+        self.memory_budget_mb = memory_budget_mb
+        self.query_cache_size = query_cache_size
+        self.mmap = mmap
+        self.default_index = default_index
+        self.checkpoints = SharedCheckpoints()
+        # Every index encodes queries with the same shared encoder
+        self.encode_lock = threading.Lock()
+        self._loaded: OrderedDict[str, _LoadedIndex] = OrderedDict()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def index_path(self, name: str) -> str:
+        name = name or self.default_index
+        # Index names come from requests, so never let them point outside index_root
+        if not name or name in (".", "..") or os.path.basename(name) != name:
+            raise IndexNotFoundError(name)
+        path = os.path.join(self.index_root, name)
+        if not os.path.isfile(os.path.join(path, "metadata.json")):
+            raise IndexNotFoundError(name)
+        return path
+
+    def available(self) -> List[str]:
+        if not os.path.isdir(self.index_root):
+            return []
+        return sorted(name for name in os.listdir(self.index_root)
+                      if os.path.isfile(os.path.join(self.index_root, name, "metadata.json")))
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._loaded)
+
+    @property
+    def used_mb(self) -> float:
+        with self._lock:
+            return sum(entry.size_mb for entry in self._loaded.values())
+
+    def get(self, name: str) -> QueryEmbeddingSearch:
+        name = name or self.default_index
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None:
+                self._loaded.move_to_end(name)
+                return entry.search
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Loads of different indexes run in parallel, concurrent first requests for one index wait for a single load
+        with load_lock:
+            with self._lock:
+                entry = self._loaded.get(name)
+            if entry is not None:
+                return entry.search
+
+            path = self.index_path(name)
+            size_mb = index_size_mb(path)
+            self._evict(size_mb)
+            logging.info(f"Loading index {name} ({size_mb:.0f} MB)")
+            model = load_model(path, mmap=self.mmap, checkpoints=self.checkpoints)
+            search = QueryEmbeddingSearch(model, self.query_cache_size, self.encode_lock)
+            with self._lock:
+                self._loaded[name] = _LoadedIndex(search, size_mb)
+            return search
+
+    def _evict(self, needed_mb: float) -> None:
+        if self.memory_budget_mb is None:
+            return
+        evicted = []
+        with self._lock:
+            used = sum(entry.size_mb for entry in self._loaded.values())
+            while self._loaded and used + needed_mb > self.memory_budget_mb:
+                name, entry = self._loaded.popitem(last=False)
+                used -= entry.size_mb
+                evicted.append(name)
+        if evicted:
+            # Requests still searching an evicted index keep it alive until they finish
+            logging.info(f"Evicted indexes {', '.join(evicted)} to stay under {self.memory_budget_mb:.0f} MB")
+            gc.collect()
+
+    def reload(self, name: str) -> bool:
+        # Loads a new version of a loaded index next to the old one and swaps it in; requests already
+        # searching the old version finish on it. Indexes that are not loaded pick up changes on first use.
+        name = name or self.default_index
+        with self._lock:
+            if name not in self._loaded:
+                return False
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            path = self.index_path(name)
+            size_mb = index_size_mb(path)
+            logging.info(f"Reloading index {name} ({size_mb:.0f} MB)")
+            model = load_model(path, mmap=self.mmap, checkpoints=self.checkpoints)
+            search = QueryEmbeddingSearch(model, self.query_cache_size, self.encode_lock)
+            with self._lock:
+                if name not in self._loaded:
+                    return False
+                self._loaded[name] = _LoadedIndex(search, size_mb)
+        gc.collect()
+        return True
+
+    def unload(self, name: str) -> None:
+        with self._lock:
+            self._loaded.pop(name, None)
+        gc.collect()
@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from colbert import Searcher
+from colbert.data import Collection
+from colbert.infra import ColBERTConfig
+from colbert.infra.run import Run
+from colbert.modeling.checkpoint import Checkpoint
+from colbert.search.index_storage import IndexScorer
+from ragatouille import RAGPretrainedModel
+from ragatouille.models.colbert import ColBERT
+from colbert_rag.docstore import open_document_store
+
+class SharedCheckpoints:
+    # One ColBERT encoder per checkpoint name, shared by every index built with it
+    def __init__(self) -> None:
+        self._checkpoints: Dict[str, Checkpoint] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, config: ColBERTConfig) -> Checkpoint:
+        with self._lock:
+            if name not in self._checkpoints:
+                logging.info(f"Loading checkpoint {name}")
+                checkpoint = Checkpoint(name, colbert_config=config, verbose=0)
+                if config.total_visible_gpus > 0:
+                    checkpoint = checkpoint.cuda()
+                self._checkpoints[name] = checkpoint
+            return self._checkpoints[name]
+
+class SharedCheckpointSearcher(Searcher):
+    # colbert's Searcher.__init__ always loads its own Checkpoint; this is the same setup with a given one
+    def __init__(self, index: str, checkpoint: Checkpoint, collection: Any, config: ColBERTConfig, index_root: str):
+        self.verbose = 0
+        initial_config = ColBERTConfig.from_existing(config, Run().config)
+        self.index = os.path.join(index_root, index)
+        self.index_config = ColBERTConfig.load_from_index(self.index)
+
+        checkpoint_name = self.index_config.checkpoint
+        self.checkpoint_config = ColBERTConfig.load_from_checkpoint(checkpoint_name)
+        self.config = ColBERTConfig.from_existing(self.checkpoint_config, self.index_config, initial_config)
+
+        self.collection = Collection.cast(collection or self.config.collection)
+        self.configure(checkpoint=checkpoint_name, collection=self.collection)
+
+        self.checkpoint = checkpoint
+        use_gpu = self.config.total_visible_gpus > 0
+        if self.config.load_index_with_mmap and use_gpu:
+            raise ValueError("Memory-mapped index can only be used with CPU!")
+        self.ranker = IndexScorer(self.index, use_gpu, self.config.load_index_with_mmap)
+
+def _configure_searcher(searcher: Searcher) -> None:
+    # Same search settings ragatouille applies when it loads a searcher itself
+    searcher.configure(ndocs=1024)
+    searcher.configure(ncells=16)
+    if len(searcher.collection) < 10000:
+        searcher.configure(ncells=8)
+        searcher.configure(centroid_score_threshold=0.4)
+    elif len(searcher.collection) < 100000:
+        searcher.configure(ncells=4)
+        searcher.configure(centroid_score_threshold=0.45)
+
+def _can_mmap(index_path: str) -> bool:
+    # colbert only memory-maps single-chunk indexes, and starts a new chunk every 25k passages
+    with open(os.path.join(index_path, "metadata.json")) as f:
+        num_chunks = json.load(f)["num_chunks"]
+    if num_chunks != 1:
+        logging.warning(f"Index {index_path} has {num_chunks} chunks and only a single chunk can be memory-mapped, "
+                        "loading its codes and residuals into memory instead. Coalesce it with "
+                        "colbert/utils/coalesce.py to memory-map it.")
+        return False
+    return True
+
+class StoreColBERT(ColBERT):
+    # Reads passages, document ids and metadata from the memory-mapped document store instead of the JSON files,
+    # so they are never held in memory as Python strings and dicts
+    def _get_collection_files_from_disk(self, index_path: Any) -> None:
+        store = open_document_store(str(index_path))
+        self.collection = store.passages
+        self.pid_docid_map = store.pid_docid_map
+        self.docid_metadata_map = store.docid_metadata_map
+        self.store = store
+
+    @property
+    def docid_pid_map(self) -> Dict[str, List[int]]:
+        return self.store.docid_pid_map
+
+    @docid_pid_map.setter
+    def docid_pid_map(self, value: Any) -> None:
+        pass
+
+def _load(index_path: str, mmap: bool, checkpoints: SharedCheckpoints, document_store: bool) -> RAGPretrainedModel:
+    # training_mode skips the encoder ragatouille loads for every index; the searcher gets the shared one
+    colbert_class = StoreColBERT if document_store else ColBERT
+    RAG = RAGPretrainedModel()
+    RAG.model = colbert = colbert_class(Path(index_path), load_from_index=True, training_mode=True, verbose=0)
+    checkpoint = checkpoints.get(colbert.checkpoint, colbert.config)
+    colbert.inference_ckpt = checkpoint
+    colbert.base_model_max_tokens = checkpoint.bert.config.max_position_embeddings - 4
+
+    collection = colbert.collection if isinstance(colbert.collection, list) else Collection(data=colbert.collection)
+    searcher = SharedCheckpointSearcher(
+        index=colbert.index_name,
+        checkpoint=checkpoint,
+        collection=collection,
+        config=ColBERTConfig(load_index_with_mmap=mmap),
+        index_root=colbert.model_index.config.root,
+    )
+    _configure_searcher(searcher)
+    colbert.model_index.searcher = searcher
+    return RAG
+
+def load_model(index_path: str, mmap: bool = False, checkpoints: Optional[SharedCheckpoints] = None,
+               document_store: bool = True) -> RAGPretrainedModel:
+    # Passages and metadata are mapped from the document store unless document_store is False; with mmap
+    # the index codes and residuals are mapped as well, so startup does not grow with the index and
+    # processes share the pages. Indexes with several chunks are loaded without mmap.
+    mmap = mmap and _can_mmap(index_path)
+    if checkpoints is None and not mmap and not document_store:
+        return RAGPretrainedModel.from_index(index_path)
+    RAG = _load(index_path, mmap, checkpoints or SharedCheckpoints(), document_store)
+    if mmap:
+        logging.info(f"Memory-mapped index from {index_path}")
+    return RAG
@@ -0,0 +1,97 @@
+import gc
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from colbert_rag.server.base import BaseServer
+from colbert_rag.server.loader import load_model
+
+Signature = Tuple[Tuple[str, int, int], ...]
+
+def index_signature(index_path: str) -> Signature:
+    # Names, sizes and modification times of the files ragatouille writes at the top of the index directory
+    try:
+        entries = [entry for entry in os.scandir(index_path) if entry.is_file()]
+    except FileNotFoundError:
+        return ()
+    return tuple(sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime_ns) for entry in entries))
+
+# Loads new index versions off the serving path and swaps them into the server. A reload is triggered
+# through reload() (the admin RPC and route, only served with admin) or by watch(), which polls the
+# index directory for changes.
+class IndexReloader:
+    def __init__(self, server: BaseServer, index_path: Optional[str] = None, mmap: bool = False,
+                 drain_timeout: float = 60.0, admin: bool = False):
+        self.server = server
+        self.index_path = index_path
+        self.mmap = mmap
+        self.admin = admin
+        self.drain_timeout = drain_timeout
+        # One reload at a time, queued behind each other
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="colbertrag-reload")
+        self._stop = threading.Event()
+
+    def reload(self, index: str = "") -> Future:
+        return self._executor.submit(self._reload, index)
+
+    def _reload(self, index: str) -> int:
+        start = time.perf_counter()
+        if index or self.index_path is None:
+            if self.server.indexes is None:
+                raise ValueError(f"Index {index!r} is not served by this server")
+            if self.server.indexes.reload(index):
+                self.server.invalidate_cache()
+                logging.info(f"Swapped in a new version of index {index} in {time.perf_counter() - start:.1f}s")
+            return self.server.index_version
+
+        model = load_model(self.index_path, mmap=self.mmap)
+        previous = self.server.update_model(model)
+        del model
+        logging.info(f"Swapped in index version {self.server.index_version} from {self.index_path} "
+                     f"in {time.perf_counter() - start:.1f}s, draining {previous.inflight} requests")
+        if not previous.drain(self.drain_timeout):
+            logging.warning(f"{previous.inflight} requests still use the previous index after {self.drain_timeout}s")
+        # Requests still running on the previous model keep it alive until they finish
+        del previous
+        gc.collect()
+        return self.server.index_version
+
+    def _changed(self, signatures: Dict[str, Signature], name: str, path: str) -> bool:
+        # A change is only acted on once the directory has stopped changing between two polls,
+        # so a reload never starts while the indexer is still writing
+        signature = index_signature(path)
+        previous = signatures.get(name)
+        signatures[name] = signature
+        pending = signatures.get(f"{name}\0pending")
+        if previous is not None and signature != previous:
+            signatures[f"{name}\0pending"] = signature
+            return False
+        if pending is not None and signature == pending:
+            del signatures[f"{name}\0pending"]
+            return True
+        return False
+
+    def watch(self, interval: float = 5.0) -> threading.Thread:
+        def run() -> None:
+            signatures: Dict[str, Signature] = {}
+            while not self._stop.wait(interval):
+                try:
+                    if self.index_path is not None and self._changed(signatures, "", self.index_path):
+                        self.reload().result()
+                    if self.server.indexes is not None:
+                        for name in self.server.indexes.loaded():
+                            if self._changed(signatures, name, self.server.indexes.index_path(name)):
+                                self.reload(name).result()
+                except Exception as e:
+                    logging.error(f"Reloading the index failed, still serving the previous version: {e}")
+
+        thread = threading.Thread(target=run, name="colbertrag-index-watcher", daemon=True)
+        thread.start()
+        logging.info(f"Watching for index changes every {interval}s")
+        return thread
+
+    def close(self) -> None:
+        self._stop.set()
+        self._executor.shutdown(wait=False)
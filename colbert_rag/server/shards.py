@@ -0,0 +1,134 @@
+import heapq
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from multiprocessing.process import BaseProcess
+from typing import Any, List, Optional, Protocol, Tuple
+import grpc
+from colbert_rag.config import COLBERTRAG_SHARD_START_TIMEOUT
+from colbert_rag.metrics import stage
+from colbert_rag.proto import colbertrag_pb2, colbertrag_pb2_grpc
+from colbert_rag.server.embedding import QueryEmbeddingSearch, SearchResults
+from colbert_rag.server.filters import MetadataFilter
+from colbert_rag.server.loader import SharedCheckpoints, load_model
+
+class Shard(Protocol):
+    def search(self, queries: List[str], k: int,
+               metadata_filter: Optional[MetadataFilter] = None) -> List[SearchResults]:
+        ...
+
+class LocalShard:
+    # Searches a shard index in this process, the stand-in for a shard server
+    def __init__(self, index_path: str, checkpoints: SharedCheckpoints, encode_lock: threading.Lock,
+                 query_cache_size: int = 0, mmap: bool = False):
+        self.index_path = index_path
+        self.query_search = QueryEmbeddingSearch(
+            load_model(index_path, mmap=mmap, checkpoints=checkpoints), query_cache_size, encode_lock)
+
+    def search(self, queries: List[str], k: int, metadata_filter: Optional[MetadataFilter] = None,
+               embeddings: Optional[List[Any]] = None) -> List[SearchResults]:
+        return self.query_search.search(queries, k, metadata_filter, embeddings)
+
+class RemoteShard:
+    # A shard served by a gRPC server, in a local process or on another node
+    def __init__(self, address: str):
+        self.address = address
+        self.channel = grpc.insecure_channel(address)
+        self.stub = colbertrag_pb2_grpc.ColbertRAGStub(self.channel)
+
+    def wait(self, timeout: float, process: Optional[BaseProcess] = None) -> None:
+        # Waits for the server to accept connections, giving up early if its process has exited
+        ready = grpc.channel_ready_future(self.channel)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                ready.result(timeout=max(min(1.0, deadline - time.monotonic()), 0))
+                return
+            except grpc.FutureTimeoutError:
+                if process is not None and not process.is_alive():
+                    raise RuntimeError(f"Shard server {self.address} exited with code {process.exitcode}")
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Shard server {self.address} did not start within {timeout}s")
+
+    def search(self, queries: List[str], k: int,
+               metadata_filter: Optional[MetadataFilter] = None) -> List[SearchResults]:
+        request_filter = colbertrag_pb2.Filter(
+            languages=metadata_filter.languages, paths=metadata_filter.paths,
+            extensions=metadata_filter.extensions) if metadata_filter is not None else None
+        response = self.stub.RetrieveBatch(colbertrag_pb2.BatchRequest(
+            requests=[colbertrag_pb2.Request(query=query, k=k, filter=request_filter) for query in queries]))
+        return [[{
+            "content": document.page_content,
+            "score": document.score,
+            "rank": rank,
+            "document_id": document.metadata.get("path", ""),
+            "document_metadata": dict(document.metadata),
+        } for rank, document in enumerate(hits.documents, start=1)] for hits in response.responses]
+
+def merge_results(shard_results: List[SearchResults], k: int) -> SearchResults:
+    # ColBERT scores are sums of query token similarities with one encoder, so they compare across shards
+    merged = heapq.nlargest(k, chain.from_iterable(shard_results), key=lambda result: result["score"])
+    return [{**result, "rank": rank} for rank, result in enumerate(merged, start=1)]
+
+class ShardedSearch:
+    # Fans every search out to all shards at once and merges their top-k by score. Shards in this process
+    # share one encoder, so their queries are encoded once, by the first of them, instead of once per shard.
+    def __init__(self, shards: List[Shard]):
+        self.shards = shards
+        self._encoder = next((shard.query_search for shard in shards if isinstance(shard, LocalShard)), None)
+        self._executor = ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="colbertrag-shard")
+
+    @staticmethod
+    def _search_shard(shard: Shard, queries: List[str], k: int, metadata_filter: Optional[MetadataFilter],
+                      embeddings: Optional[List[Any]]) -> List[SearchResults]:
+        if isinstance(shard, LocalShard):
+            return shard.search(queries, k, metadata_filter, embeddings)
+        return shard.search(queries, k, metadata_filter)
+
+    def search(self, queries: List[str], k: int,
+               metadata_filter: Optional[MetadataFilter] = None) -> List[SearchResults]:
+        embeddings = None
+        if self._encoder is not None:
+            with stage("encode"):
+                embeddings = self._encoder.encode(queries)
+        with stage("scatter_gather"):
+            futures = [self._executor.submit(self._search_shard, shard, queries, k, metadata_filter, embeddings)
+                       for shard in self.shards]
+            shard_results = [future.result() for future in futures]
+        with stage("merge"):
+            return [merge_results([results[i] for results in shard_results], k) for i in range(len(queries))]
+
+def _serve_shard(index_path: str, host: str, port: int, mmap: bool, query_cache_size: int) -> None:
+    # Runs in a shard server process
+    from colbert_rag.server.grpc import GRPCServer
+    logging.basicConfig(level=logging.INFO)
+    GRPCServer(load_model(index_path, mmap=mmap), query_cache_size=query_cache_size).serve(host, port)
+
+def start_shard_servers(index_paths: List[str], host: str, base_port: int, mmap: bool = False,
+                        query_cache_size: int = 0,
+                        timeout: float = COLBERTRAG_SHARD_START_TIMEOUT) -> Tuple[List[BaseProcess], List[RemoteShard]]:
+    # One gRPC server process per shard on consecutive ports, each with its own encoder and searcher.
+    # All of them are stopped if one exits or does not start within timeout seconds.
+    context = multiprocessing.get_context("spawn")
+    processes: List[BaseProcess] = []
+    shards = []
+    for offset, index_path in enumerate(index_paths):
+        port = base_port + offset
+        process = context.Process(target=_serve_shard, args=(index_path, host, port, mmap, query_cache_size),
+                                  name=f"colbertrag-shard-{offset}", daemon=True)
+        process.start()
+        processes.append(process)
+        shards.append(RemoteShard(f"{host}:{port}"))
+    deadline = time.monotonic() + timeout
+    try:
+        for started, shard in zip(processes, shards):
+            shard.wait(max(deadline - time.monotonic(), 0), started)
+    except Exception:
+        for started in processes:
+            started.terminate()
+        raise
+    logging.info(f"Started {len(shards)} shard servers on ports {base_port}-{base_port + len(shards) - 1}")
+    return processes, shards
@@ -0,0 +1,44 @@
+import hashlib
+import json
+import os
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from colbert_rag.data.git_repo import Collections
+
+# A sharded index is a directory holding this file, which lists the shard indexes built next to it
+SHARDS_FILENAME = "colbertrag_shards.json"
+
+def shard_of(document_id: str, num_shards: int) -> int:
+    # By path hash, so a file stays in its shard across builds and incremental updates stay within one shard
+    return int(hashlib.md5(document_id.encode()).hexdigest()[:8], 16) % num_shards
+
+def shard_name(index_name: str, shard: int) -> str:
+    return f"{index_name}-shard{shard}"
+
+def split_collections(collections: "Collections", num_shards: int) -> List["Collections"]:
+    shards: List["Collections"] = [{} for _ in range(num_shards)]
+    for lang, (documents, document_ids, metadatas) in collections.items():
+        for document, document_id, metadata in zip(documents, document_ids, metadatas):
+            shard = shards[shard_of(document_id, num_shards)].setdefault(lang, ([], [], []))
+            shard[0].append(document)
+            shard[1].append(document_id)
+            shard[2].append(metadata)
+    return shards
+
+def save_shards(index_path: str, shards: List[str]) -> None:
+    os.makedirs(index_path, exist_ok=True)
+    path = os.path.join(index_path, SHARDS_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({"version": 1, "shards": shards}, f, indent=1)
+    os.replace(tmp_path, path)
+
+def load_shards(index_path: str) -> Optional[List[str]]:
+    # The names of the shard indexes, None when index_path is not a sharded index
+    path = os.path.join(index_path, SHARDS_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        shards: List[str] = json.load(f)["shards"]
+    return shards
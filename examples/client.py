@@ -1,15 +1,115 @@
+import argparse
+import http.client
+import json
+import threading
+import time
 import grpc
 from colbert_rag.proto import colbertrag_pb2, colbertrag_pb2_grpc
 
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="ColbertRAG client")
+    parser.add_argument("--type", choices=['grpc', 'fastapi'], default='grpc', help="Server type (default: grpc)")
+    parser.add_argument("--host", type=str, default="localhost", help="Server host")
+    parser.add_argument("--port", type=int, help="Server port (default: 50051 for grpc, 8000 for fastapi)")
+    parser.add_argument("--query", type=str, default="What are the parameters of the prepare method?", help="Query to send")
+    parser.add_argument("--k", type=int, default=3, help="Number of documents to retrieve")
+    parser.add_argument("--index", type=str, default="", help="Index to search on a --multi_index server (default: the server's default index)")
+    parser.add_argument("--language", type=str, action="append", default=[], help="Only return documents in this language (repeatable)")
+    parser.add_argument("--path", type=str, action="append", default=[], help="Only return documents whose path matches this glob, or starts with it when it ends in / (repeatable)")
+    parser.add_argument("--extension", type=str, action="append", default=[], help="Only return documents with this extension (repeatable)")
+    return parser.parse_args()
+
+class GRPCClient:
+    def __init__(self, host, port):
+        self.channel = grpc.insecure_channel(f'{host}:{port}')
+        self.stub = colbertrag_pb2_grpc.ColbertRAGStub(self.channel)
+
+    def wait_ready(self, timeout):
+        grpc.channel_ready_future(self.channel).result(timeout=timeout)
+
+    def retrieve(self, query, k, index="", filter=None):
+        # The Response message, see documents() for the hits
+        return self.stub.Retrieve(colbertrag_pb2.Request(
+            query=query, k=k, index=index, filter=colbertrag_pb2.Filter(**filter) if filter else None))
+
+    @staticmethod
+    def documents(response):
+        return [(doc.page_content, dict(doc.metadata)) for doc in response.documents]
+
+    def close(self):
+        self.channel.close()
+
+class FastAPIClient:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        # One keep-alive connection per thread
+        self.local = threading.local()
+
+    def _connection(self):
+        if not hasattr(self.local, "connection"):
+            self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return self.local.connection
+
+    def wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=1)
+                connection.request("GET", "/health")
+                if connection.getresponse().status == 200:
+                    return
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"FastAPI server on {self.host}:{self.port} did not become ready")
+            time.sleep(0.5)
+
+    def retrieve(self, query, k, index="", filter=None):
+        # The JSON response body, see documents() for the hits
+        connection = self._connection()
+        connection.request("POST", "/retrieve", body=json.dumps({"query": query, "k": k, "index": index, "filter": filter}),
+                           headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}: {body[:200]!r}")
+        return body
+
+    @staticmethod
+    def documents(body):
+        return [(doc["page_content"], doc["metadata"]) for doc in json.loads(body)["documents"]]
+
+    def close(self):
+        if hasattr(self.local, "connection"):
+            self.local.connection.close()
+
+def _retrieve(client, query, k, index, filter):
+    try:
+        return client.documents(client.retrieve(query, k, index, filter))
+    finally:
+        client.close()
+
+def retrieve_grpc(host, port, query, k, index="", filter=None):
+    return _retrieve(GRPCClient(host, port), query, k, index, filter)
+
+def retrieve_fastapi(host, port, query, k, index="", filter=None):
+    return _retrieve(FastAPIClient(host, port), query, k, index, filter)
+
 def run():
-    with grpc.insecure_channel('localhost:50051') as channel:
-        stub = colbertrag_pb2_grpc.ColbertRAGStub(channel)
-        response = stub.Retrieve(colbertrag_pb2.Request(query="What are the parameters of the prepare method?", k=3))
-        print("ColbertRAG client received:")
-        for doc in response.documents:
-            print(f"Page content: {doc.page_content}")
-            print(f"Metadata: {doc.metadata}")
-            print("---")
+    args = parse_arguments()
+    filter = None
+    if args.language or args.path or args.extension:
+        filter = {"languages": args.language, "paths": args.path, "extensions": args.extension}
+    if args.type == 'grpc':
+        documents = retrieve_grpc(args.host, args.port or 50051, args.query, args.k, args.index, filter)
+    else:
+        documents = retrieve_fastapi(args.host, args.port or 8000, args.query, args.k, args.index, filter)
+    print("ColbertRAG client received:")
+    for page_content, metadata in documents:
+        print(f"Page content: {page_content}")
+        print(f"Metadata: {metadata}")
+        print("---")
 
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    run()
@@ -1,6 +1,6 @@
 import argparse
 import logging
-from colbert_rag.indexer.git_repo import index_git_repo
+from colbert_rag.data.filters import FileFilter
 
 def parse_list(s):
     if s:
@@ -10,17 +10,40 @@ def parse_list(s):
 def parse_arguments():
     parser = argparse.ArgumentParser(description="ColbertRAG indexer")
     parser.add_argument("--name", type=str, help="The name of the index")
-    parser.add_argument("--repo_name", type=str, help="The name of the GitHub repository in the format username/repo-name")
+    parser.add_argument("--repo_name", type=str, help="GitHub repository as username/repo-name, a clone URL, or the path of a local working tree or bare mirror")
+    parser.add_argument("--revision", type=str, help="Read files at this commit, branch or tag from git objects instead of a checkout")
     parser.add_argument("--chunk_size", type=int, default=256, help="Port to run the server on (default: 256)")
     parser.add_argument("--log_level", type=str, default="INFO", help="Log level (default: INFO)")
     parser.add_argument("--use_faiss", type=bool, default=False, help="Use Faiss for indexing (default: True)")
     parser.add_argument("--ext_blacklist", type=parse_list, default=".gitignore", help="Blacklisted file extensions (default: .gitignore)")
     parser.add_argument("--dir_blacklist", type=parse_list, default=".git,.github", help="Blacklisted directories (default: .git, .github)")
+    parser.add_argument("--incremental", action="store_true", help="Only re-index files whose md5 hash changed since the last run")
+
+    parser.add_argument("--chunk_workers", type=int, help="Processes used to split documents into chunks (default: CPU count, 0 to split in-process)")
+    parser.add_argument("--index_unsupported", action="store_true", help="Index files in languages without a dedicated splitter with a generic text splitter")
+
+    parser.add_argument("--max_file_size", type=int, default=FileFilter.max_file_size, help="Skip files larger than this many bytes (default: 1000000)")
+    parser.add_argument("--max_line_length", type=int, default=FileFilter.max_line_length, help="Skip files with a line longer than this (default: 4000)")
+    parser.add_argument("--max_average_line_length", type=int, default=FileFilter.max_average_line_length, help="Skip files whose lines are this long on average, e.g. minified code (default: 200)")
+    parser.add_argument("--max_entropy", type=float, help="Skip files whose bytes have more entropy than this, in bits per byte (e.g. 5.5 for base64 dumps, default: off)")
+    parser.add_argument("--keep_generated", action="store_true", help="Index generated files (lockfiles, minified bundles, linguist-generated)")
+    parser.add_argument("--keep_vendored", action="store_true", help="Index vendored files (node_modules, vendor, linguist-vendored)")
+    parser.add_argument("--no_file_filter", action="store_true", help="Index every text file, without size or content checks")
+
+    parser.add_argument("--dedup", action="store_true", help="Index one copy of duplicated files and passages")
+    parser.add_argument("--near_duplicates", type=float, help="With --dedup, also collapse passages whose word shingles are at least this similar (Jaccard, e.g. 0.8, default: off)")
+    parser.add_argument("--keep_duplicate_passages", action="store_true", help="With --dedup, only collapse duplicated files and index every copy of a passage")
+    parser.add_argument("--num_shards", type=int, default=1, help="Split the index into this many shards by file path, built in parallel (default: 1)")
+    parser.add_argument("--shard_workers", type=int, help="Processes building shards at once (default: one per shard)")
+    parser.add_argument("--checkpoint", action="store_true", help="Save progress, so the same command resumes an interrupted build")
 
     return parser.parse_args()
 
 def create() -> None:
     args = parse_arguments()
+    # Imported once the arguments are valid, the indexer loads ragatouille and torch
+    from colbert_rag.indexer.dedup import Dedup
+    from colbert_rag.indexer.git_repo import index_git_repo
     path = index_git_repo(
         model_name="colbert-ir/colbertv2.0",
         index_name=args.name,
@@ -29,5 +52,22 @@ def create() -> None:
         dir_blacklist=args.dir_blacklist,
         max_document_length=args.chunk_size,
         use_faiss=args.use_faiss,
-        logging_level=args.log_level)
+        logging_level=args.log_level,
+        incremental=args.incremental,
+        chunk_workers=args.chunk_workers,
+        index_unsupported=args.index_unsupported,
+        revision=args.revision,
+        file_filter=None if args.no_file_filter else FileFilter(
+            max_file_size=args.max_file_size,
+            max_average_line_length=args.max_average_line_length,
+            max_line_length=args.max_line_length,
+            max_entropy=args.max_entropy,
+            skip_generated=not args.keep_generated,
+            skip_vendored=not args.keep_vendored),
+        dedup=None if not args.dedup else Dedup(
+            passages=not args.keep_duplicate_passages,
+            near_threshold=args.near_duplicates),
+        checkpoint=args.checkpoint,
+        num_shards=args.num_shards,
+        shard_workers=args.shard_workers)
     print(f'Index {args.name} created at {path}')
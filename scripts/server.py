@@ -1,23 +1,47 @@
 import argparse
-from ragatouille import RAGPretrainedModel
-from colbert_rag.server.grpc import GRPCServer
-from colbert_rag.server.fastapi import FastAPIServer
+import threading
+from colbert_rag.shards import load_shards
 from colbert_rag.config import (
     RAGATOUILLE_PATH, COLBERTRAG_GRPC_PORT, COLBERTRAG_FASTAPI_PORT,
-    COLBERTRAG_HOST, COLBERTRAG_MAX_WORKERS
+    COLBERTRAG_HOST, COLBERTRAG_MAX_WORKERS, COLBERTRAG_MAX_QUEUE,
+    COLBERTRAG_MAX_BATCH_SIZE, COLBERTRAG_BATCH_WAIT_MS, COLBERTRAG_CACHE_SIZE, COLBERTRAG_CACHE_TTL,
+    COLBERTRAG_QUERY_CACHE_SIZE, COLBERTRAG_SHARD_BASE_PORT, COLBERTRAG_SHARD_START_TIMEOUT
 )
 import logging
 
+# The servers, the model loader and their dependencies (torch, grpc, fastapi) are imported in run() on the path
+# that uses them, so --help and argument errors return at once and each transport only loads its own
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description="ColbertRAG server")
     parser.add_argument("--type", choices=['grpc', 'fastapi'], default='grpc', help="Server type (default: grpc)")
     parser.add_argument("--host", type=str, default=COLBERTRAG_HOST, help="Host to bind the server to")
-    parser.add_argument("--index", type=str, required=True, help="Path to the ColbertRAG index")
+    parser.add_argument("--index", type=str, help="Name of the ColbertRAG index under RAGATOUILLE_PATH (the default index with --multi_index)")
+    parser.add_argument("--multi_index", action="store_true", help="Serve every index under RAGATOUILLE_PATH, selected by the request's index field")
+    parser.add_argument("--memory_budget_mb", type=float, help="With --multi_index, unload the least recently used indexes to stay under this size (default: no limit)")
     parser.add_argument("--port", type=int, help="Port to run the server on")
     parser.add_argument("--max_workers", type=int, default=COLBERTRAG_MAX_WORKERS, help="Maximum number of workers")
+    parser.add_argument("--max_queue", type=int, default=COLBERTRAG_MAX_QUEUE, help="FastAPI requests allowed to wait for a worker before answering 503 (default: 100)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of FastAPI worker processes, which share one memory-mapped index (default: 1)")
+    parser.add_argument("--mmap", action="store_true", help="Memory-map the index codes and residuals instead of loading them into RAM")
+    parser.add_argument("--max_batch_size", type=int, default=COLBERTRAG_MAX_BATCH_SIZE, help="Batch concurrent queries up to this size (default: 0, disabled)")
+    parser.add_argument("--batch_wait_ms", type=float, default=COLBERTRAG_BATCH_WAIT_MS, help="Maximum time a query waits for a batch to fill (default: 5.0)")
+    parser.add_argument("--cache_size", type=int, default=COLBERTRAG_CACHE_SIZE, help="Number of query results to cache (default: 0, disabled)")
+    parser.add_argument("--cache_ttl", type=float, default=COLBERTRAG_CACHE_TTL, help="Seconds a cached result stays valid (default: no expiry)")
+    parser.add_argument("--query_cache_size", type=int, default=COLBERTRAG_QUERY_CACHE_SIZE, help="Number of encoded queries to cache (default: 0, disabled)")
+    parser.add_argument("--metrics_port", type=int, help="Serve Prometheus metrics for the gRPC server on this port (FastAPI serves /metrics itself)")
+    parser.add_argument("--watch", type=float, help="Reload the index when its directory changes, checking every this many seconds")
+    parser.add_argument("--admin", action="store_true", help="Accept reload requests (gRPC Reload, FastAPI POST /admin/reload)")
+    parser.add_argument("--shard_addresses", type=str, help="Comma-separated gRPC addresses of the shard servers of a sharded --index (default: start one local process per shard)")
+    parser.add_argument("--shard_base_port", type=int, default=COLBERTRAG_SHARD_BASE_PORT, help="First port of the local shard server processes (default: 50100)")
+    parser.add_argument("--in_process_shards", action="store_true", help="Search the shards of a sharded --index in this process instead of shard server processes")
+    parser.add_argument("--shard_start_timeout", type=float, default=COLBERTRAG_SHARD_START_TIMEOUT, help="Seconds the local shard server processes have to start serving before the server gives up (default: 600)")
     parser.add_argument("--log_level", type=str, default="INFO", help="Log level (default: INFO)")
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.index and not args.multi_index:
+        parser.error("--index is required unless --multi_index is set")
+    return args
 
 def run():
     args = parse_arguments()
@@ -25,13 +49,80 @@ def run():
 
     if args.port is None:
         args.port = COLBERTRAG_GRPC_PORT if args.type == 'grpc' else COLBERTRAG_FASTAPI_PORT
+    if args.type == 'fastapi' and args.workers > 1 and not args.mmap:
+        # Otherwise every worker would load a private copy of the index
+        logging.info(f"Memory-mapping the index so the {args.workers} workers share one copy (--mmap)")
+        args.mmap = True
+
+    index_path = f'{RAGATOUILLE_PATH}/{args.index}' if args.index else None
+    server_options = dict(
+        max_batch_size=args.max_batch_size, batch_wait_ms=args.batch_wait_ms,
+        cache_size=args.cache_size, cache_ttl=args.cache_ttl,
+        query_cache_size=args.query_cache_size)
+    # Indexes are loaded on first use, sharing one encoder checkpoint
+    index_pool = dict(
+        index_root=RAGATOUILLE_PATH, memory_budget_mb=args.memory_budget_mb,
+        query_cache_size=args.query_cache_size, mmap=args.mmap, default_index=args.index or "") if args.multi_index else None
+    reload = dict(watch=args.watch, admin=args.admin) if args.watch or args.admin else None
+
+    # A sharded index is searched on every shard, by shard servers or in this process, and the results merged
+    shard_names = load_shards(index_path) if index_path and index_pool is None else None
+    shard_addresses = args.shard_addresses.split(",") if args.shard_addresses else None
+    shards = None
+    if shard_names is not None:
+        from colbert_rag.server.shards import LocalShard, RemoteShard, ShardedSearch, start_shard_servers
+        if reload is not None:
+            logging.warning("Reloading is not supported for sharded indexes, ignoring --watch and --admin")
+            reload = None
+        shard_paths = [f'{RAGATOUILLE_PATH}/{name}' for name in shard_names]
+        if args.in_process_shards and shard_addresses is None and args.workers == 1:
+            from colbert_rag.server.loader import SharedCheckpoints
+            checkpoints, encode_lock = SharedCheckpoints(), threading.Lock()
+            shards = ShardedSearch([LocalShard(path, checkpoints, encode_lock, args.query_cache_size, args.mmap)
+                                    for path in shard_paths])
+        elif shard_addresses is None:
+            _, remote_shards = start_shard_servers(
+                shard_paths, "127.0.0.1", args.shard_base_port, args.mmap, args.query_cache_size,
+                args.shard_start_timeout)
+            shard_addresses = [shard.address for shard in remote_shards]
+        logging.info(f"Serving {index_path} from {len(shard_names)} shards")
 
-    RAG = RAGPretrainedModel.from_index(f'{RAGATOUILLE_PATH}/{args.index}')
-    logging.info(f"Loaded index from {RAGATOUILLE_PATH}/{args.index}")
+    if args.type == 'fastapi' and args.workers > 1:
+        from colbert_rag.server.fastapi import FastAPIServer
+        FastAPIServer.serve_index(
+            index_path, args.host, args.port, args.workers, args.mmap, index_pool, reload,
+            shards=shard_addresses if shard_names is not None else None,
+            max_workers=args.max_workers, max_queue=args.max_queue, **server_options)
+        return
+
+    RAG = None
+    indexes = None
+    if shard_names is not None:
+        if shards is None:
+            shards = ShardedSearch([RemoteShard(address) for address in shard_addresses])
+    elif index_pool is not None:
+        from colbert_rag.server.indexes import IndexPool
+        indexes = IndexPool(**index_pool)
+        logging.info(f"Serving {len(indexes.available())} indexes from {RAGATOUILLE_PATH}")
+    else:
+        from colbert_rag.server.loader import load_model
+        RAG = load_model(index_path, mmap=args.mmap)
+        logging.info(f"Loaded index from {index_path}")
+
+    if args.type == 'grpc':
+        from colbert_rag.server.grpc import GRPCServer
+        server = GRPCServer(RAG, indexes=indexes, shards=shards, **server_options)
+    else:
+        from colbert_rag.server.fastapi import FastAPIServer
+        server = FastAPIServer(RAG, args.max_workers, args.max_queue, indexes=indexes, shards=shards, **server_options)
+    if reload is not None:
+        from colbert_rag.server.reload import IndexReloader
+        # New index versions load in the background and replace the serving one once ready
+        server.reloader = IndexReloader(server, index_path if indexes is None else None, args.mmap, admin=args.admin)
+        if args.watch:
+            server.reloader.watch(args.watch)
 
     if args.type == 'grpc':
-        server = GRPCServer(RAG)
-        server.serve(args.host, args.port, args.max_workers)
-    elif args.type == 'fastapi':
-        server = FastAPIServer(RAG)
-        server.serve(args.host, args.port)
\ No newline at end of file
+        server.serve(args.host, args.port, args.max_workers, args.metrics_port)
+    else:
+        server.serve(args.host, args.port)
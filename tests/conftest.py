@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List
+import pytest
+
+class FakeRAG:
+    # Keeps the passages of one index in the JSON files ragatouille writes, so the document store can be built
+    index_path = ""
+    events: List[str] = []
+
+    @classmethod
+    def from_pretrained(cls, model_name: str) -> "FakeRAG":
+        return cls()
+
+    @classmethod
+    def from_index(cls, index_path: str) -> "FakeRAG":
+        cls.events.append("load")
+        return cls()
+
+    def _read(self) -> Any:
+        with open(os.path.join(self.index_path, "collection.json")) as f:
+            collection = json.load(f)
+        with open(os.path.join(self.index_path, "pid_docid_map.json")) as f:
+            pids = {int(pid): doc for pid, doc in json.load(f).items()}
+        return collection, pids
+
+    def _write(self, collection: List[str], pids: Dict[int, str]) -> None:
+        os.makedirs(self.index_path, exist_ok=True)
+        with open(os.path.join(self.index_path, "collection.json"), "w") as f:
+            json.dump(collection, f)
+        with open(os.path.join(self.index_path, "pid_docid_map.json"), "w") as f:
+            json.dump({str(pid): doc for pid, doc in pids.items()}, f)
+
+    def index(self, collection, index_name, document_ids, document_splitter_fn, **kwargs) -> str:
+        chunks = document_splitter_fn(collection, document_ids)
+        self._write([c["content"] for c in chunks], {i: c["document_id"] for i, c in enumerate(chunks)})
+        return self.index_path
+
+    def delete_from_index(self, document_ids, index_name) -> None:
+        self.events.append(f"delete {','.join(sorted(document_ids))}")
+        collection, pids = self._read()
+        keep = [(content, pids[pid]) for pid, content in enumerate(collection) if pids[pid] not in document_ids]
+        self._write([content for content, _ in keep], {pid: doc for pid, (_, doc) in enumerate(keep)})
+
+    def add_to_index(self, index_name, new_collection, new_document_ids, document_splitter_fn, **kwargs) -> None:
+        self.events.append(f"add {','.join(sorted(new_document_ids))}")
+        collection, pids = self._read()
+        for chunk in document_splitter_fn(new_collection, new_document_ids):
+            pids[len(collection)] = chunk["document_id"]
+            collection.append(chunk["content"])
+        self._write(collection, pids)
+
+def collections(files: Dict[str, str]) -> Any:
+    documents, document_ids, metadatas = [], [], []
+    for path, text in files.items():
+        documents.append(text)
+        document_ids.append(path)
+        metadatas.append({"path": path, "language": "PYTHON", "md5_hash": hashlib.md5(text.encode()).hexdigest()})
+    return {"PYTHON": (documents, document_ids, metadatas)}
+
+@pytest.fixture
+def fake_rag(tmp_path, monkeypatch):
+    # Indexes with FakeRAG under tmp_path, the indexer still imports ragatouille
+    indexer = pytest.importorskip("colbert_rag.indexer.git_repo")
+    monkeypatch.setattr(indexer, "RAGATOUILLE_PATH", str(tmp_path))
+    monkeypatch.setattr(indexer, "RAGPretrainedModel", FakeRAG)
+    FakeRAG.index_path = str(tmp_path / "repo")
+    FakeRAG.events = []
+    return FakeRAG
+
+def indexed(fake_rag) -> Dict[str, List[str]]:
+    collection, pids = fake_rag()._read()
+    documents: Dict[str, List[str]] = {}
+    for pid, content in enumerate(collection):
+        documents.setdefault(pids[pid], []).append(content)
+    return documents
@@ -0,0 +1,69 @@
+from typing import List, Optional
+import pytest
+from colbert_rag.metrics import REGISTRY
+from colbert_rag.server.batching import MicroBatcher
+from colbert_rag.server.filters import MetadataFilter
+
+class UnknownIndex(KeyError):
+    pass
+
+def fake_search_batch(calls: List[List[str]]):
+    def search_batch(queries: List[str], ks: List[int], indexes: List[str],
+                     metadata_filters: List[Optional[MetadataFilter]]):
+        calls.append(list(queries))
+        if indexes[0] == "missing":
+            raise UnknownIndex(indexes[0])
+        return [[{"content": f"{query}@{index or 'default'}", "k": k}] for query, k, index in zip(queries, ks, indexes)]
+    return search_batch
+
+def test_unknown_index_only_fails_its_own_requests(caplog):
+    calls: List[List[str]] = []
+    batcher = MicroBatcher(fake_search_batch(calls), max_batch_size=8, max_wait_ms=200, client_errors=(UnknownIndex,))
+    try:
+        good = batcher.submit("good", 3)
+        bad = batcher.submit("bad", 3, index="missing")
+        assert good.result(timeout=5) == [{"content": "good@default", "k": 3}]
+        with pytest.raises(UnknownIndex):
+            bad.result(timeout=5)
+    finally:
+        batcher.close()
+    assert batcher.metrics.snapshot()["batches"] == 1
+    assert sorted(calls) == [["bad"], ["good"]]
+    assert not [record for record in caplog.records if record.levelname == "ERROR"]
+
+def test_same_group_is_searched_together():
+    calls: List[List[str]] = []
+    batcher = MicroBatcher(fake_search_batch(calls), max_batch_size=3, max_wait_ms=200)
+    try:
+        futures = [batcher.submit(query, 5) for query in ("a", "b", "c")]
+        assert [future.result(timeout=5)[0]["content"] for future in futures] == ["a@default", "b@default", "c@default"]
+    finally:
+        batcher.close()
+    assert calls == [["a", "b", "c"]]
+
+def test_server_errors_are_logged(caplog):
+    def failing(*args):
+        raise RuntimeError("out of memory")
+    batcher = MicroBatcher(failing, max_batch_size=2, max_wait_ms=1)
+    try:
+        with pytest.raises(RuntimeError):
+            batcher.search("query", 1)
+    finally:
+        batcher.close()
+    assert any("out of memory" in record.getMessage() for record in caplog.records if record.levelname == "ERROR")
+
+def waited_requests() -> int:
+    for line in REGISTRY.render(["colbertrag_batch_wait_seconds"]).splitlines():
+        if line.startswith("colbertrag_batch_wait_seconds_count"):
+            return int(line.split()[-1])
+    return 0
+
+def test_wait_time_is_exported():
+    before = waited_requests()
+    batcher = MicroBatcher(fake_search_batch([]), max_batch_size=2, max_wait_ms=1)
+    try:
+        batcher.search("a", 1)
+        batcher.search("b", 1)
+    finally:
+        batcher.close()
+    assert waited_requests() == before + 2
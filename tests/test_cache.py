@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+from colbert_rag.server import cache
+from colbert_rag.server.cache import LRUCache, normalize_query
+
+def test_least_recently_used_entry_is_evicted():
+    lru: LRUCache[int] = LRUCache(2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c"), len(lru)) == (1, 3, 2)
+    assert lru.stats() == {"size": 2, "max_size": 2, "hits": 3, "misses": 1, "hit_ratio": 0.75}
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    lru: LRUCache[int] = LRUCache(10, ttl=5)
+    lru.put("a", 1)
+    now[0] += 5
+    assert lru.get("a") == 1
+    now[0] += 0.1
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+def test_queries_that_differ_in_whitespace_share_an_entry():
+    assert normalize_query("  find   the\tparser\n") == "find the parser"
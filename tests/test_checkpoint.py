@@ -0,0 +1,85 @@
+import os
+import pytest
+from colbert_rag.indexer.checkpoint import IndexCheckpoint
+from tests.conftest import collections, indexed
+
+ARGUMENTS = {"repo_name": "repo", "max_document_length": 256}
+
+def test_state_is_kept_for_the_same_arguments(tmp_path):
+    checkpoint = IndexCheckpoint(str(tmp_path), ARGUMENTS)
+    checkpoint.append_collections(collections({"a.py": "A = 1\n"}), {"bad.py": "UnicodeError"})
+    checkpoint.mark("collect")
+
+    resumed = IndexCheckpoint(str(tmp_path), ARGUMENTS)
+    assert resumed.done("collect") and not resumed.done("encode")
+    assert resumed.load_collections() == collections({"a.py": "A = 1\n"})
+    # Quarantined files are not read again either
+    assert resumed.collected() == {"a.py", "bad.py"}
+
+    discarded = IndexCheckpoint(str(tmp_path), {**ARGUMENTS, "max_document_length": 512})
+    assert not discarded.done("collect")
+    assert discarded.load_collections() == {}
+
+def test_a_truncated_record_is_read_again(tmp_path):
+    checkpoint = IndexCheckpoint(str(tmp_path), ARGUMENTS)
+    checkpoint.append_collections(collections({"a.py": "A = 1\n", "b.py": "B = 2\n"}), {})
+    with open(os.path.join(checkpoint.path, "collections.jsonl"), "a") as f:
+        f.write('{"language": "PYTHON", "id": "c.py", "meta')
+    assert checkpoint.collected() == {"a.py", "b.py"}
+
+    # The resumed build appends after the last complete record
+    resumed = IndexCheckpoint(str(tmp_path), ARGUMENTS)
+    resumed.append_collections(collections({"c.py": "C = 3\n"}), {})
+    assert resumed.collected() == {"a.py", "b.py", "c.py"}
+    assert resumed.load_collections() == collections({"a.py": "A = 1\n", "b.py": "B = 2\n", "c.py": "C = 3\n"})
+
+def test_chunks_of_an_unfinished_language_are_split_again(tmp_path):
+    checkpoint = IndexCheckpoint(str(tmp_path), ARGUMENTS)
+    checkpoint.start_chunks("PYTHON")
+    checkpoint.append_chunks("PYTHON", [{"document_id": "a.py", "content": "A = 1"}])
+    checkpoint.mark_chunked("PYTHON")
+    checkpoint.start_chunks("GO")
+    checkpoint.append_chunks("GO", [{"document_id": "a.go", "content": "package a"}])
+
+    resumed = IndexCheckpoint(str(tmp_path), ARGUMENTS)
+    assert resumed.chunked("PYTHON") and not resumed.chunked("GO")
+    assert resumed.load_chunks("PYTHON") == [{"document_id": "a.py", "content": "A = 1"}]
+    resumed.start_chunks("GO")
+    assert resumed.load_chunks("GO") == []
+    resumed.clear()
+    assert not os.path.exists(resumed.path)
+
+FILES = {
+    "src/a.py": "def a():\n    return 1\n",
+    "src/b.py": "class B:\n    pass\n",
+}
+
+def test_an_interrupted_build_resumes(fake_rag, tmp_path, monkeypatch):
+    indexer = pytest.importorskip("colbert_rag.indexer.git_repo")
+    repo = tmp_path / "source"
+    for path, text in FILES.items():
+        os.makedirs(repo / os.path.dirname(path), exist_ok=True)
+        (repo / path).write_text(text)
+
+    index = fake_rag.index
+    overwrites = []
+
+    def interrupted(self, *args, overwrite_index, **kwargs):
+        overwrites.append(overwrite_index)
+        if len(overwrites) == 1:
+            raise KeyboardInterrupt
+        return index(self, *args, **kwargs)
+    monkeypatch.setattr(fake_rag, "index", interrupted)
+
+    with pytest.raises(KeyboardInterrupt):
+        indexer.index_git_repo("model", "repo", str(repo), chunk_workers=0, checkpoint=True)
+    checkpoint_path = os.path.join(fake_rag.index_path, "colbertrag_checkpoint")
+    assert os.path.isdir(checkpoint_path)
+
+    # The files were collected and chunked before the interruption, only the encoding is run again
+    monkeypatch.setattr(indexer, "iter_collections", lambda *args, **kwargs: pytest.fail("collected again"))
+    monkeypatch.setattr(indexer, "iter_chunks", lambda *args, **kwargs: pytest.fail("chunked again"))
+    assert indexer.index_git_repo("model", "repo", str(repo), chunk_workers=0, checkpoint=True) == fake_rag.index_path
+    assert overwrites == [True, "resume"]
+    assert sorted(indexed(fake_rag)) == ["src/a.py", "src/b.py"]
+    assert not os.path.exists(checkpoint_path)
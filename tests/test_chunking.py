@@ -0,0 +1,25 @@
+from colbert_rag.indexer.chunking import chunk_collections, iter_chunks, precomputed_splitter
+from tests.conftest import collections
+
+FILES = {f"src/m{i}.py": "".join(f"def f{j}():\n    return {j}\n\n" for j in range(i * 3 + 1)) for i in range(20)}
+
+def test_process_pool_matches_in_process_chunking():
+    expected = chunk_collections(collections(FILES), 40, max_workers=0)
+    assert chunk_collections(collections(FILES), 40, max_workers=2) == expected
+    assert {chunk["document_id"] for chunk in expected["PYTHON"]} == set(FILES)
+    assert all(len(chunk["content"]) <= 40 for chunk in expected["PYTHON"])
+
+def test_iter_chunks_keeps_submission_order():
+    batches = [collections(dict(list(FILES.items())[start:start + 5])) for start in range(0, 20, 5)]
+    streamed = [chunk["document_id"] for _, chunks in iter_chunks(batches, 40, batch_size=2, max_workers=2,
+                                                                  max_pending=1) for chunk in chunks]
+    assert list(dict.fromkeys(streamed)) == list(FILES)
+
+def test_languages_are_selected():
+    assert chunk_collections(collections(FILES), 40, languages=["GO"], max_workers=0) == {}
+
+def test_precomputed_splitter_hands_back_the_chunks():
+    chunks = chunk_collections(collections(FILES), 40, max_workers=0)["PYTHON"]
+    splitter = precomputed_splitter(chunks)
+    assert splitter(["ignored"], ["src/m1.py"]) == [chunk for chunk in chunks if chunk["document_id"] == "src/m1.py"]
+    assert splitter(list(FILES.values()), list(FILES)) == chunks
@@ -0,0 +1,99 @@
+import os
+import shutil
+import subprocess
+from typing import Dict
+import pytest
+from colbert_rag.data import git_repo
+from colbert_rag.data.filters import FileFilter
+from colbert_rag.data.git_repo import Collections, diff_commits, get_collections, iter_collections, resolve_commit
+
+FILES = {
+    "src/app.py": "def main():\n    return 1\n",
+    "src/util.go": "package util\n",
+    "docs/index.md": "# Docs\n",
+    "poetry.lock": "[[package]]\n",
+    "logo.png": "\x00\x01PNG",
+}
+
+def write_files(root: str, files: Dict[str, str]) -> None:
+    for path, text in files.items():
+        os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(root, path), "w") as f:
+            f.write(text)
+
+def documents(collections: Collections) -> Dict[str, str]:
+    return {document_id: lang for lang, (_, document_ids, _) in collections.items() for document_id in document_ids}
+
+def git(root: str, *args: str) -> str:
+    return subprocess.run(["git", "-C", root, "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+                          check=True, capture_output=True, text=True).stdout.strip()
+
+def test_streamed_collections_match(tmp_path):
+    write_files(str(tmp_path), FILES)
+    expected = documents(get_collections(str(tmp_path)))
+    # Binary files are skipped, files without a supported language are kept as UNSUPPORTED
+    assert expected == {"src/app.py": "PYTHON", "src/util.go": "GO", "docs/index.md": "MARKDOWN",
+                        "poetry.lock": "UNSUPPORTED"}
+
+    streamed: Dict[str, str] = {}
+    for batch in iter_collections(str(tmp_path), batch_size=2, max_workers=2):
+        streamed.update(documents(batch))
+    assert streamed == expected
+
+def test_file_filter_is_opt_in(tmp_path):
+    write_files(str(tmp_path), FILES)
+    assert "poetry.lock" in documents(get_collections(str(tmp_path)))
+    assert "poetry.lock" not in documents(get_collections(str(tmp_path), file_filter=FileFilter()))
+
+def test_unreadable_files_are_quarantined(tmp_path, monkeypatch):
+    write_files(str(tmp_path), FILES)
+    detect_language = git_repo.detect_language
+
+    def failing(file_path, read_sample):
+        if file_path.endswith("util.go"):
+            raise UnicodeError("bad sample")
+        return detect_language(file_path, read_sample)
+    monkeypatch.setattr(git_repo, "detect_language", failing)
+
+    quarantine: Dict[str, str] = {}
+    collected = documents(get_collections(str(tmp_path), quarantine=quarantine))
+    assert "src/util.go" not in collected and "src/app.py" in collected
+    assert quarantine == {"src/util.go": "UnicodeError: bad sample"}
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="needs the git binary")
+def test_revisions_are_read_from_git_objects(tmp_path):
+    root = str(tmp_path)
+    write_files(root, FILES)
+    git(root, "init", "-q")
+    git(root, "add", ".")
+    git(root, "commit", "-q", "-m", "first")
+    first = git(root, "rev-parse", "HEAD")
+    write_files(root, {"src/app.py": "def main():\n    return 2\n", "src/new.py": "X = 1\n"})
+    os.remove(os.path.join(root, "docs/index.md"))
+    git(root, "add", "-A")
+    git(root, "commit", "-q", "-m", "second")
+
+    # A working tree is read from disk, unless a revision is asked for
+    assert resolve_commit(root) is None
+    assert resolve_commit(root, first) == first
+    old = get_collections(root, revision=first)
+    assert "docs/index.md" in documents(old) and "src/new.py" not in documents(old)
+    assert old["PYTHON"][0] == ["def main():\n    return 1\n"]
+
+    assert diff_commits(root, first) == (["src/app.py", "src/new.py"], ["docs/index.md"])
+    changed = get_collections(root, revision="HEAD", paths=["src/app.py", "src/new.py"])
+    assert sorted(documents(changed)) == ["src/app.py", "src/new.py"]
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="needs the git binary")
+def test_ignored_files_of_a_working_tree_are_skipped(tmp_path):
+    root = str(tmp_path)
+    write_files(root, {**FILES, ".gitignore": "build/\n*.log\n"})
+    git(root, "init", "-q")
+    git(root, "add", ".")
+    git(root, "commit", "-q", "-m", "first")
+    # Untracked files are read, ignored ones are not
+    write_files(root, {"src/new.py": "X = 1\n", "build/gen.py": "Y = 2\n", "debug.log": "error\n"})
+    os.remove(os.path.join(root, "docs/index.md"))
+    collected = documents(get_collections(root))
+    assert "src/new.py" in collected and "src/app.py" in collected
+    assert not {"build/gen.py", "debug.log", "docs/index.md"} & set(collected)
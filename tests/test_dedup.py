@@ -0,0 +1,63 @@
+from colbert_rag.duplicates import Duplicates, passage_key
+from colbert_rag.indexer.dedup import Dedup, MinHashLSH, dedup_chunks, dedup_files
+from tests.conftest import collections
+
+def test_the_shallowest_copy_of_a_file_is_kept():
+    files = {"vendor/lib/a.py": "A = 1\n", "src/a.py": "A = 1\n", "b.py": "B = 2\n"}
+    duplicates = Duplicates()
+    kept = dedup_files(collections(files), ["PYTHON"], duplicates)
+    assert kept["PYTHON"][1] == ["src/a.py", "b.py"]
+    assert duplicates.documents == {"src/a.py": ["vendor/lib/a.py"]}
+    assert duplicates.copies() == ["vendor/lib/a.py"]
+
+def test_a_copy_already_in_the_index_stays_the_survivor():
+    files = {"vendor/a.py": "A = 1\n", "a.py": "A = 1\n"}
+    indexed = {collections(files)["PYTHON"][2][0]["md5_hash"]: "vendor/a.py"}
+    duplicates = Duplicates()
+    kept = dedup_files(collections(files), ["PYTHON"], duplicates, indexed)
+    assert kept["PYTHON"][1] == ["vendor/a.py"]
+    assert duplicates.documents == {"vendor/a.py": ["a.py"]}
+
+def test_passages_are_collapsed_across_files():
+    chunks = [
+        {"document_id": "src/b.py", "content": "def f():\n    return 1"},
+        {"document_id": "a.py", "content": "def f():\n  return 1"},
+        {"document_id": "a.py", "content": "def g():\n    return 2"},
+    ]
+    duplicates = Duplicates()
+    kept = dedup_chunks(chunks, duplicates, Dedup())
+    # Whitespace is not significant, and the copy in the shallower file is kept
+    assert kept == chunks[1:]
+    assert duplicates.passages == {passage_key(chunks[0]["content"]): ["a.py", "src/b.py"]}
+    assert duplicates.locations("a.py", "def f():\n    return 1") == ["src/b.py"]
+    assert duplicates.locations("a.py", "def g():\n    return 2") == []
+
+def test_near_duplicate_passages():
+    words = " ".join(f"word{i}" for i in range(60))
+    chunks = [
+        {"document_id": "a.py", "content": words},
+        {"document_id": "b.py", "content": words + " extra"},
+        {"document_id": "c.py", "content": " ".join(f"other{i}" for i in range(60))},
+    ]
+    assert dedup_chunks(chunks, Duplicates(), Dedup()) == chunks
+    duplicates = Duplicates()
+    assert dedup_chunks(chunks, duplicates, Dedup(near_threshold=0.8)) == [chunks[0], chunks[2]]
+    assert list(duplicates.passages.values()) == [["a.py", "b.py"]]
+
+    lsh = MinHashLSH(0.8)
+    assert lsh.similarity(lsh.signature(words), lsh.signature(words)) == 1.0
+    assert lsh.similarity(lsh.signature(words), lsh.signature(chunks[2]["content"])) < 0.2
+
+def test_removing_a_survivor_orphans_its_copies(tmp_path):
+    duplicates = Duplicates()
+    duplicates.add_document("a.py", ["vendor/a.py", "lib/a.py"])
+    duplicates.add_passage("key", "b.py", ["c.py"])
+    assert duplicates.orphans(["a.py", "b.py"]) == ["c.py", "lib/a.py", "vendor/a.py"]
+    assert duplicates.orphans(["vendor/a.py"]) == []
+
+    duplicates.remove(["b.py"], reindexed=["vendor/a.py"])
+    assert duplicates.documents == {"a.py": ["lib/a.py"]}
+    assert duplicates.passages == {}
+    duplicates.save(str(tmp_path))
+    assert Duplicates.load(str(tmp_path)) == duplicates
+    assert Duplicates.load(str(tmp_path / "missing")).empty()
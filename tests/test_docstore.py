@@ -0,0 +1,48 @@
+import json
+import multiprocessing
+import os
+from typing import Dict, List
+from colbert_rag.docstore import LOCK_FILENAME, open_document_store, store_is_current
+
+def write_index(index_path: str) -> None:
+    collection = [f"def f{i}():\n    return {i}" for i in range(50)]
+    pid_docid_map = {str(pid): f"src/m{pid // 5}.py" for pid in range(len(collection))}
+    metadata = {f"src/m{i}.py": {"path": f"src/m{i}.py", "language": "PYTHON", "extension": ".py"} for i in range(10)}
+    for name, data in (("collection.json", collection), ("pid_docid_map.json", pid_docid_map),
+                       ("docid_metadata_map.json", metadata)):
+        with open(os.path.join(index_path, name), "w") as f:
+            json.dump(data, f)
+
+def read_store(index_path: str) -> Dict[str, List[str]]:
+    store = open_document_store(index_path)
+    return {
+        "passages": [store.passages[pid] for pid in (0, 49)],
+        "documents": [store.pid_docid_map[pid] for pid in (0, 49)],
+        "languages": [store.docid_metadata_map["src/m9.py"]["language"]] if store.docid_metadata_map else [],
+    }
+
+def test_store_round_trip(tmp_path):
+    write_index(str(tmp_path))
+    assert read_store(str(tmp_path)) == {
+        "passages": ["def f0():\n    return 0", "def f49():\n    return 49"],
+        "documents": ["src/m0.py", "src/m9.py"],
+        "languages": ["PYTHON"],
+    }
+    assert store_is_current(str(tmp_path))
+    assert os.path.exists(tmp_path / LOCK_FILENAME)
+    # The metadata map is a Mapping like the dict it replaces
+    metadata_map = open_document_store(str(tmp_path)).docid_metadata_map
+    assert metadata_map is not None
+    assert list(metadata_map.values())[0] == {"path": "src/m0.py", "language": "PYTHON", "extension": ".py"}
+
+def test_workers_opening_a_stale_store_together(tmp_path):
+    write_index(str(tmp_path))
+    expected = {
+        "passages": ["def f0():\n    return 0", "def f49():\n    return 49"],
+        "documents": ["src/m0.py", "src/m9.py"],
+        "languages": ["PYTHON"],
+    }
+    with multiprocessing.get_context("spawn").Pool(4) as pool:
+        results = pool.map(read_store, [str(tmp_path)] * 8)
+    assert results == [expected] * 8
+    assert store_is_current(str(tmp_path))
@@ -0,0 +1,34 @@
+from colbert_rag.data.filters import (GENERATED, LINE_LENGTH, MINIFIED, SIZE, VENDORED, FileFilter, _attributes,
+                                      parse_gitattributes)
+
+def test_gitattributes_override_the_defaults():
+    rules = parse_gitattributes(
+        "# comment\n"
+        "*.lock -linguist-generated\n"
+        "gen/ linguist-generated\n"
+        "vendor/** linguist-vendored=false\n"
+        "*.py text eol=lf\n")
+    assert rules == [("*.lock", {"linguist-generated": False}), ("gen/", {"linguist-generated": True}),
+                     ("vendor/**", {"linguist-vendored": False})]
+    assert _attributes(rules, "src/gen/api.py") == {"linguist-generated": True}
+    assert _attributes(rules, "poetry.lock") == {"linguist-generated": False}
+
+    file_filter = FileFilter()
+    assert file_filter.check_path("poetry.lock", []) == GENERATED
+    assert file_filter.check_path("poetry.lock", rules) is None
+    assert file_filter.check_path("vendor/lib.py", []) == VENDORED
+    assert file_filter.check_path("vendor/lib.py", rules) is None
+    assert file_filter.check_path("src/app.py", []) is None
+
+def test_file_filter_checks():
+    file_filter = FileFilter(max_file_size=100, max_line_length=50, max_average_line_length=20)
+    assert file_filter.check_size(101) == SIZE
+    assert file_filter.check_size(100) is None
+    assert file_filter.check_content(b"# Code generated by protoc. DO NOT EDIT.\nx = 1\n") == GENERATED
+    # Only the first lines are searched for markers
+    assert file_filter.check_content(b"x = 1\n" * 10 + b"# this file was generated\n") is None
+    assert file_filter.check_content(b"x = '" + b"a" * 60 + b"'\n") == LINE_LENGTH
+    # The last line of a sample may be cut off, so it is not held against the file
+    assert file_filter.check_content(b"x = 1\n" + b"a" * 60) == MINIFIED
+    assert file_filter.check_content(b"def f():\n    return 1\n") is None
+    assert FileFilter(max_file_size=None).check_size(10 ** 12) is None
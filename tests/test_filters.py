@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+from colbert_rag.server.filters import FilterIndex, MetadataFilter
+
+def test_metadata_filter_is_normalized():
+    assert MetadataFilter.create(["python", "PYTHON", "go"], ["src/"], ["PY", ".py", ""]) == \
+        MetadataFilter(("GO", "PYTHON"), ("src/",), (".py",))
+    # Filters that differ only in case, order or repeats share a cache key
+    assert MetadataFilter.create(["go", "python"]) == MetadataFilter.create(["Python", "GO", "go"])
+    assert MetadataFilter.create([], [""], []) is None
+
+def colbert(documents):
+    # The metadata ragatouille keeps for an index loaded without a document store
+    return SimpleNamespace(
+        store=None,
+        docid_pid_map={document_id: pids for document_id, (pids, _) in documents.items()},
+        docid_metadata_map={document_id: metadata for document_id, (_, metadata) in documents.items()})
+
+INDEX = colbert({
+    "src/app.py": ([0, 1], {"path": "src/app.py", "language": "PYTHON", "extension": ".py"}),
+    "src/util/io.go": ([2], {"path": "src/util/io.go", "language": "GO", "extension": ".go"}),
+    "docs/setup.py": ([3, 4], {"path": "docs/setup.py", "language": "PYTHON", "extension": ".py"}),
+    "README": ([5], {}),
+})
+
+def test_filter_index_combines_fields():
+    index = FilterIndex(INDEX)
+    assert index.pids(MetadataFilter.create(["python"])) == [0, 1, 3, 4]
+    assert index.pids(MetadataFilter.create(["python", "go"], ["src/"])) == [0, 1, 2]
+    assert index.pids(MetadataFilter.create(extensions=["go"])) == [2]
+    assert index.pids(MetadataFilter.create(["go"], extensions=["py"])) == []
+
+def test_filter_index_paths():
+    index = FilterIndex(INDEX)
+    # A trailing slash is a directory prefix, anything else a glob over the whole path
+    assert index.pids(MetadataFilter.create(paths=["src/"])) == [0, 1, 2]
+    assert index.pids(MetadataFilter.create(paths=["*/setup.py"])) == [3, 4]
+    assert index.pids(MetadataFilter.create(paths=["src"])) == []
+    assert index.pids(MetadataFilter.create(paths=["README"])) == [5]
+
+def test_filter_index_caches_pids():
+    index = FilterIndex(INDEX)
+    metadata_filter = MetadataFilter.create(["python"])
+    assert index.pids(metadata_filter) is index.pids(metadata_filter)
+    assert index.cache.stats()["hits"] == 1
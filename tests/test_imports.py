@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+from typing import List
+import pytest
+import colbert_rag
+from benchmarks.imports import HEAVY_MODULES
+
+def loaded_modules(*modules: str) -> List[str]:
+    # In a fresh process, so nothing imported by other tests counts
+    code = (f"import sys\nimport {', '.join(modules)}\n"
+            f"print(__import__('json').dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    return json.loads(output)
+
+def test_clients_do_not_load_the_server_stack():
+    assert loaded_modules("colbert_rag", "colbert_rag.models") == []
+    # The generated gRPC stubs need grpc, nothing else
+    assert set(loaded_modules("colbert_rag.proto")) <= {"grpc"}
+
+def test_collections_do_not_load_the_model():
+    assert not {"torch", "ragatouille", "colbert"} & set(loaded_modules("colbert_rag.data.git_repo"))
+
+def test_exports_are_imported_on_first_use():
+    assert colbert_rag.Request.__module__ == "colbert_rag.models"
+    assert "Request" in dir(colbert_rag)
+    with pytest.raises(AttributeError):
+        colbert_rag.NotAnExport
@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("ragatouille")
+import colbert_rag.indexer.git_repo as indexer
+from colbert_rag.indexer.dedup import Dedup
+from colbert_rag.indexer.manifest import load_manifest
+from tests.conftest import collections, indexed
+
+FILES = {
+    "src/a.py": "def a():\n    return 1\n",
+    "src/b.py": "class B:\n    pass\n",
+    "src/c.py": "X = 3\n",
+}
+
+def test_incremental_update_deletes_and_reindexes_changed_files(fake_rag, monkeypatch):
+    indexer.index_collections("model", "repo", collections(FILES), chunk_workers=0)
+    prepare = indexer._prepare
+    monkeypatch.setattr(indexer, "_prepare", lambda *args: fake_rag.events.append("chunk") or prepare(*args))
+    changed = {"src/a.py": FILES["src/a.py"], "src/b.py": "class B:\n    x = 2\n", "src/d.py": "Y = 4\n"}
+    indexer.index_collections("model", "repo", collections(changed), chunk_workers=0, incremental=True)
+
+    # Chunk workers are started before the model loads torch
+    assert fake_rag.events == ["chunk", "load", "delete src/b.py,src/c.py", "add src/b.py,src/d.py"]
+    assert sorted(indexed(fake_rag)) == ["src/a.py", "src/b.py", "src/d.py"]
+    assert indexed(fake_rag)["src/b.py"] == ["class B:\n    x = 2"]
+    assert sorted(load_manifest(fake_rag.index_path)) == ["src/a.py", "src/b.py", "src/d.py"]
+
+def test_unchanged_collection_does_not_load_the_model(fake_rag):
+    indexer.index_collections("model", "repo", collections(FILES), chunk_workers=0)
+    indexer.index_collections("model", "repo", collections(FILES), chunk_workers=0, incremental=True)
+    assert fake_rag.events == []
+
+def test_deleting_an_indexed_copy_reindexes_its_duplicate(fake_rag):
+    files = {**FILES, "vendor/a.py": FILES["src/a.py"]}
+    indexer.index_collections("model", "repo", collections(files), chunk_workers=0, dedup=Dedup())
+    assert sorted(indexed(fake_rag)) == ["src/a.py", "src/b.py", "src/c.py"]
+
+    del files["src/a.py"]
+    indexer.index_collections("model", "repo", collections(files), chunk_workers=0, dedup=Dedup(), incremental=True)
+    # The copy that was only recorded is removed too, ragatouille ignores ids it does not have
+    assert fake_rag.events == ["load", "delete src/a.py,vendor/a.py", "add vendor/a.py"]
+    assert sorted(indexed(fake_rag)) == ["src/b.py", "src/c.py", "vendor/a.py"]
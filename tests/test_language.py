@@ -0,0 +1,42 @@
+import pytest
+from colbert_rag.data import language
+from colbert_rag.data.language import detect_language, is_binary
+
+SAMPLES = {
+    "a.py": "import os\n",
+    "a.js": "const x = 1;\n",
+    "a.ts": "let x: number = 1;\n",
+    "a.go": "package main\n",
+    "a.rs": "fn main() {}\n",
+    "a.java": "class A {}\n",
+    "a.kt": "fun main() {}\n",
+    "a.cs": "class A {}\n",
+    "a.cpp": "int main() {}\n",
+    "a.h": "int f();\n",
+    "a.rb": "puts 1\n",
+    "a.php": "<?php echo 1; ?>\n",
+    "a.html": "<html></html>\n",
+    "a.proto": 'syntax = "proto3";\n',
+    "README.md": "# Title\n",
+    "Makefile": "all:\n\techo hi\n",
+    "Dockerfile": "FROM python\n",
+    "notes.txt": "hello\n",
+    "a.unknownext": "zzz\n",
+}
+
+@pytest.mark.parametrize("path", sorted(SAMPLES))
+def test_detection_matches_the_pygments_guess(path):
+    # The extension table only short-cuts the lexer guess, it must not change the language
+    sample = SAMPLES[path]
+    assert detect_language(path, lambda: sample) == language._guess(path, sample)
+
+def test_unambiguous_extensions_do_not_read_the_file():
+    def read_sample() -> str:
+        raise AssertionError("read")
+    assert detect_language("src/app.py", read_sample) == "PYTHON"
+    assert detect_language("src/main.go", read_sample) == "GO"
+
+def test_is_binary():
+    assert is_binary(b"\x00\x01\x02ELF")
+    assert not is_binary("def f():\n    return 'é'\n".encode())
+    assert not is_binary(b"")
@@ -0,0 +1,17 @@
+import json
+import logging
+import pytest
+
+loader = pytest.importorskip("colbert_rag.server.loader")
+
+def write_metadata(index_path, num_chunks: int) -> None:
+    with open(index_path / "metadata.json", "w") as f:
+        json.dump({"num_chunks": num_chunks}, f)
+
+def test_indexes_with_several_chunks_are_loaded_without_mmap(tmp_path, caplog):
+    write_metadata(tmp_path, 1)
+    assert loader._can_mmap(str(tmp_path))
+    write_metadata(tmp_path, 3)
+    with caplog.at_level(logging.WARNING):
+        assert not loader._can_mmap(str(tmp_path))
+    assert "3 chunks" in caplog.text
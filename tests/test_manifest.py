@@ -0,0 +1,26 @@
+from colbert_rag.indexer.manifest import (build_manifest, diff_manifest, load_manifest, load_manifest_commit,
+                                          save_manifest, update_manifest)
+from tests.conftest import collections
+
+def test_diff_manifest():
+    previous = {"a.py": "1", "b.py": "2", "c.py": "3"}
+    diff = diff_manifest(previous, {"a.py": "1", "b.py": "changed", "d.py": "4"})
+    assert (diff.added, diff.changed, diff.deleted, diff.unchanged) == (["d.py"], ["b.py"], ["c.py"], ["a.py"])
+    # Changed files are removed and indexed again
+    assert diff.to_index == ["d.py", "b.py"]
+    assert diff.to_remove == ["b.py", "c.py"]
+
+def test_update_manifest_keeps_files_that_were_not_read():
+    previous = {"a.py": "1", "b.py": "2", "c.py": "3"}
+    # Only the files changed between two commits are read, c.py was deleted
+    changed = collections({"b.py": "new"})
+    current = update_manifest(previous, changed, ["PYTHON"], replaced=["b.py", "c.py"])
+    assert current == {"a.py": "1", "b.py": build_manifest(changed, ["PYTHON"])["b.py"]}
+
+def test_manifest_round_trip(tmp_path):
+    assert load_manifest(str(tmp_path)) is None
+    save_manifest(str(tmp_path), {"a.py": "1"})
+    assert load_manifest(str(tmp_path)) == {"a.py": "1"}
+    assert load_manifest_commit(str(tmp_path)) is None
+    save_manifest(str(tmp_path), {"a.py": "2"}, commit="abc123")
+    assert load_manifest_commit(str(tmp_path)) == "abc123"
@@ -0,0 +1,32 @@
+import pytest
+from colbert_rag.metrics import (
+    CHUNKS, INDEX_METRICS_FILENAME, Counter, Histogram, Registry, _Metric, write_index_metrics
+)
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        _Metric("colbertrag_test", "Abstract")  # type: ignore[abstract]
+
+def test_registry_renders_text_format():
+    registry = Registry()
+    counter = Counter("colbertrag_test_total", "Test counter", ["kind"])
+    histogram = Histogram("colbertrag_test_seconds", "Test histogram", buckets=(0.1, 1.0))
+    registry.register(counter)
+    registry.register(histogram)
+    counter.inc(2, kind="a")
+    histogram.observe(0.5)
+    lines = registry.render().splitlines()
+    assert "# TYPE colbertrag_test_total counter" in lines
+    assert 'colbertrag_test_total{kind="a"} 2.0' in lines
+    assert 'colbertrag_test_seconds_bucket{le="0.1"} 0' in lines
+    assert 'colbertrag_test_seconds_bucket{le="1.0"} 1' in lines
+    assert registry.render(["colbertrag_test_total"]).count("# TYPE") == 1
+
+def test_index_metrics_are_written_next_to_the_index(tmp_path):
+    CHUNKS.inc(3, language="PYTHON")
+    path = write_index_metrics(str(tmp_path))
+    assert path == str(tmp_path / INDEX_METRICS_FILENAME)
+    content = (tmp_path / INDEX_METRICS_FILENAME).read_text()
+    assert "# TYPE colbertrag_index_chunks_total counter" in content
+    assert 'colbertrag_index_chunks_total{language="PYTHON"}' in content
+    assert "colbertrag_requests_total" not in content
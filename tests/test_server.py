@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+from typing import List
+import pytest
+
+pytest.importorskip("ragatouille")
+from colbert_rag.models import BatchRequest, Filter, Request
+from colbert_rag.server.base import BaseServer
+from colbert_rag.server.filters import MetadataFilter
+from colbert_rag.server.indexes import IndexNotFoundError, IndexPool
+
+class FakeModel:
+    # Answers like RAGPretrainedModel.search, a list of hits per query when given several
+    def __init__(self, index_path: str):
+        self.model = SimpleNamespace(index_path=index_path)
+        self.calls: List[List[str]] = []
+
+    def search(self, query, k):
+        queries = [query] if isinstance(query, str) else query
+        self.calls.append(list(queries))
+        hits = [[{"content": f"{q}#{rank}", "score": float(k - rank), "rank": rank, "document_id": "a.py",
+                  "document_metadata": {"path": "a.py"}} for rank in range(1, k + 1)] for q in queries]
+        return hits[0] if isinstance(query, str) else hits
+
+@pytest.fixture
+def model(tmp_path):
+    return FakeModel(str(tmp_path))
+
+def test_batch_requests_with_the_same_k_share_a_model_call(model):
+    server = BaseServer(model, cache_size=0, query_cache_size=0)
+    response = server.retrieve_batch(BatchRequest(requests=[
+        Request(query="a", k=2), Request(query="b", k=1), Request(query="c", k=2)]))
+    assert [[document.page_content for document in hits.documents] for hits in response.responses] == \
+        [["a#1", "a#2"], ["b#1"], ["c#1", "c#2"]]
+    assert model.calls == [["a", "c"], ["b"]]
+
+def test_cached_results_are_served_until_the_index_changes(model):
+    server = BaseServer(model, cache_size=8, query_cache_size=0)
+    first = server.retrieve(Request(query="find  parser", k=1))
+    assert server.retrieve(Request(query="find parser", k=1)) == first
+    assert model.calls == [["find  parser"]]
+    server.invalidate_cache()
+    server.retrieve(Request(query="find parser", k=1))
+    assert len(model.calls) == 2
+
+def test_an_unknown_index_does_not_fail_the_rest_of_the_batch(model, tmp_path):
+    server = BaseServer(model, max_batch_size=8, batch_wait_ms=200, cache_size=0, query_cache_size=0,
+                        indexes=IndexPool(str(tmp_path / "indexes")))
+    try:
+        good = server.batcher.submit("a", 1)
+        bad = server.batcher.submit("b", 1, index="missing")
+        assert good.result(timeout=5)[0]["content"] == "a#1"
+        with pytest.raises(IndexNotFoundError):
+            bad.result(timeout=5)
+    finally:
+        server.batcher.close()
+
+def test_request_filters_are_normalized():
+    assert BaseServer.to_filter(None) is None
+    assert BaseServer.to_filter(Filter()) is None
+    assert BaseServer.to_filter(Filter(languages=["python"], extensions=["PY"])) == \
+        MetadataFilter(("PYTHON",), (), (".py",))
+
+def test_the_default_index_is_reloaded_by_an_empty_name(tmp_path, monkeypatch):
+    from colbert_rag.server import indexes
+    (tmp_path / "main").mkdir()
+    (tmp_path / "main" / "metadata.json").write_text("{}")
+    monkeypatch.setattr(indexes, "load_model", lambda path, **kwargs: FakeModel(path))
+    pool = IndexPool(str(tmp_path), default_index="main")
+    first = pool.get("")
+    assert pool.reload("")
+    assert pool.get("main") is not first
+
+def test_reload_requests_need_admin(model, monkeypatch):
+    from fastapi.testclient import TestClient
+    from colbert_rag.server import reload
+    from colbert_rag.server.fastapi import FastAPIServer
+    from colbert_rag.server.reload import IndexReloader
+    monkeypatch.setattr(reload, "load_model", lambda path, **kwargs: FakeModel(path))
+    server = FastAPIServer(model, cache_size=0, query_cache_size=0)
+    # A reloader that only watches the index directory does not open the admin route
+    server.reloader = IndexReloader(server, model.model.index_path)
+    try:
+        assert TestClient(server.create_app()).post("/admin/reload", json={}).status_code == 404
+        server.reloader.admin = True
+        response = TestClient(server.create_app()).post("/admin/reload", json={})
+        assert response.json() == {"version": server.index_version} and server.index_version > 0
+    finally:
+        server.reloader.close()
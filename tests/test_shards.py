@@ -0,0 +1,86 @@
+import threading
+from typing import List
+import pytest
+from colbert_rag.shards import load_shards, save_shards, shard_name, shard_of, split_collections
+from tests.conftest import collections
+
+FILES = {f"src/m{i}.py": f"X = {i}\n" for i in range(40)}
+
+def test_files_are_split_by_path_hash():
+    shards = split_collections(collections(FILES), 4)
+    assert sorted(document_id for shard in shards for document_id in shard["PYTHON"][1]) == sorted(FILES)
+    for number, shard in enumerate(shards):
+        documents, document_ids, metadatas = shard["PYTHON"]
+        assert all(shard_of(document_id, 4) == number for document_id in document_ids)
+        assert [metadata["path"] for metadata in metadatas] == document_ids
+        assert documents == [FILES[document_id] for document_id in document_ids]
+    # The same file lands in the same shard on every build
+    assert split_collections(collections(FILES), 4) == shards
+
+def test_shards_file(tmp_path):
+    assert load_shards(str(tmp_path)) is None
+    names = [shard_name("repo", shard) for shard in range(2)]
+    save_shards(str(tmp_path), names)
+    assert load_shards(str(tmp_path)) == ["repo-shard0", "repo-shard1"]
+
+def result(document_id: str, score: float):
+    return {"content": document_id, "score": score, "rank": 0, "document_id": document_id, "document_metadata": {}}
+
+def test_merge_keeps_the_top_k_by_score():
+    shards = pytest.importorskip("colbert_rag.server.shards")
+    merged = shards.merge_results([
+        [result("a", 9.0), result("b", 5.0)],
+        [],
+        [result("c", 7.5), result("d", 6.0), result("e", 1.0)],
+    ], 3)
+    assert [(hit["document_id"], hit["rank"]) for hit in merged] == [("a", 1), ("c", 2), ("d", 3)]
+
+class FakeShard:
+    def __init__(self, scores: List[float], barrier: threading.Barrier):
+        self.scores = scores
+        self.barrier = barrier
+
+    def search(self, queries, k, metadata_filter=None):
+        # Every shard has to be searched at the same time for the barrier to open
+        self.barrier.wait(timeout=5)
+        return [[result(f"{query}:{score}", score) for score in self.scores[:k]] for query in queries]
+
+def test_sharded_search_fans_out_and_merges_each_query():
+    shards = pytest.importorskip("colbert_rag.server.shards")
+    barrier = threading.Barrier(2)
+    search = shards.ShardedSearch([FakeShard([3.0, 1.0], barrier), FakeShard([2.0, 0.5], barrier)])
+    results = search.search(["q1", "q2"], 2)
+    assert [[hit["document_id"] for hit in hits] for hits in results] == [["q1:3.0", "q1:2.0"], ["q2:3.0", "q2:2.0"]]
+
+class FakeQuerySearch:
+    def __init__(self, scores: List[float], encoded: List[List[str]]):
+        self.scores = scores
+        self.encoded = encoded
+
+    def encode(self, queries):
+        self.encoded.append(list(queries))
+        return [f"Q({query})" for query in queries]
+
+    def search(self, queries, k, metadata_filter=None, embeddings=None):
+        embeddings = embeddings if embeddings is not None else self.encode(queries)
+        return [[result(f"{Q}:{score}", score) for score in self.scores[:k]] for Q in embeddings]
+
+def test_local_shards_share_one_encoding():
+    shards = pytest.importorskip("colbert_rag.server.shards")
+    encoded: List[List[str]] = []
+    local = []
+    for scores in ([3.0, 1.0], [2.0, 0.5]):
+        # Without loading an index
+        shard = shards.LocalShard.__new__(shards.LocalShard)
+        shard.query_search = FakeQuerySearch(scores, encoded)
+        local.append(shard)
+    results = shards.ShardedSearch(local).search(["q1", "q2"], 2)
+    assert [[hit["document_id"] for hit in hits] for hits in results] == \
+        [["Q(q1):3.0", "Q(q1):2.0"], ["Q(q2):3.0", "Q(q2):2.0"]]
+    assert encoded == [["q1", "q2"]]
+
+def test_a_shard_server_that_exits_fails_the_start(tmp_path):
+    shards = pytest.importorskip("colbert_rag.server.shards")
+    # The shard process exits when it cannot load the missing index
+    with pytest.raises(RuntimeError, match="exited"):
+        shards.start_shard_servers([str(tmp_path / "missing")], "127.0.0.1", 50199, timeout=60)